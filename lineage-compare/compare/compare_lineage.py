@@ -4,17 +4,26 @@
 Lineage comparator: executes parity queries on Neo4j and TigerGraph,
 computes identical metrics from each backend's adjacency, writes CSV/MD/HTML,
 emits Prometheus metrics, and (optionally) publishes artifacts to S3/GCS.
+
+--mode sources (default) queries a subgraph per source for SOURCES_LIMIT
+sources; --mode snapshot pulls each backend's whole edge list once and checks
+every source (see lineage_snapshot.py). `compare_lineage.py benchmark ...`
+runs the workload benchmark instead (see lineage_bench.py).
 """
 from __future__ import annotations
-import os, argparse, time, json, math, datetime, sys
+import os, argparse, time, json, math, datetime, sys, threading, hashlib, glob
 from collections import defaultdict, deque
-from typing import Dict, Set, Tuple, Iterable, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set, Tuple, Iterable, Iterator, List
 import pandas as pd
+import pyarrow as pa, pyarrow.compute as pc
 from neo4j import GraphDatabase, Driver
 import pyTigerGraph as tg
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, push_to_gateway
 from publish import build_publisher_from_env, Artifact, PublishError
+import lineage_snapshot
+import lineage_bench
 
 # ---------------- Graph algorithms ----------------
 def bfs_metrics(adj: Dict[str, Set[str]], src: str, max_depth: int) -> Tuple[Set[str], Dict[str,int], int]:
@@ -65,34 +74,117 @@ def bounded_path_count(adj: Dict[str, Set[str]], src: str, sinks: Set[str], max_
             ways[v] += ways[u]
     return int(sum(ways[s] for s in sinks if s in ways))
 
+# ---------------- Rate limiting ----------------
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` calls/second with bursts of `burst`; rate <= 0 disables."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 # ---------------- Backend accessors ----------------
-def neo4j_get_edges(driver: Driver, src: str, max_depth: int) -> Dict[str, Set[str]]:
-    q = """
-    MATCH p=(s:Node {id:$SRC})-[:FLOWS_TO*..$D]->(t:Node)
-    WITH DISTINCT relationships(p) AS rels
-    UNWIND rels AS r
-    RETURN DISTINCT startNode(r).id AS src, endNode(r).id AS dst
+# Out-neighbours of a frontier in one round trip; OPTIONAL MATCH so every id comes back (sinks with [])
+NEO4J_FRONTIER = """
+UNWIND $ids AS id
+MATCH (u:Node {id:id})
+OPTIONAL MATCH (u)-[:FLOWS_TO]->(v:Node)
+RETURN id, collect(DISTINCT v.id) AS dsts
+"""
+
+# Every node reachable from each source, visited once (NODE_GLOBAL), filtered to those without outgoing FLOWS_TO
+NEO4J_SINKS = """
+UNWIND $ids AS sid
+MATCH (s:Node {id:sid})
+CALL apoc.path.subgraphNodes(s, {relationshipFilter: 'FLOWS_TO>', minLevel: 1}) YIELD node
+WITH sid, node WHERE NOT (node)-[:FLOWS_TO]->()
+RETURN sid, collect(node.id) AS sinks
+"""
+
+def neo4j_get_edges_multi(driver: Driver, srcs: List[str], max_depth: int, limiter: "RateLimiter" = None) -> Dict[str, Dict[str, Set[str]]]:
+    """Edges on paths of length <= max_depth from each source, each edge once.
+
+    Level-synchronous BFS: one round trip per level for the union of all
+    sources' frontiers, so a node shared by several sources (or reached by
+    many paths) is expanded once. An edge lies on such a path exactly when
+    its start is within max_depth - 1 hops, so every node's out-edges are
+    taken on the level it is first reached, up to max_depth - 1.
     """
-    with driver.session() as s:
-        rows = s.run(q, SRC=src, D=max_depth).data()
-    adj: Dict[str, Set[str]] = defaultdict(set)
-    for r in rows:
-        adj[r["src"]].add(r["dst"])
+    adj: Dict[str, Dict[str, Set[str]]] = {s: defaultdict(set) for s in srcs}
+    visited: Dict[str, Set[str]] = {s: {s} for s in srcs}
+    frontier: Dict[str, Set[str]] = {s: {s} for s in srcs}
+    with driver.session() as session:
+        for _ in range(max_depth):
+            ids = set().union(*frontier.values())
+            if not ids:
+                break
+            if limiter is not None:
+                limiter.acquire()
+            out = {r["id"]: r["dsts"] for r in session.run(NEO4J_FRONTIER, ids=list(ids))}
+            for s in srcs:
+                nxt = set()
+                for u in frontier[s]:
+                    for v in out.get(u, ()):
+                        adj[s][u].add(v)
+                        if v not in visited[s]:
+                            visited[s].add(v)
+                            nxt.add(v)
+                frontier[s] = nxt
     return adj
 
+def neo4j_sinks_multi(driver: Driver, srcs: List[str]) -> Dict[str, Set[str]]:
+    """Sinks reachable from each source, for a batch of sources in one round trip."""
+    with driver.session() as session:
+        found = {r["sid"]: set(r["sinks"]) for r in session.run(NEO4J_SINKS, ids=list(srcs))}
+    return {s: found.get(s, set()) for s in srcs}
+
+def neo4j_get_edges(driver: Driver, src: str, max_depth: int) -> Dict[str, Set[str]]:
+    return neo4j_get_edges_multi(driver, [src], max_depth)[src]
+
 def neo4j_sinks(driver: Driver, src: str) -> Set[str]:
-    q = """
-    MATCH (s:Node {id:$SRC})-[:FLOWS_TO*]->(t:Node)
-    WHERE NOT (t)-[:FLOWS_TO]->()
-    RETURN collect(DISTINCT t.id) AS sinks
-    """
-    with driver.session() as s:
-        out = s.run(q, SRC=src).single()
-    return set(out["sinks"] or [])
+    return neo4j_sinks_multi(driver, [src])[src]
 
-def tg_get_edges(host: str, graph: str, user: str, pwd: str, src: str, max_depth: int) -> Dict[str, Set[str]]:
+# Keyset page over nodes by id (range seek on the Node.id constraint index), with their out-neighbours
+NEO4J_EDGE_PAGE = """
+MATCH (u:Node) WHERE u.id > $after
+WITH u ORDER BY u.id LIMIT $limit
+OPTIONAL MATCH (u)-[:FLOWS_TO]->(v:Node)
+RETURN u.id AS src, collect(v.id) AS dsts
+"""
+
+def neo4j_edge_pages(driver: Driver, page_nodes: int) -> Iterator[List[Tuple[str, str]]]:
+    """Every FLOWS_TO edge as (src, dst), in pages of `page_nodes` start nodes."""
+    after = ""
+    with driver.session() as session:
+        while True:
+            rows = session.run(NEO4J_EDGE_PAGE, after=after, limit=page_nodes).data()
+            if not rows:
+                return
+            yield [(r["src"], v) for r in rows for v in r["dsts"]]
+            after = max(r["src"] for r in rows)
+
+def tg_connect(host: str, graph: str, user: str, pwd: str) -> tg.TigerGraphConnection:
+    """One authenticated connection per run; its token is reused by every query."""
     conn = tg.TigerGraphConnection(host=host, graphname=graph, username=user, password=pwd)
     conn.getToken(timeout=1440)
+    return conn
+
+def tg_get_edges(conn: tg.TigerGraphConnection, src: str, max_depth: int) -> Dict[str, Set[str]]:
     res = conn.runInstalledQuery("getEdgesWithinDepth", params={"srcIds":[src], "maxDepth": int(max_depth)})
     edges = set()
     if res and "edges" in res[0]:
@@ -107,20 +199,232 @@ def tg_get_edges(host: str, graph: str, user: str, pwd: str, src: str, max_depth
         adj[u].add(v)
     return adj
 
-def tg_sinks(host: str, graph: str, user: str, pwd: str, src: str) -> Set[str]:
-    conn = tg.TigerGraphConnection(host=host, graphname=graph, username=user, password=pwd)
-    conn.getToken(timeout=1440)
+def tg_sinks(conn: tg.TigerGraphConnection, src: str) -> Set[str]:
     res = conn.runInstalledQuery("getSinks", params={"srcIds":[src]})
     return set(res[0].get("sinks", [])) if res else set()
 
+def tg_edge_pages(conn: tg.TigerGraphConnection, parts: int) -> Iterator[List[Tuple[str, str]]]:
+    """Every FLOWS_TO edge as (src, dst), one installed-query call per vertex partition."""
+    for part in range(parts):
+        res = conn.runInstalledQuery("getEdgePage", params={"part": part, "parts": parts})
+        page = []
+        for e in (res[0].get("edges", []) if res else []):
+            u, sep, v = e.partition("|")
+            if sep:
+                page.append((u, v))
+        yield page
+
+# ---------------- Snapshot mode ----------------
+def snapshot_rows(n_driver: Driver, t_conn: tg.TigerGraphConnection, max_depth: int, page_nodes: int, tg_parts: int,
+                  n_latency: Histogram, t_latency: Histogram) -> List[dict]:
+    """Pull both edge lists once (concurrently) and compare every node with an outgoing edge in either backend."""
+    def pull(pages: Iterator[List[Tuple[str, str]]], hist: Histogram) -> lineage_snapshot.EdgeIndex:
+        ix = lineage_snapshot.EdgeIndex()
+        t0 = time.monotonic()
+        for page in pages:
+            ix.add(page)
+        hist.labels("snapshot").observe((time.monotonic() - t0) * 1000)
+        return ix
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        n_fut = pool.submit(pull, neo4j_edge_pages(n_driver, page_nodes), n_latency)
+        t_fut = pool.submit(pull, tg_edge_pages(t_conn, tg_parts), t_latency)
+        n_ix, t_ix = n_fut.result(), t_fut.result()
+    print(f"[snapshot] neo4j: {len(n_ix.ids)} nodes / {n_ix.edges} edges; "
+          f"tigergraph: {len(t_ix.ids)} nodes / {t_ix.edges} edges")
+    sources = sorted(set(lineage_snapshot.sources_of(n_ix)) | set(lineage_snapshot.sources_of(t_ix)))
+    n_m = lineage_snapshot.source_metrics(n_ix, sources, max_depth)
+    t_m = lineage_snapshot.source_metrics(t_ix, sources, max_depth)
+    return lineage_snapshot.compare_rows(sources, n_m, t_m)
+
+# ---------------- Checkpoints & incremental runs ----------------
+def set_digest(items: Iterable[str]) -> str:
+    h = hashlib.sha256()
+    for x in sorted(items):
+        h.update(x.encode()); h.update(b"\n")
+    return h.hexdigest()[:32]
+
+def neighbourhood_digest(adj: Dict[str, Set[str]], sinks: Set[str]) -> str:
+    """Digest of everything a row depends on: the edges within max_depth and the reachable sinks."""
+    return set_digest([f"{u}>{v}" for u, vs in adj.items() for v in vs] + [f"!{x}" for x in sinks])
+
+def load_records(path: str) -> Dict[str, dict]:
+    """Records of a checkpoint/state file by source; a torn last line (crash mid-write) is ignored."""
+    out: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return out
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            out[rec["source"]] = rec
+    return out
+
+def drop_torn_tail(path: str, chunk: int = 1 << 16) -> None:
+    """Truncate a JSONL file back to its last newline, dropping a line torn by a crash mid-write."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(chunk, pos)
+            f.seek(pos - step)
+            data = f.read(step)
+            i = data.rfind(b"\n")
+            if i >= 0:
+                f.truncate(pos - step + i + 1)
+                return
+            pos -= step
+        f.truncate(0)
+
+class Checkpoint:
+    """Append-only JSONL of finished sources, one record per line, flushed as it is written.
+
+    A fresh run truncates the file; with resume=True its records are loaded into `done`,
+    a torn last line is cut off, and new ones are appended after them.
+    """
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done = load_records(path) if resume else {}
+        if resume:
+            drop_torn_tail(path)
+        self.f = open(path, "a" if resume else "w")
+        self.lock = threading.Lock()
+
+    def append(self, rec: dict) -> None:
+        line = json.dumps(rec, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.f.write(line)
+            self.f.flush()
+
+    def close(self) -> None:
+        self.f.close()
+
+def set_delta(a: Set[str], b: Set[str], cap: int) -> dict:
+    """Elements of a not in b: total count and the first `cap`, sorted."""
+    only = sorted(a - b)
+    return {"count": len(only), "items": only[:cap]}
+
+def source_diff(n_edges: Dict[str, Set[str]], t_edges: Dict[str, Set[str]], n_reach: Set[str], t_reach: Set[str],
+                n_sinks: Set[str], t_sinks: Set[str], row: dict, cap: int) -> dict:
+    n_e = {f"{u}>{v}" for u, vs in n_edges.items() for v in vs}
+    t_e = {f"{u}>{v}" for u, vs in t_edges.items() for v in vs}
+    return {
+        "reachable": {"only_neo4j": set_delta(n_reach, t_reach, cap), "only_tigergraph": set_delta(t_reach, n_reach, cap)},
+        "sinks": {"only_neo4j": set_delta(n_sinks, t_sinks, cap), "only_tigergraph": set_delta(t_sinks, n_sinks, cap)},
+        "edges": {"only_neo4j": set_delta(n_e, t_e, cap), "only_tigergraph": set_delta(t_e, n_e, cap)},
+        "max_depth": {"neo4j": row["neo4j_max_depth"], "tigergraph": row["tigergraph_max_depth"]},
+        "path_count": {"neo4j": row["neo4j_path_count"], "tigergraph": row["tigergraph_path_count"]},
+    }
+
+# ---------------- Benchmark backends ----------------
+# apoc's BFS with global node uniqueness: every downstream node once, maxLevel -1 = unbounded
+NEO4J_BENCH_REACH = """
+MATCH (s:Node {id:$id})
+CALL apoc.path.subgraphNodes(s, {relationshipFilter: 'FLOWS_TO>', minLevel: 1, maxLevel: $depth}) YIELD node
+RETURN count(node) AS n
+"""
+NEO4J_BENCH_SINKS = """
+MATCH (s:Node {id:$id})
+CALL apoc.path.subgraphNodes(s, {relationshipFilter: 'FLOWS_TO>', minLevel: 1}) YIELD node
+WITH node WHERE NOT (node)-[:FLOWS_TO]->()
+RETURN count(node) AS n
+"""
+TG_UNBOUNDED = 1000000  # benchReach's WHILE ... LIMIT for "any depth"
+
+class Neo4jBackend(lineage_bench.Backend):
+    name = "neo4j"
+
+    def __init__(self, driver: Driver, max_depth: int = 6, k: int = 2):
+        super().__init__(max_depth, k)
+        self.driver = driver
+
+    def _count(self, q: str, **params) -> int:
+        with self.driver.session() as s:
+            rec = s.run(q, **params).single()
+        return int(rec["n"]) if rec else 0
+
+    def reachable(self, src: str, depth: int | None) -> int:
+        return self._count(NEO4J_BENCH_REACH, id=src, depth=-1 if depth is None else depth)
+
+    def sinks(self, src: str) -> int:
+        return self._count(NEO4J_BENCH_SINKS, id=src)
+
+    def sources(self, limit: int) -> List[str]:
+        with self.driver.session() as s:
+            return s.run("MATCH (s:Node)-[:FLOWS_TO]->() WITH DISTINCT s.id AS id ORDER BY id LIMIT $L RETURN id",
+                         L=limit).value()
+
+    def reset(self) -> None:
+        # Plan caches only; the page cache survives until the container restarts
+        try:
+            with self.driver.session() as s:
+                s.run("CALL db.clearQueryCaches()").consume()
+        except Exception as e:
+            print(f"[WARN] neo4j: could not clear query caches: {e}", file=sys.stderr)
+
+    def close(self) -> None:
+        self.driver.close()
+
+class TigerGraphBackend(lineage_bench.Backend):
+    """Installed query benchReach (reachable count and sinks); TigerGraph has no client-side cache drop."""
+    name = "tigergraph"
+
+    def __init__(self, conn: tg.TigerGraphConnection, max_depth: int = 6, k: int = 2):
+        super().__init__(max_depth, k)
+        self.conn = conn
+
+    def _reach(self, src: str, depth: int | None) -> dict:
+        res = self.conn.runInstalledQuery("benchReach", params={"src": src, "maxDepth": TG_UNBOUNDED if depth is None else depth})
+        return res[0] if res else {}
+
+    def reachable(self, src: str, depth: int | None) -> int:
+        return int(self._reach(src, depth).get("reachable", 0))
+
+    def sinks(self, src: str) -> int:
+        return int(self._reach(src, None).get("sinks", 0))
+
+def normalized_edges(pattern: str) -> List[Tuple[str, str]]:
+    """(src, dst) node ids from normalized edges: JSONL files/shard globs, or edges.arrow (next to its nodes.arrow)."""
+    if pattern.endswith(".arrow"):
+        def table(path):
+            return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        ids = table(os.path.join(os.path.dirname(pattern), "nodes.arrow")).column("id").combine_chunks()
+        e = table(pattern)
+        return list(zip(pc.take(ids, e.column("src")).to_pylist(), pc.take(ids, e.column("dst")).to_pylist()))
+    edges = []
+    for path in sorted(glob.glob(pattern)) or [pattern]:
+        with open(path) as f:
+            edges += [(e["src"], e["dst"]) for e in map(json.loads, f) if e.get("src") and e.get("dst")]
+    return edges
+
+def bench_backend(name: str, args) -> lineage_bench.Backend:
+    """Backends selectable with --backends; add an entry here to benchmark another system."""
+    if name == "neo4j":
+        driver = GraphDatabase.driver(os.getenv("NEO4J_URI","bolt://neo4j:7687"),
+                                      auth=(os.getenv("NEO4J_USER","neo4j"), os.getenv("NEO4J_PASS","neo4j")),
+                                      max_connection_pool_size=max(100, max(args.levels)))
+        return Neo4jBackend(driver, args.max_depth, args.k)
+    if name == "tigergraph":
+        conn = tg_connect(os.getenv("TG_HOST","http://tigergraph:9000"), os.getenv("TG_GRAPH","LineageGraph"),
+                          os.getenv("TG_USERNAME","tigergraph"), os.getenv("TG_PASSWORD","tigergraph"))
+        return TigerGraphBackend(conn, args.max_depth, args.k)
+    if name == "memory":
+        return lineage_bench.MemoryBackend(normalized_edges(args.edges), max_depth=args.max_depth, k=args.k,
+                                           latency_ms=args.fake_latency_ms, cold_ms=args.fake_cold_ms)
+    raise ValueError(f"unknown backend {name!r} (expected neo4j, tigergraph or memory)")
+
 # ---------------- Reporting helpers ----------------
-def render_html(df: pd.DataFrame, out_html: str, max_depth: int, sources_limit: int) -> None:
+def render_html(df: pd.DataFrame, out_html: str, max_depth: int, sources_limit: int, table_df: pd.DataFrame | None = None) -> None:
+    """Totals come from `df`; the table lists `table_df` (default: every row)."""
     env = Environment(
         loader=FileSystemLoader("/app/templates"),
         autoescape=select_autoescape(["html", "xml"]),
     )
     tpl = env.get_template("report.html")
-    df2 = df.copy()
+    df2 = (df if table_df is None else table_df).copy()
     for col in ["eq_sinks","eq_reachable","eq_max_depth","eq_path_count"]:
         df2[col] = df2[col].map(lambda x: f"<span class='ok'>✓</span>" if x else f"<span class='bad'>✗</span>")
     table_html = df2.to_html(escape=False, index=False)
@@ -138,9 +442,123 @@ def render_html(df: pd.DataFrame, out_html: str, max_depth: int, sources_limit:
     with open(out_html, "w") as f:
         f.write(html)
 
+BENCH_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Lineage backend benchmark</title>
+<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}
+th{background:#f4f4f4}td:nth-child(-n+4){text-align:left}</style></head><body>
+<h1>Lineage backend benchmark</h1>
+<p><a href="index.html">Parity report</a></p>
+<p>Generated {{ generated_at }} &middot; {{ ops }} operations per pass over {{ sources }} sources &middot;
+mix {{ mix }} &middot; max depth {{ max_depth }}, k = {{ k }}</p>
+<h2>Throughput (all kinds)</h2>{{ summary_html }}
+<h2>Latency by query kind</h2>{{ detail_html }}
+</body></html>
+"""
+
+def render_benchmark_html(rows: List[lineage_bench.BenchRow], out_html: str, **meta) -> None:
+    """Standalone page next to the parity report; pivots QPS by concurrency, lists every row."""
+    df = pd.DataFrame([r.__dict__ for r in rows])
+    summary = df[df["kind"] == "all"].pivot_table(index=["backend", "phase"], columns="concurrency", values="qps")
+    summary.columns = [f"QPS @ {c}" for c in summary.columns]
+    html = Environment(autoescape=False).from_string(BENCH_HTML).render(
+        generated_at=datetime.datetime.utcnow().isoformat()+"Z",
+        summary_html=summary.reset_index().to_html(index=False),
+        detail_html=df.to_html(index=False),
+        **meta,
+    )
+    with open(out_html, "w") as f:
+        f.write(html)
+
+def benchmark_main(argv: List[str]) -> None:
+    ap = argparse.ArgumentParser(prog="compare_lineage.py benchmark",
+                                 description="Replay a query mix against each backend at several concurrency levels")
+    ap.add_argument("--out", required=True, help="Output directory for benchmark.{csv,json,html}")
+    ap.add_argument("--backends", default=os.getenv("BENCH_BACKENDS", "neo4j,tigergraph"),
+                    help="Comma-separated: neo4j, tigergraph, memory")
+    ap.add_argument("--mix", default=os.getenv("BENCH_MIX", lineage_bench.DEFAULT_MIX),
+                    help="Query kind weights, e.g. reachability=4,sinks=3,khop=2,impact=1")
+    ap.add_argument("--concurrency", default=os.getenv("BENCH_CONCURRENCY", "1,2,4,8,16"),
+                    help="Concurrency levels, comma-separated")
+    ap.add_argument("--ops", type=int, default=int(os.getenv("BENCH_OPS", "500")), help="Operations per pass")
+    ap.add_argument("--sources", type=int, default=int(os.getenv("BENCH_SOURCES", "200")),
+                    help="Sources the operations are drawn from")
+    ap.add_argument("--phases", default=os.getenv("BENCH_PHASES", "cold,warm"), help="cold, warm or both")
+    ap.add_argument("--k", type=int, default=int(os.getenv("BENCH_K", "2")), help="Hops for khop queries")
+    ap.add_argument("--seed", type=int, default=int(os.getenv("BENCH_SEED", "0")))
+    ap.add_argument("--edges", default=os.getenv("BENCH_EDGES", "/workspace/normalized/edges*.jsonl"),
+                    help="memory backend: normalized edges file(s), a glob matching shards, or edges.arrow")
+    ap.add_argument("--fake-latency-ms", type=float, default=0.0, help="memory backend: added latency per query")
+    ap.add_argument("--fake-cold-ms", type=float, default=0.0, help="memory backend: extra latency on a source's first query after reset")
+    args = ap.parse_args(argv)
+    args.max_depth = int(os.getenv("MAX_DEPTH","6"))
+    args.levels = sorted({max(1, int(c)) for c in args.concurrency.split(",") if c.strip()})
+    phases = [p.strip() for p in args.phases.split(",") if p.strip() in ("cold", "warm")]
+    mix = lineage_bench.parse_mix(args.mix)
+    os.makedirs(args.out, exist_ok=True)
+
+    backends = [bench_backend(n.strip(), args) for n in args.backends.split(",") if n.strip()]
+    sources: List[str] = []
+    for b in backends:
+        try:
+            sources = b.sources(args.sources)
+            break
+        except NotImplementedError:
+            continue
+    if not sources:
+        sys.exit("benchmark: no sources (need a backend that can list them, and a non-empty graph)")
+    ops = lineage_bench.make_ops(sources, mix, args.ops, args.seed)
+    rows = lineage_bench.run_benchmark(backends, ops, args.levels, phases, log=print)
+    for b in backends:
+        b.close()
+
+    csv_path = os.path.join(args.out, "benchmark.csv")
+    pd.DataFrame([r.__dict__ for r in rows]).to_csv(csv_path, index=False)
+    meta = {"ops": args.ops, "sources": len(sources), "mix": args.mix, "max_depth": args.max_depth, "k": args.k}
+    with open(os.path.join(args.out, "benchmark.json"), "w") as f:
+        json.dump({**meta, "levels": args.levels, "phases": phases, "rows": [r.__dict__ for r in rows]}, f, indent=2)
+    render_benchmark_html(rows, os.path.join(args.out, "benchmark.html"), **meta)
+
+    pg = os.getenv("PUSHGATEWAY_URL")
+    if pg:
+        reg = CollectorRegistry()
+        lat = Gauge("lineage_bench_latency_ms", "Benchmark latency percentile (ms)",
+                    ["backend", "phase", "concurrency", "kind", "quantile"], registry=reg)
+        qps = Gauge("lineage_bench_qps", "Benchmark throughput (completed ops/s)", ["backend", "phase", "concurrency", "kind"], registry=reg)
+        errs = Gauge("lineage_bench_errors", "Failed benchmark operations per pass", ["backend", "phase", "concurrency", "kind"], registry=reg)
+        for r in rows:
+            labels = (r.backend, r.phase, str(r.concurrency), r.kind)
+            for q, v in (("0.5", r.p50_ms), ("0.95", r.p95_ms), ("0.99", r.p99_ms)):
+                lat.labels(*labels, q).set(v)
+            qps.labels(*labels).set(r.qps)
+            errs.labels(*labels).set(r.errors)
+        push_to_gateway(pg, job="lineage_benchmark", registry=reg)
+    print(f"Wrote benchmark to {args.out}.")
+
 def main() -> None:
+    if sys.argv[1:2] == ["benchmark"]:
+        return benchmark_main(sys.argv[2:])
     ap = argparse.ArgumentParser()
     ap.add_argument("--out", required=True, help="Output directory for reports")
+    ap.add_argument("--mode", choices=("sources", "snapshot"), default=os.getenv("COMPARE_MODE", "sources"),
+                    help="sources: per-source subgraph queries (SOURCES_LIMIT); snapshot: whole edge lists, every source")
+    ap.add_argument("--snapshot-page", type=int, default=int(os.getenv("SNAPSHOT_PAGE_NODES", "50000")),
+                    help="Snapshot mode: Neo4j start nodes per edge page")
+    ap.add_argument("--tg-parts", type=int, default=int(os.getenv("SNAPSHOT_TG_PARTS", "16")),
+                    help="Snapshot mode: TigerGraph vertex partitions (one getEdgePage call each)")
+    ap.add_argument("--resume", action="store_true",
+                    help="Sources mode: keep the checkpoint of an interrupted run and skip the sources it already has")
+    ap.add_argument("--full", action="store_true",
+                    help="Sources mode: re-evaluate every source even if its neighbourhood digest is unchanged")
+    ap.add_argument("--diff-items", type=int, default=int(os.getenv("DIFFS_MAX_ITEMS", "1000")),
+                    help="Max ids listed per set difference in diffs.json")
+    ap.add_argument("--concurrency", type=int, default=int(os.getenv("COMPARE_CONCURRENCY", "8")),
+                    help="Sources evaluated in parallel")
+    ap.add_argument("--batch-size", type=int, default=int(os.getenv("COMPARE_BATCH_SIZE", "1")),
+                    help="Sources per Neo4j round trip (UNWIND); >1 records Neo4j latency as edges_batch/sinks_batch")
+    ap.add_argument("--neo4j-qps", type=float, default=float(os.getenv("NEO4J_QPS", "0")),
+                    help="Max Neo4j round trips per second (0 = unlimited)")
+    ap.add_argument("--tg-qps", type=float, default=float(os.getenv("TG_QPS", "0")),
+                    help="Max TigerGraph queries per second (0 = unlimited)")
     args = ap.parse_args()
     outdir = args.out
     os.makedirs(outdir, exist_ok=True)
@@ -174,20 +592,46 @@ def main() -> None:
 
     t_run0=time.monotonic()
 
-    # Select sources
-    n_driver = GraphDatabase.driver(n_uri, auth=(n_user,n_pwd))
-    with n_driver.session() as s:
-        sources = s.run("MATCH (s:Node)-[:FLOWS_TO]->() RETURN DISTINCT s.id AS id LIMIT $L", L=src_limit).value()
+    n_limit, t_limit = RateLimiter(args.neo4j_qps, args.concurrency), RateLimiter(args.tg_qps, args.concurrency)
+
+    def timed(limiter, hist, kind, fn, *a):
+        if limiter is not None:
+            limiter.acquire()
+        t0 = time.monotonic()
+        out = fn(*a)
+        hist.labels(kind).observe((time.monotonic() - t0) * 1000)
+        return out
 
-    rows: List[dict] = []
-    diff_count=0
-    for sid in sources:
-        t0=time.monotonic(); n_edges = neo4j_get_edges(n_driver, sid, max_depth); n_latency.labels("edges").observe((time.monotonic()-t0)*1000)
-        t0=time.monotonic(); n_sinks = neo4j_sinks(n_driver, sid); n_latency.labels("sinks").observe((time.monotonic()-t0)*1000)
+    # Neo4j edges acquire the limiter per BFS level (one round trip each) inside neo4j_get_edges_multi
+    suffix = "" if args.batch_size <= 1 else "_batch"
 
-        t0=time.monotonic(); t_edges = tg_get_edges(t_host, t_graph, t_user, t_pwd, sid, max_depth); t_latency.labels("edges").observe((time.monotonic()-t0)*1000)
-        t0=time.monotonic(); t_sinks = tg_sinks(t_host, t_graph, t_user, t_pwd, sid); t_latency.labels("sinks").observe((time.monotonic()-t0)*1000)
+    ckpt_path = os.path.join(outdir, "checkpoint.jsonl")
+    state_path = os.path.join(outdir, "state.jsonl")  # the last completed run's records
+    reused = [0]
 
+    def evaluate_batch(batch: List[str]) -> List[dict]:
+        # Both backends' edges and sinks are fetched every run and double as the neighbourhood probe: only when
+        # neither side changed is last run's record reused, skipping the metrics and set differences
+        n_edges_all = timed(None, n_latency, "edges" + suffix, neo4j_get_edges_multi, n_driver, batch, max_depth, n_limit)
+        n_sinks_all = timed(n_limit, n_latency, "sinks" + suffix, neo4j_sinks_multi, n_driver, batch)
+        recs = []
+        for sid in batch:
+            t_edges = timed(t_limit, t_latency, "edges", tg_get_edges, t_conn, sid, max_depth)
+            t_sinks = timed(t_limit, t_latency, "sinks", tg_sinks, t_conn, sid)
+            digest = neighbourhood_digest(n_edges_all[sid], n_sinks_all[sid])
+            tg_digest = neighbourhood_digest(t_edges, t_sinks)
+            prev = previous.get(sid)
+            if prev is not None and prev["digest"] == digest and prev.get("tigergraph_digest") == tg_digest:
+                rec = prev
+                reused[0] += 1
+            else:
+                rec = evaluate(sid, n_edges_all[sid], n_sinks_all[sid], t_edges, t_sinks, digest, tg_digest)
+            checkpoint.append(rec)
+            recs.append(rec)
+        return recs
+
+    def evaluate(sid: str, n_edges: Dict[str, Set[str]], n_sinks: Set[str], t_edges: Dict[str, Set[str]], t_sinks: Set[str],
+                 digest: str, tg_digest: str) -> dict:
         n_reach, _, n_maxh = bfs_metrics(n_edges, sid, max_depth)
         t_reach, _, t_maxh = bfs_metrics(t_edges, sid, max_depth)
 
@@ -211,9 +655,53 @@ def main() -> None:
             "neo4j_path_count": -1 if n_paths is None else int(n_paths),
             "tigergraph_path_count": -1 if t_paths is None else int(t_paths),
         }
-        if not (row["eq_sinks"] and row["eq_reachable"] and row["eq_max_depth"] and row["eq_path_count"]):
-            diff_count += 1
-        rows.append(row)
+        same = row["eq_sinks"] and row["eq_reachable"] and row["eq_max_depth"] and row["eq_path_count"]
+        return {
+            "source": sid, "digest": digest, "tigergraph_digest": tg_digest, "max_depth": max_depth,
+            "neo4j_reach_digest": set_digest(n_reach), "tigergraph_reach_digest": set_digest(t_reach),
+            "row": row,
+            "diff": None if same else source_diff(n_edges, t_edges, n_reach, t_reach, n_sinks, t_sinks, row, args.diff_items),
+        }
+
+    def per_source_records() -> List[dict]:
+        # Ordered so a resumed run picks the same sources
+        with n_driver.session() as s:
+            sources = s.run("MATCH (s:Node)-[:FLOWS_TO]->() WITH DISTINCT s.id AS id ORDER BY id LIMIT $L RETURN id",
+                            L=src_limit).value()
+        done = {k: r for k, r in checkpoint.done.items() if r.get("max_depth") == max_depth}
+        todo = [sid for sid in sources if sid not in done]
+        if done:
+            print(f"[resume] {len(sources) - len(todo)} of {len(sources)} sources already in {ckpt_path}")
+        # Sources are independent; batches share Neo4j round trips, results come back in source order
+        bs = max(1, args.batch_size)
+        batches = [todo[i:i + bs] for i in range(0, len(todo), bs)]
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            new = {rec["source"]: rec for part in pool.map(evaluate_batch, batches) for rec in part}
+        return [done.get(sid) or new[sid] for sid in sources]
+
+    n_driver = GraphDatabase.driver(n_uri, auth=(n_user,n_pwd), max_connection_pool_size=max(100, args.concurrency))
+    t_conn = tg_connect(t_host, t_graph, t_user, t_pwd)
+    if args.mode == "snapshot":
+        rows: List[dict] = snapshot_rows(n_driver, t_conn, max_depth, max(1, args.snapshot_page), max(1, args.tg_parts),
+                                         n_latency, t_latency)
+        for r in rows:
+            reachable_hist.labels("neo4j").observe(r["neo4j_reachable"])
+            reachable_hist.labels("tigergraph").observe(r["tigergraph_reachable"])
+        # One value per run here: the total over all sources
+        path_count_g.labels("neo4j").set(float(sum(r["neo4j_path_count"] for r in rows)))
+        path_count_g.labels("tigergraph").set(float(sum(r["tigergraph_path_count"] for r in rows)))
+        records = None
+    else:
+        previous = {} if args.full else {k: r for k, r in load_records(state_path).items() if r.get("max_depth") == max_depth}
+        checkpoint = Checkpoint(ckpt_path, resume=args.resume)
+        records = per_source_records()
+        checkpoint.close()
+        os.replace(ckpt_path, state_path)
+        rows = [r["row"] for r in records]
+        if previous:
+            print(f"[incremental] {reused[0]} sources unchanged since the last run, reused")
+    n_driver.close()
+    diff_count = sum(1 for r in rows if not (r["eq_sinks"] and r["eq_reachable"] and r["eq_max_depth"] and r["eq_path_count"]))
 
     df = pd.DataFrame(rows)
     csv_path = os.path.join(outdir,"comparison.csv")
@@ -222,7 +710,20 @@ def main() -> None:
     df.to_csv(csv_path, index=False)
     with open(md_path, "w") as f:
         f.write(f"# Parity Summary Sources: **{len(df)}** — Differences: **{diff_count}**")
-    render_html(df, html_path, max_depth=max_depth, sources_limit=src_limit)
+    diffs_json = os.path.join(outdir,"diffs.json")
+    if records is not None:
+        with open(diffs_json, "w") as f:
+            json.dump({"generated_at": datetime.datetime.utcnow().isoformat()+"Z", "max_depth": max_depth,
+                       "sources": len(records),
+                       "differences": [{"source": r["source"], **r["diff"]} for r in records if r["diff"]]}, f, indent=2)
+    elif os.path.exists(diffs_json):
+        os.remove(diffs_json)  # snapshot mode compares fingerprints; don't publish a stale file
+    if args.mode == "snapshot":
+        # Every source is in the CSV; the HTML table only lists the differing ones
+        eq_cols = ["eq_sinks","eq_reachable","eq_max_depth","eq_path_count"]
+        render_html(df, html_path, max_depth=max_depth, sources_limit=0, table_df=df[~df[eq_cols].all(axis=1)])
+    else:
+        render_html(df, html_path, max_depth=max_depth, sources_limit=src_limit)
 
     # Metrics push
     runs.inc(); sources_g.set(len(df)); mismatches.inc(diff_count)
@@ -246,7 +747,6 @@ def main() -> None:
             Artifact(local_path=md_path,  remote_key=f"{base_key}/comparison.md"),
             Artifact(local_path=html_path,remote_key=f"{base_key}/index.html",),
         ]
-        diffs_json = os.path.join(outdir,"diffs.json")
         if os.path.exists(diffs_json):
             artifacts.append(Artifact(local_path=diffs_json, remote_key=f"{base_key}/diffs.json"))
         try:
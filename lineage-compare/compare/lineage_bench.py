@@ -0,0 +1,209 @@
+"""
+Workload benchmark for the bake-off (`compare_lineage.py benchmark`).
+
+A Backend answers four query kinds for one source node, returning a count:
+
+- reachability: nodes within max_depth hops
+- sinks: reachable nodes without outgoing edges, any depth
+- khop: nodes within k hops
+- impact: every downstream node, any depth
+
+run_benchmark replays one seeded operation sequence (kinds drawn by the mix
+weights, sources uniformly) against each backend at each concurrency level.
+The cold pass runs right after backend.reset(); the warm pass repeats the
+same operations. Percentiles are nearest-rank over successful operations per
+(backend, phase, concurrency, kind), plus an "all" row; QPS is completed
+operations over the pass's wall time.
+
+Backends are plain subclasses of Backend. MemoryBackend answers from an
+in-memory adjacency (with optional simulated latency), so the harness and
+reports can be exercised without either database.
+"""
+import math
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+QUERY_KINDS = ("reachability", "sinks", "khop", "impact")
+DEFAULT_MIX = "reachability=4,sinks=3,khop=2,impact=1"
+
+class Backend:
+    name = "backend"
+
+    def __init__(self, max_depth: int = 6, k: int = 2):
+        self.max_depth = max_depth
+        self.k = k
+
+    def query(self, kind: str, src: str) -> int:
+        if kind == "reachability":
+            return self.reachable(src, self.max_depth)
+        if kind == "khop":
+            return self.reachable(src, self.k)
+        if kind == "impact":
+            return self.reachable(src, None)
+        if kind == "sinks":
+            return self.sinks(src)
+        raise ValueError(f"unknown query kind {kind!r}")
+
+    def reachable(self, src: str, depth: Optional[int]) -> int:
+        """Nodes 1..depth hops downstream of src (depth None = unbounded)."""
+        raise NotImplementedError
+
+    def sinks(self, src: str) -> int:
+        raise NotImplementedError
+
+    def sources(self, limit: int) -> List[str]:
+        """Up to `limit` nodes with an outgoing edge, in id order."""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Drop whatever caches the backend lets a client drop, before a cold pass."""
+
+    def close(self) -> None:
+        pass
+
+class MemoryBackend(Backend):
+    """BFS over an in-memory adjacency.
+
+    latency_ms is added to every query; cold_ms once more per source until
+    it has been queried after the last reset(), to mimic a cache warming up.
+    """
+    def __init__(self, edges: Iterable[Tuple[str, str]], name: str = "memory", max_depth: int = 6, k: int = 2,
+                 latency_ms: float = 0.0, cold_ms: float = 0.0):
+        super().__init__(max_depth, k)
+        self.name = name
+        self.adj: Dict[str, Set[str]] = defaultdict(set)
+        for u, v in edges:
+            self.adj[u].add(v)
+        self.latency_ms = latency_ms
+        self.cold_ms = cold_ms
+        self._warm: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _pause(self, src: str) -> None:
+        ms = self.latency_ms
+        if self.cold_ms:
+            with self._lock:
+                if src not in self._warm:
+                    self._warm.add(src)
+                    ms += self.cold_ms
+        if ms:
+            time.sleep(ms / 1000)
+
+    def _bfs(self, src: str, depth: Optional[int]) -> Set[str]:
+        dist = {src: 0}
+        q = deque([src])
+        while q:
+            u = q.popleft()
+            if depth is not None and dist[u] >= depth:
+                continue
+            for v in self.adj.get(u, ()):
+                if v not in dist:
+                    dist[v] = dist[u] + 1
+                    q.append(v)
+        return set(dist) - {src}
+
+    def reachable(self, src: str, depth: Optional[int]) -> int:
+        self._pause(src)
+        return len(self._bfs(src, depth))
+
+    def sinks(self, src: str) -> int:
+        self._pause(src)
+        return sum(1 for v in self._bfs(src, None) if not self.adj.get(v))
+
+    def sources(self, limit: int) -> List[str]:
+        return sorted(u for u, vs in self.adj.items() if vs)[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._warm.clear()
+
+@dataclass
+class BenchRow:
+    backend: str
+    phase: str  # cold | warm
+    concurrency: int
+    kind: str  # a query kind, or "all"
+    ops: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    qps: float
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'reachability=4,sinks=1' -> weights; kinds left out are not run."""
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        kind, _, w = part.partition("=")
+        kind = kind.strip()
+        if kind not in QUERY_KINDS:
+            raise ValueError(f"unknown query kind {kind!r} (expected one of {', '.join(QUERY_KINDS)})")
+        mix[kind] = float(w) if w.strip() else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("query mix needs at least one positive weight")
+    return mix
+
+def make_ops(sources: Sequence[str], mix: Dict[str, float], n_ops: int, seed: int = 0) -> List[Tuple[str, str]]:
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    return [(rng.choices(kinds, weights)[0], rng.choice(sources)) for _ in range(n_ops)]
+
+def percentile(sorted_ms: List[float], q: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, math.ceil(q * len(sorted_ms)) - 1))]
+
+def run_pass(backend: Backend, ops: List[Tuple[str, str]], concurrency: int) -> Tuple[List[Tuple[str, float, bool]], float]:
+    """(kind, latency ms, ok) per operation, and the pass's wall time in seconds."""
+    def one(op: Tuple[str, str]) -> Tuple[str, float, bool]:
+        t0 = time.perf_counter()
+        try:
+            backend.query(*op)
+            ok = True
+        except Exception:
+            ok = False
+        return op[0], (time.perf_counter() - t0) * 1000, ok
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        samples = list(pool.map(one, ops))
+    return samples, time.perf_counter() - t0
+
+def summarize(backend: str, phase: str, concurrency: int, samples: List[Tuple[str, float, bool]], wall: float) -> List[BenchRow]:
+    by_kind: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+    for kind, ms, ok in samples:
+        by_kind[kind].append((ms, ok))
+        by_kind["all"].append((ms, ok))
+    rows = []
+    for kind in [k for k in QUERY_KINDS if k in by_kind] + ["all"]:
+        got = by_kind.get(kind, [])
+        lat = sorted(ms for ms, ok in got if ok)
+        rows.append(BenchRow(backend, phase, concurrency, kind, len(got), len(got) - len(lat),
+                             round(percentile(lat, .50), 2), round(percentile(lat, .95), 2), round(percentile(lat, .99), 2),
+                             round(len(lat) / wall, 1) if wall > 0 else 0.0))
+    return rows
+
+def run_benchmark(backends: List[Backend], ops: List[Tuple[str, str]], levels: List[int],
+                  phases: Sequence[str] = ("cold", "warm"), log=None) -> List[BenchRow]:
+    rows: List[BenchRow] = []
+    for b in backends:
+        for c in levels:
+            for phase in phases:
+                if phase == "cold":
+                    b.reset()
+                samples, wall = run_pass(b, ops, c)
+                part = summarize(b.name, phase, c, samples, wall)
+                rows.extend(part)
+                if log is not None:
+                    total = part[-1]
+                    log(f"[benchmark] {b.name} {phase} c={c}: {total.qps} qps, p50 {total.p50_ms} ms, "
+                        f"p99 {total.p99_ms} ms, {total.errors} errors")
+    return rows
@@ -0,0 +1,171 @@
+"""
+Whole-graph parity metrics for `--mode snapshot`.
+
+Each backend's FLOWS_TO edge list is pulled once (in pages) into an
+EdgeIndex, which becomes a SciPy CSR adjacency matrix. The metrics the
+per-source mode computes with bfs_metrics/bounded_path_count are then
+computed for every source, 64 sources per pass:
+
+- the frontier of a pass is a sparse n x 64 matrix whose values are
+  shortest-path counts; one sparse product with A^T advances all 64 BFSs
+  by a level;
+- visited sets are one uint64 bitset per node (bit j = source j);
+- reachable and sink sets are compared across backends by fingerprint
+  (count, and the wrapping sum and xor of a 64-bit hash of each node id),
+  so no per-source set is ever built.
+
+Semantics match the per-source mode: reachable = nodes 1..max_depth hops
+away, max depth = deepest such level, path count = paths in the BFS layer
+DAG (shortest paths) from the source to sinks within max_depth, sinks =
+every reachable node without outgoing edges, at any depth.
+"""
+import hashlib
+from array import array
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+
+WORD = 64  # sources per pass: one uint64 of visited bits per node
+
+METRICS = ("reach_n", "reach_sum", "reach_xor", "max_depth", "sink_n", "sink_sum", "sink_xor", "paths")
+
+class EdgeIndex:
+    """String node ids -> dense indices, and the edge list built from pages of (src, dst) pairs."""
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self._src = array("q")
+        self._dst = array("q")
+
+    def _ix(self, k: str) -> int:
+        i = self.index.get(k)
+        if i is None:
+            i = self.index[k] = len(self.ids)
+            self.ids.append(k)
+        return i
+
+    def add(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        for u, v in pairs:
+            self._src.append(self._ix(u))
+            self._dst.append(self._ix(v))
+
+    @property
+    def edges(self) -> int:
+        return len(self._src)
+
+    def matrix(self) -> csr_matrix:
+        """n x n adjacency (row u, column v for u -> v), duplicate edges collapsed."""
+        n = len(self.ids)
+        src = np.frombuffer(self._src, dtype=np.int64) if self._src else np.zeros(0, dtype=np.int64)
+        dst = np.frombuffer(self._dst, dtype=np.int64) if self._dst else np.zeros(0, dtype=np.int64)
+        a = csr_matrix((np.ones(src.size, dtype=np.int64), (src, dst)), shape=(n, n))
+        a.sum_duplicates()
+        a.data[:] = 1
+        return a
+
+def id_hashes(ids: List[str]) -> np.ndarray:
+    return np.fromiter((int.from_bytes(hashlib.blake2b(k.encode(), digest_size=8).digest(), "little") for k in ids),
+                       dtype=np.uint64, count=len(ids))
+
+def sources_of(ix: EdgeIndex) -> List[str]:
+    """Ids with at least one outgoing edge."""
+    if not ix.edges:
+        return []
+    return [ix.ids[i] for i in np.unique(np.frombuffer(ix._src, dtype=np.int64))]
+
+def source_metrics(ix: EdgeIndex, sources: List[str], max_depth: int) -> Dict[str, np.ndarray]:
+    """METRICS arrays aligned with `sources`; ids absent from the backend get zeros."""
+    out = _zeros(len(sources))
+    a = ix.matrix()
+    at = a.T.tocsr()
+    is_sink = np.diff(a.indptr) == 0
+    h = id_hashes(ix.ids)
+    present = [(j, ix.index[s]) for j, s in enumerate(sources) if s in ix.index]
+    for start in range(0, len(present), WORD):
+        chunk = present[start:start + WORD]
+        slots = np.array([j for j, _ in chunk], dtype=np.int64)
+        rows = np.array([i for _, i in chunk], dtype=np.int64)
+        res = _pass(a, at, is_sink, h, rows, max_depth)
+        for m in METRICS:
+            out[m][slots] = res[m]
+    return out
+
+def _zeros(k: int) -> Dict[str, np.ndarray]:
+    return {m: np.zeros(k, dtype=np.uint64 if m.endswith(("_sum", "_xor")) else np.int64) for m in METRICS}
+
+def _bits(c: np.ndarray) -> np.ndarray:
+    return np.left_shift(np.uint64(1), c.astype(np.uint64))
+
+def _pass(a: csr_matrix, at: csr_matrix, is_sink: np.ndarray, h: np.ndarray, rows: np.ndarray, max_depth: int) -> Dict[str, np.ndarray]:
+    """Metrics for up to WORD sources (node indices `rows`), column j = rows[j]."""
+    n, k = a.shape[0], rows.size
+    res = _zeros(k)
+    visited = np.zeros(n, dtype=np.uint64)
+    np.bitwise_or.at(visited, rows, _bits(np.arange(k)))
+    # Levels 1..max_depth: sparse frontier carrying shortest-path counts
+    frontier = csr_matrix((np.ones(k, dtype=np.int64), (rows, np.arange(k))), shape=(n, k))
+    r = c = np.zeros(0, dtype=np.int64)
+    for level in range(1, max_depth + 1):
+        nxt = (at @ frontier).tocoo()
+        r, c, w = nxt.row.astype(np.int64), nxt.col.astype(np.int64), nxt.data
+        bit = _bits(c)
+        new = (visited[r] & bit) == 0
+        r, c, w, bit = r[new], c[new], w[new], bit[new]
+        if not r.size:
+            break
+        np.bitwise_or.at(visited, r, bit)
+        sink = is_sink[r]
+        res["reach_n"] += np.bincount(c, minlength=k)
+        np.add.at(res["reach_sum"], c, h[r])
+        np.bitwise_xor.at(res["reach_xor"], c, h[r])
+        res["max_depth"][np.unique(c)] = level
+        np.add.at(res["paths"], c[sink], w[sink])
+        _add_sinks(res, c[sink], h[r[sink]])
+        frontier = csr_matrix((w, (r, c)), shape=(n, k))
+    # Past max_depth only the sinks are wanted: propagate bitsets, one OR per edge for all k sources
+    fb = np.zeros(n, dtype=np.uint64)
+    if r.size:
+        np.bitwise_or.at(fb, r, _bits(c))
+    while True:
+        act = np.flatnonzero(fb)
+        if not act.size:
+            break
+        starts = a.indptr[act]
+        counts = a.indptr[act + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            break
+        pos = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        nb = np.zeros(n, dtype=np.uint64)
+        np.bitwise_or.at(nb, a.indices[pos], np.repeat(fb[act], counts))
+        fb = nb & ~visited
+        visited |= fb
+        hit = np.flatnonzero(is_sink & (fb != 0))
+        if hit.size:
+            mask = (fb[hit][:, None] >> np.arange(k, dtype=np.uint64)) & np.uint64(1)
+            node, col = np.nonzero(mask)
+            _add_sinks(res, col, h[hit[node]])
+    return res
+
+def _add_sinks(res: Dict[str, np.ndarray], c: np.ndarray, hashes: np.ndarray) -> None:
+    res["sink_n"] += np.bincount(c, minlength=res["sink_n"].size)
+    np.add.at(res["sink_sum"], c, hashes)
+    np.bitwise_xor.at(res["sink_xor"], c, hashes)
+
+def compare_rows(sources: List[str], n: Dict[str, np.ndarray], t: Dict[str, np.ndarray]) -> List[dict]:
+    """Rows in the per-source report layout."""
+    eq_reach = (n["reach_n"] == t["reach_n"]) & (n["reach_sum"] == t["reach_sum"]) & (n["reach_xor"] == t["reach_xor"])
+    eq_sinks = (n["sink_n"] == t["sink_n"]) & (n["sink_sum"] == t["sink_sum"]) & (n["sink_xor"] == t["sink_xor"])
+    eq_depth = n["max_depth"] == t["max_depth"]
+    eq_paths = n["paths"] == t["paths"]
+    return [{
+        "source": s,
+        "eq_sinks": bool(eq_sinks[j]),
+        "eq_reachable": bool(eq_reach[j]),
+        "eq_max_depth": bool(eq_depth[j]),
+        "eq_path_count": bool(eq_paths[j]),
+        "neo4j_sinks": int(n["sink_n"][j]), "tigergraph_sinks": int(t["sink_n"][j]),
+        "neo4j_reachable": int(n["reach_n"][j]), "tigergraph_reachable": int(t["reach_n"][j]),
+        "neo4j_max_depth": int(n["max_depth"][j]), "tigergraph_max_depth": int(t["max_depth"][j]),
+        "neo4j_path_count": int(n["paths"][j]), "tigergraph_path_count": int(t["paths"][j]),
+    } for j, s in enumerate(sources)]
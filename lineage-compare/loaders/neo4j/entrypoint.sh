@@ -1,3 +1,8 @@
 #!/usr/bin/env bash
 set -euo pipefail
-python /app/loader.py --nodes ${NORMALIZED_ROOT}/nodes.jsonl --edges ${NORMALIZED_ROOT}/edges.jsonl
+# Prefer the binary format when the normalizer wrote it
+if [ -f "${NORMALIZED_ROOT}/nodes.arrow" ]; then
+  python /app/loader.py --nodes "${NORMALIZED_ROOT}/nodes.arrow" --edges "${NORMALIZED_ROOT}/edges.arrow"
+else
+  python /app/loader.py --nodes "${NORMALIZED_ROOT}/nodes*.jsonl" --edges "${NORMALIZED_ROOT}/edges*.jsonl"
+fi
@@ -1,45 +1,179 @@
 #!/usr/bin/env python3
-import argparse, orjson, os
+"""
+Neo4j loader: upserts normalized nodes/edges in UNWIND batches.
+
+Each batch is one parameter list consumed by a single UNWIND ... MERGE
+statement, one round trip and one transaction. With --workers > 1, rows are
+partitioned by a hash of their key (node id, edge source id) so every
+source's MERGEs run on one worker and workers don't fight over the same
+source node; rows in a batch are sorted so locks are taken in a consistent
+order. Transactions run through execute_write, which retries transient
+errors (deadlocks, leader switches) with backoff for up to NEO4J_RETRY_SECONDS.
+"""
+import argparse, glob, orjson, os, queue, threading, time, zlib
+import pyarrow as pa, pyarrow.compute as pc
 from neo4j import GraphDatabase
 
-def load_lines(path):
-    with open(path, "rb") as f:
-        for line in f:
-            if line.strip():
-                yield orjson.loads(line)
+NODE_UPSERT = """
+UNWIND $rows AS n
+MERGE (x:Node {id:n.id})
+ON CREATE SET x.name=n.name, x.type=n.type, x.repo=n.repo
+ON MATCH  SET x.name=coalesce(x.name,n.name), x.type=coalesce(x.type,n.type), x.repo=coalesce(x.repo,n.repo)
+"""
+
+EDGE_UPSERT = """
+UNWIND $rows AS e
+MATCH (a:Node {id:e.src}), (b:Node {id:e.dst})
+MERGE (a)-[r:FLOWS_TO {op:e.op}]->(b)
+ON CREATE SET r.first_ts=e.ts, r.weight=e.weight
+ON MATCH  SET r.last_ts=e.ts
+"""
+
+def load_lines(pattern):
+    """Records of one file, or of every shard matching a glob (nodes*.jsonl), in name order."""
+    for path in sorted(glob.glob(pattern)) or [pattern]:
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+
+def read_arrow(path: str):
+    """Zero-copy view of an Arrow IPC file written by normalize.py --format arrow."""
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def arrow_rows(table, ids=None):
+    """Row dicts of nodes.arrow/edges.arrow; given `ids` (the nodes id column), edge src/dst row numbers become node ids."""
+    for b in table.to_batches():
+        if ids is not None:
+            b = pa.RecordBatch.from_arrays([pc.take(ids, b.column(0)), pc.take(ids, b.column(1))] + b.columns[2:],
+                                           names=b.schema.names)
+        yield from b.to_pylist()
+
+def records(nodes_path: str, edges_path: str):
+    """(node rows, edge rows) from JSONL files/shard globs, or from nodes.arrow/edges.arrow."""
+    if nodes_path.endswith(".arrow"):
+        nodes = read_arrow(nodes_path)
+        return arrow_rows(nodes), arrow_rows(read_arrow(edges_path), nodes.column("id").combine_chunks())
+    return load_lines(nodes_path), load_lines(edges_path)
+
+class Progress:
+    """Thread-safe row counter printing rows and rows/sec every `every` seconds."""
+    def __init__(self, what: str, every: float = 10.0):
+        self.what = what
+        self.every = every
+        self.rows = 0
+        self.attempts = 0
+        self.batches = 0
+        self.t0 = self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def attempt(self) -> None:
+        with self.lock:
+            self.attempts += 1
+
+    def add(self, n: int) -> None:
+        with self.lock:
+            self.rows += n
+            self.batches += 1
+            now = time.monotonic()
+            if now - self.last >= self.every:
+                self.last = now
+                print(f"[neo4j-loader] {self.what}: {self.rows} rows ({self.rows / (now - self.t0):.0f} rows/s)", flush=True)
+
+    def done(self) -> None:
+        secs = time.monotonic() - self.t0
+        retries = self.attempts - self.batches
+        print(f"[neo4j-loader] {self.what}: {self.rows} rows in {secs:.1f}s ({self.rows / max(secs, 1e-9):.0f} rows/s, "
+              f"{self.batches} batches, {retries} retried transactions)", flush=True)
+
+def write_batch(session, query: str, rows: list, progress: Progress) -> None:
+    def work(tx):
+        progress.attempt()  # called again on every retry
+        tx.run(query, rows=rows).consume()
+    session.execute_write(work)
+    progress.add(len(rows))
+
+def batches(rows, size: int):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def load(driver, rows, query: str, key, batch_size: int, workers: int, progress: Progress) -> None:
+    """Write `rows` in batches; with workers > 1, partition by zlib.crc32(key(row)) across worker threads."""
+    sort_key = lambda r: (key(r), r.get("dst", ""))
+    if workers <= 1:
+        with driver.session() as s:
+            for batch in batches(rows, batch_size):
+                batch.sort(key=sort_key)
+                write_batch(s, query, batch, progress)
+        progress.done()
+        return
+
+    queues = [queue.Queue(maxsize=4) for _ in range(workers)]  # bounded: the reader waits for slow partitions
+    errors = []
+
+    def worker(q: queue.Queue) -> None:
+        with driver.session() as s:
+            while True:
+                batch = q.get()
+                if batch is None:
+                    return
+                if errors:
+                    continue  # drain so the reader never blocks on a dead worker
+                try:
+                    batch.sort(key=sort_key)
+                    write_batch(s, query, batch, progress)
+                except Exception as e:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(q,), daemon=True) for q in queues]
+    for t in threads:
+        t.start()
+    pending = [[] for _ in range(workers)]
+    for r in rows:
+        if errors:
+            break
+        p = zlib.crc32(key(r).encode()) % workers
+        pending[p].append(r)
+        if len(pending[p]) >= batch_size:
+            queues[p].put(pending[p])
+            pending[p] = []
+    for p, q in enumerate(queues):
+        if pending[p] and not errors:
+            q.put(pending[p])
+        q.put(None)
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    progress.done()
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--nodes", required=True)
     ap.add_argument("--edges", required=True)
+    ap.add_argument("--batch-size", type=int, default=int(os.getenv("NEO4J_BATCH_SIZE", "5000")),
+                    help="Rows per UNWIND statement / transaction")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("NEO4J_LOAD_WORKERS", "4")),
+                    help="Parallel writers, partitioned by node id / edge source id (1 = sequential)")
     args = ap.parse_args()
     uri=os.getenv("NEO4J_URI","bolt://neo4j:7687"); user=os.getenv("NEO4J_USER","neo4j"); pwd=os.getenv("NEO4J_PASS","neo4j")
-    driver = GraphDatabase.driver(uri, auth=(user,pwd))
+    driver = GraphDatabase.driver(uri, auth=(user,pwd), max_transaction_retry_time=float(os.getenv("NEO4J_RETRY_SECONDS", "60")))
     with driver.session() as s:
         for stmt in open("/cypher/constraints.cypher").read().split(";"):
             stmt=stmt.strip()
             if stmt: s.run(stmt)
-        tx = s.begin_transaction()
-        i=0
-        for n in load_lines(args.nodes):
-            tx.run("""MERGE (x:Node {id:$id})
-                      ON CREATE SET x.name=$name, x.type=$type, x.repo=$repo
-                      ON MATCH  SET x.name=coalesce(x.name,$name), x.type=coalesce(x.type,$type), x.repo=coalesce(x.repo,$repo)
-                   """, **n)
-            i+=1
-            if i%1000==0: tx.commit(); tx=s.begin_transaction()
-        tx.commit()
-        tx = s.begin_transaction()
-        i=0
-        for e in load_lines(args.edges):
-            tx.run("""MATCH (a:Node {id:$src}), (b:Node {id:$dst})
-                      MERGE (a)-[r:FLOWS_TO {op:$op}]->(b)
-                      ON CREATE SET r.first_ts=$ts, r.weight=$weight
-                      ON MATCH  SET r.last_ts=$ts
-                   """, **e)
-            i+=1
-            if i%2000==0: tx.commit(); tx=s.begin_transaction()
-        tx.commit()
+    batch_size = max(1, args.batch_size)
+    # Nodes first: edges MATCH both endpoints
+    nodes, edges = records(args.nodes, args.edges)
+    load(driver, nodes, NODE_UPSERT, lambda n: n["id"], batch_size, args.workers, Progress("nodes"))
+    load(driver, edges, EDGE_UPSERT, lambda e: e["src"], batch_size, args.workers, Progress("edges"))
+    driver.close()
     print("Neo4j load complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Synthetic lineage graph generator: writes normalized nodes.jsonl/edges.jsonl
+(same schema the normalizer emits) at any scale, streaming, in O(1) memory.
+
+Shape:
+- Nodes sit in `--depth` layers (files -> datasets -> tables -> ... ->
+  dashboards); node i is in layer i * depth // nodes. Last-layer nodes are sinks.
+- Fan-out is power-law: a node's out-degree is a discrete Pareto draw with
+  exponent `--fan-out-exp`, scaled to average `--avg-degree`, capped at
+  `--max-degree`.
+- Fan-in is power-law: targets in a layer are picked by Zipf rank (in-degree
+  exponent `--fan-in-exp`), ranks scattered over the layer by a fixed permutation.
+  A repeated pick is drawn again, so a node's children are distinct.
+- Most edges go to the next layer, some skip ahead (`--skip`); a `--cycle-rate`
+  fraction point back to an earlier or the same layer, closing cycles.
+- `--diamond` is the chance that two consecutive children a, b of a node get an
+  extra edge b -> (a's first child) c, giving two paths to the same node. It is
+  only added when c is in a later layer than b and not already a child of b,
+  so diamonds never close a cycle: with `--cycle-rate 0` the graph is a DAG.
+
+Every draw is a hash of (seed, node, draw number), so the output is a pure
+function of the arguments: the same seed gives byte-identical files, and no
+per-node state is kept. IDs are SHA-1 of the name, as in the normalizer.
+
+    python3 scripts/gen_synthetic.py --nodes 1000000 --avg-degree 10 --out data/normalized
+"""
+import argparse, glob, hashlib, math, os, sys, time
+
+MASK = (1 << 64) - 1
+TYPES = ("file", "dataset", "table", "view", "model", "report", "dashboard")
+OPS = ("write", "transform", "join", "aggregate", "serve")
+PERM_PRIME = 2147483647  # rank -> position permutation within a layer
+TS0 = 1700000000
+U53 = 1.0 / (1 << 53)
+U32 = 1.0 / (1 << 32)
+
+def _mix(z: int) -> int:
+    """splitmix64 finalizer."""
+    z = (z + 0x9E3779B97F4A7C15) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+class Generator:
+    def __init__(self, nodes: int, depth: int, avg_degree: float, max_degree: int, fan_out_exp: float,
+                 fan_in_exp: float, skip: float, cycle_rate: float, diamond: float, repos: int, seed: int):
+        if nodes < depth or depth < 2:
+            raise ValueError("need depth >= 2 and at least one node per layer")
+        self.n, self.depth = nodes, depth
+        self.max_degree = max_degree
+        self.skip, self.cycle_rate, self.diamond = skip, cycle_rate, diamond
+        self.repos = max(1, repos)
+        self.seed = _mix(seed)
+        # Pareto tail index a = exponent - 1; mean of floor(xm * U^(-1/a)) is about a*xm/(a-1) - 1/2
+        self.alpha = max(1.05, fan_out_exp - 1)
+        self.xm = (avg_degree + 0.5) * (self.alpha - 1) / self.alpha if self.alpha > 1 else avg_degree
+        # Zipf rank exponent s for in-degree exponent g: s = 1 / (g - 1)
+        self.s = 1 / max(1.05, fan_in_exp - 1)
+
+    # ---- deterministic draws ----
+    # draw kinds, so draws for different purposes never share a key
+    DEGREE, TARGET, SPAN, DIAMOND, EDGE = range(5)
+
+    def _z(self, node: int, what: int, j: int = 0) -> int:
+        """64 random bits for (node, what, j)."""
+        return _mix(self.seed ^ ((node * 0x9E3779B97F4A7C15 + j * 0xC2B2AE3D27D4EB4F + what) & MASK))
+
+    def _u(self, node: int, what: int, j: int = 0) -> float:
+        return (self._z(node, what, j) >> 11) * U53
+
+    def layer(self, i: int) -> int:
+        return i * self.depth // self.n
+
+    def layer_start(self, l: int) -> int:
+        return -(-l * self.n // self.depth)  # ceil(l * n / depth)
+
+    def name(self, i: int) -> str:
+        l = self.layer(i)
+        t = TYPES[l * len(TYPES) // self.depth]
+        return f"{t}://repo{i % self.repos}/l{l}/n{i}"
+
+    def node_id(self, i: int) -> str:
+        return hashlib.sha1(self.name(i).encode()).hexdigest()
+
+    def out_degree(self, i: int) -> int:
+        if self.layer(i) == self.depth - 1:
+            return 0
+        d = int(self.xm * (1.0 - self._u(i, self.DEGREE)) ** (-1 / self.alpha))
+        return min(self.max_degree, d)
+
+    def _pick(self, l: int, u: float) -> int:
+        """A node of layer l, by Zipf rank drawn from u."""
+        lo, hi = self.layer_start(l), self.layer_start(l + 1)
+        size = hi - lo
+        if abs(1 - self.s) < 1e-9:
+            r = size ** u
+        else:
+            r = ((size ** (1 - self.s) - 1) * u + 1) ** (1 / (1 - self.s))
+        rank = min(size - 1, int(r) - 1)
+        return lo + (rank * PERM_PRIME) % size
+
+    def target(self, i: int, j: int) -> int:
+        """Target of node i's j-th draw; children() skips repeats."""
+        l = self.layer(i)
+        z = self._z(i, self.TARGET, j)
+        pick = (z >> 32) * U32
+        if (z & 0xFFFFFFFF) * U32 < self.cycle_rate:
+            return self._pick(int(self._u(i, self.SPAN, j) * (l + 1)), pick)
+        span = 1
+        if self.skip > 0:
+            # geometric: each further layer with probability `skip`
+            u = 1.0 - self._u(i, self.SPAN, j)
+            span += int(math.log(u) / math.log(self.skip)) if self.skip < 1 else self.depth
+        return self._pick(min(l + span, self.depth - 1), pick)
+
+    def children(self, i: int) -> list:
+        """Distinct children of node i, in draw order. Repeated picks are drawn again, up to 4x out_degree(i)
+        draws in all, so a degree close to the size of the target layers can come out a little short."""
+        deg = self.out_degree(i)
+        kids, seen, j = [], set(), 0
+        while len(kids) < deg and j < 4 * deg:
+            v = self.target(i, j)
+            j += 1
+            if v not in seen:
+                seen.add(v)
+                kids.append(v)
+        return kids
+
+    # ---- output ----
+    # Lines are formatted directly: every field is generated here and needs no JSON escaping
+    def node_line(self, i: int) -> str:
+        name = self.name(i)
+        t = TYPES[self.layer(i) * len(TYPES) // self.depth]
+        return f'{{"id":"{hashlib.sha1(name.encode()).hexdigest()}","name":"{name}","type":"{t}","repo":"repo{i % self.repos}"}}\n'
+
+    def edge_line(self, src_id: str, u: int, v: int, k: int) -> str:
+        z = self._z(u, self.EDGE, k)
+        return (f'{{"src":"{src_id}","dst":"{self.node_id(v)}","op":"{OPS[(z >> 32) % len(OPS)]}",'
+                f'"ts":{TS0 + (z & 0xFFFFFFFF) % (86400 * 30)},"weight":1.0}}\n')
+
+    def edges(self):
+        """(u, v) pairs in node order: each node's children, then its diamond-closing edges."""
+        for i in range(self.n):
+            kids = self.children(i)
+            for v in kids:
+                yield i, v
+            if self.diamond <= 0:
+                continue
+            for j in range(1, len(kids)):
+                a, b = kids[j - 1], kids[j]
+                if self._u(i, self.DIAMOND, j) < self.diamond and self.out_degree(a) > 0:
+                    c = self.target(a, 0)  # a's first child: the first draw is never a repeat
+                    if self.layer(b) < self.layer(c) and c not in self.children(b):
+                        yield b, c
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Write a synthetic normalized lineage graph")
+    ap.add_argument("--out", default="data/normalized", help="Directory for nodes.jsonl and edges.jsonl")
+    ap.add_argument("--nodes", type=int, default=100000)
+    ap.add_argument("--depth", type=int, default=12, help="Layers (longest forward path has depth - 1 edges)")
+    ap.add_argument("--avg-degree", type=float, default=5.0, help="Mean out-degree of non-sink nodes")
+    ap.add_argument("--max-degree", type=int, default=5000)
+    ap.add_argument("--fan-out-exp", type=float, default=2.5, help="Power-law exponent of the out-degree distribution")
+    ap.add_argument("--fan-in-exp", type=float, default=2.2, help="Power-law exponent of the in-degree distribution")
+    ap.add_argument("--skip", type=float, default=0.15, help="Chance an edge skips one more layer ahead")
+    ap.add_argument("--cycle-rate", type=float, default=0.0001, help="Fraction of edges pointing back (cycles)")
+    ap.add_argument("--diamond", type=float, default=0.1, help="Chance that consecutive children get a diamond-closing edge")
+    ap.add_argument("--repos", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    g = Generator(args.nodes, args.depth, args.avg_degree, args.max_degree, args.fan_out_exp, args.fan_in_exp,
+                  args.skip, args.cycle_rate, args.diamond, args.repos, args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    # earlier outputs (Arrow files, normalizer shards) would be loaded alongside or instead of the files written here
+    for pat in ("nodes-*.jsonl", "edges-*.jsonl", "nodes.arrow", "edges.arrow"):
+        for stale in glob.glob(os.path.join(args.out, pat)):
+            os.remove(stale)
+    t0 = time.monotonic()
+    with open(os.path.join(args.out, "nodes.jsonl"), "w") as f:
+        for i in range(g.n):
+            f.write(g.node_line(i))
+    ne = 0
+    with open(os.path.join(args.out, "edges.jsonl"), "w") as f:
+        last, src_id = -1, ""
+        for k, (u, v) in enumerate(g.edges()):
+            if u != last:
+                last, src_id = u, g.node_id(u)
+            f.write(g.edge_line(src_id, u, v, k))
+            ne += 1
+            if ne % 1000000 == 0:
+                print(f"[gen] {ne} edges ({ne / (time.monotonic() - t0):.0f}/s)", file=sys.stderr)
+    print(f"Wrote {g.n} nodes and {ne} edges to {args.out} in {time.monotonic() - t0:.1f}s (seed {args.seed})")
+
+if __name__ == "__main__":
+    main()
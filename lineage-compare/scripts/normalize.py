@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Normalizer: scanner outputs under --in -> normalized nodes/edges under --out.
+
+Streams every input, so neither a single file nor the whole input set has
+to fit in memory:
+
+- *.json files may hold one record, an array of records (read element by
+  element), or several concatenated records or arrays; *.jsonl / *.ndjson hold one
+  record per line.
+- Files are parsed in parallel (--workers processes). Each worker writes its
+  file's nodes and edges to a private SQLite file; the main process merges
+  those, in path order, into the state database (--state, SQLite on disk).
+  Primary keys do the deduplication: a node is kept once per id (the first
+  non-null type/repo wins), an edge once per (src, dst, op) with the
+  earliest ts.
+- A file that fails to parse is skipped as a whole, as before.
+- The state database records which files were merged. With --incremental
+  only files not seen before are parsed and merged on top of it; if a
+  merged file changed size/mtime or was removed, its old rows cannot be
+  told apart, so the state is rebuilt from scratch, as it is without
+  --incremental.
+- Output is written from the state database in id order, into --shards
+  files per kind: nodes.jsonl/edges.jsonl for one shard, else
+  nodes-00000.jsonl ... with nodes sharded by a hash of the id and edges by a
+  hash of the source id (the same partitioning the Neo4j loader uses).
+- --format arrow writes nodes.arrow/edges.arrow instead (Arrow IPC files,
+  memory-mappable): nodes in id order, so a node's row number is its
+  integer id, and edges with int32 src/dst columns of those row numbers.
+  --format both writes both.
+
+Only the standard library is needed, except pyarrow for --format arrow.
+
+    python3 scripts/normalize.py --in data/input --out data/normalized --workers 8 --shards 4
+"""
+import argparse, hashlib, json, os, sqlite3, sys, time, zlib
+from multiprocessing import Pool
+from pathlib import Path
+
+CHUNK = 1 << 20
+BATCH = 10000
+PATTERNS = ("*.json", "*.jsonl", "*.ndjson")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes(id TEXT PRIMARY KEY, name TEXT, type TEXT, repo TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS edges(src TEXT, dst TEXT, op TEXT, ts, weight REAL, PRIMARY KEY(src, dst, op)) WITHOUT ROWID;
+"""
+STATE_SCHEMA = SCHEMA + """
+CREATE TABLE IF NOT EXISTS files(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, edges INTEGER, merged_at REAL);
+"""
+NODE_UPSERT = """ON CONFLICT(id) DO UPDATE SET type=coalesce(nodes.type, excluded.type), repo=coalesce(nodes.repo, excluded.repo)"""
+EDGE_UPSERT = """ON CONFLICT(src, dst, op) DO UPDATE SET ts=min(edges.ts, excluded.ts)"""
+
+def nid(s: str) -> str:
+    return hashlib.sha1(s.encode()).hexdigest()
+
+def iter_json(path: Path):
+    """Top-level JSON values of a file, streamed; the elements of each top-level array are yielded one by one."""
+    dec = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+        in_array = None
+
+        def fill() -> bool:
+            nonlocal buf, pos, eof
+            more = f.read(CHUNK)
+            if not more:
+                eof = True
+                return False
+            buf = buf[pos:] + more
+            pos = 0
+            return True
+
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ",")):
+                pos += 1
+            if pos >= len(buf):
+                if fill():
+                    continue
+                if in_array:
+                    raise ValueError("unterminated array")
+                return
+            if in_array is None:
+                in_array = buf[pos] == "["
+                if in_array:
+                    pos += 1
+                    continue
+            if in_array and buf[pos] == "]":
+                pos += 1
+                in_array = None  # a later value or array starts afresh
+                continue
+            try:
+                value, end = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not eof and fill():
+                    continue
+                raise
+            if end == len(buf) and not eof and fill():
+                continue  # a number cut at the buffer edge would decode short; re-read with more data
+            pos = end
+            yield value
+
+def iter_records(path: Path):
+    for value in iter_json(path):
+        if isinstance(value, list):  # several arrays, or an array on one NDJSON line
+            yield from (v for v in value if isinstance(v, dict))
+        elif isinstance(value, dict):
+            yield value
+
+def sql_value(v):
+    """v as a value SQLite can bind: integers beyond 64 bits become strings, lists/dicts JSON text."""
+    if v is None or isinstance(v, (str, float)):
+        return v
+    if isinstance(v, int):
+        return v if -2 ** 63 <= v < 2 ** 63 else str(v)
+    return json.dumps(v, ensure_ascii=False, sort_keys=True)
+
+def parse_file(job):
+    """Worker: one input file -> a private SQLite part. Returns (rel, part path or None, edges, error)."""
+    path, rel, tmpdir = job
+    part = os.path.join(tmpdir, f"part-{os.getpid()}-{zlib.crc32(rel.encode()):08x}.sqlite")
+    if os.path.exists(part):
+        os.remove(part)
+    db = sqlite3.connect(part)
+    db.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+    nodes, edges, n_edges = [], [], 0
+
+    def flush():
+        db.executemany("INSERT INTO nodes VALUES (?,?,?,?) " + NODE_UPSERT, nodes)
+        db.executemany("INSERT INTO edges VALUES (?,?,?,?,?) " + EDGE_UPSERT, edges)
+        nodes.clear()
+        edges.clear()
+
+    try:
+        for rec in iter_records(Path(path)):
+            src = str(rec.get("source") or rec.get("src") or rec.get("from") or rec.get("input") or "")
+            dst = str(rec.get("target") or rec.get("dst") or rec.get("to") or rec.get("output") or "")
+            if not src or not dst:
+                continue
+            op = rec.get("op") or rec.get("operation") or "flow"
+            repo = sql_value(rec.get("repo") or rec.get("repository"))
+            ts = sql_value(rec.get("ts") or rec.get("timestamp") or time.time())
+            s_id, d_id = nid(src), nid(dst)
+            nodes.append((s_id, src, sql_value(rec.get("src_type")), repo))
+            nodes.append((d_id, dst, sql_value(rec.get("dst_type")), repo))
+            edges.append((s_id, d_id, str(op), ts, 1.0))
+            n_edges += 1
+            if len(edges) >= BATCH:
+                flush()
+        flush()
+        db.commit()
+        db.close()
+        return rel, part, n_edges, None
+    except Exception as e:
+        db.close()
+        os.remove(part)
+        return rel, None, 0, f"{type(e).__name__}: {e}"
+
+def open_state(path: str, fresh: bool) -> sqlite3.Connection:
+    if fresh:
+        for p in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(p):
+                os.remove(p)
+    db = sqlite3.connect(path, isolation_level=None)
+    db.executescript("PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA cache_size=-262144;" + STATE_SCHEMA)
+    return db
+
+def merge(db: sqlite3.Connection, rel: str, part: str, size: int, mtime_ns: int, n_edges: int) -> None:
+    """Fold one part into the state and record the file, in one transaction."""
+    db.execute("ATTACH DATABASE ? AS part", (part,))
+    try:
+        db.execute("BEGIN")
+        db.execute("INSERT INTO main.nodes SELECT * FROM part.nodes WHERE true " + NODE_UPSERT)
+        db.execute("INSERT INTO main.edges SELECT * FROM part.edges WHERE true " + EDGE_UPSERT)
+        db.execute("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?)", (rel, size, mtime_ns, n_edges, time.time()))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    finally:
+        db.execute("DETACH DATABASE part")
+    os.remove(part)
+
+def pending_files(root: Path, db: sqlite3.Connection):
+    """(path, rel, size, mtime_ns) of inputs not yet merged with their current size/mtime, in path order; the input
+    count; and the merged files that have since changed or been removed."""
+    seen = {r[0]: (r[1], r[2]) for r in db.execute("SELECT path, size, mtime_ns FROM files")}
+    paths = sorted({p for pat in PATTERNS for p in root.rglob(pat) if p.is_file()})
+    out, present = [], set()
+    for p in paths:
+        st = p.stat()
+        rel = p.relative_to(root).as_posix()
+        present.add(rel)
+        if seen.get(rel) != (st.st_size, st.st_mtime_ns):
+            out.append((str(p), rel, st.st_size, st.st_mtime_ns))
+    stale = sorted(rel for rel in seen if rel not in present or rel in {r for _, r, _, _ in out})
+    return out, len(paths), stale
+
+def shard_name(kind: str, i: int, shards: int) -> str:
+    return f"{kind}.jsonl" if shards == 1 else f"{kind}-{i:05d}.jsonl"
+
+def write_shards(db: sqlite3.Connection, out: Path, shards: int) -> tuple:
+    """nodes*/edges*.jsonl from the state, written as .tmp files; returns (names, nodes, edges)."""
+    dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    counts = {}
+    written = []
+    for kind, query in (
+        ("nodes", "SELECT id, name, coalesce(type, 'entity'), repo FROM nodes ORDER BY id"),
+        ("edges", "SELECT src, dst, op, ts, weight FROM edges ORDER BY src, dst, op"),
+    ):
+        names = [shard_name(kind, i, shards) for i in range(shards)]
+        files = [open(out / (n + ".tmp"), "w", encoding="utf-8") for n in names]
+        n = 0
+        try:
+            for row in db.execute(query):
+                if kind == "nodes":
+                    rec = {"id": row[0], "name": row[1], "type": row[2], "repo": row[3]}
+                else:
+                    rec = {"src": row[0], "dst": row[1], "op": row[2], "ts": row[3], "weight": row[4]}
+                # first column: node id / edge source id
+                f = files[zlib.crc32(row[0].encode()) % shards] if shards > 1 else files[0]
+                f.write(dumps(rec) + "\n")
+                n += 1
+        finally:
+            for f in files:
+                f.close()
+        counts[kind] = n
+        written += names
+    return written, counts["nodes"], counts["edges"]
+
+def write_arrow(db: sqlite3.Connection, out: Path, batch: int = 65536) -> tuple:
+    """nodes.arrow/edges.arrow (Arrow IPC files) from the state, written as .tmp files; returns (names, nodes, edges).
+
+    Row i of nodes.arrow is node i; edges.arrow holds src/dst as int32 row
+    numbers into it, sorted by source. ts is int64 or float64 when every
+    edge's ts is numeric, else a string.
+    """
+    import pyarrow as pa  # only needed for this format
+
+    db.execute("DROP TABLE IF EXISTS temp.ix")
+    db.execute("CREATE TEMP TABLE ix(n INTEGER PRIMARY KEY, id TEXT UNIQUE)")
+    db.execute("INSERT INTO ix(id) SELECT id FROM nodes ORDER BY id")
+    n_nodes = db.execute("SELECT count(*) FROM ix").fetchone()[0]
+    if n_nodes >= 2 ** 31:
+        raise ValueError(f"{n_nodes} nodes do not fit int32 node ids")
+    kinds = {r[0] for r in db.execute("SELECT DISTINCT typeof(ts) FROM edges")}
+    ts_type, ts_sql = ((pa.int64(), "e.ts") if kinds <= {"integer"} else
+                       (pa.float64(), "e.ts") if kinds <= {"integer", "real"} else
+                       (pa.string(), "CAST(e.ts AS TEXT)"))
+    meta = {"format": "lineage-normalized", "version": "1"}
+    parts = (
+        ("nodes.arrow", pa.schema([("id", pa.string()), ("name", pa.string()), ("type", pa.string()), ("repo", pa.string())], metadata=meta),
+         "SELECT n.id, n.name, coalesce(n.type, 'entity'), n.repo FROM ix JOIN nodes n ON n.id = ix.id ORDER BY ix.n"),
+        ("edges.arrow", pa.schema([("src", pa.int32()), ("dst", pa.int32()), ("op", pa.string()), ("ts", ts_type), ("weight", pa.float64())], metadata=meta),
+         f"SELECT a.n - 1, b.n - 1, e.op, {ts_sql}, e.weight FROM edges e JOIN ix a ON a.id = e.src JOIN ix b ON b.id = e.dst "
+         "ORDER BY e.src, e.dst, e.op"),
+    )
+    counts = []
+    for name, schema, query in parts:
+        n = 0
+        cur = db.execute(query)
+        with pa.OSFile(str(out / (name + ".tmp")), "wb") as sink, pa.ipc.new_file(sink, schema) as w:
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                cols = list(zip(*rows))
+                w.write_batch(pa.record_batch([pa.array(c, type=f.type) for c, f in zip(cols, schema)], schema=schema))
+                n += len(rows)
+        counts.append(n)
+    db.execute("DROP TABLE temp.ix")
+    return [name for name, _, _ in parts], counts[0], counts[1]
+
+OUTPUTS = ("nodes*.jsonl", "edges*.jsonl", "nodes.arrow", "edges.arrow")
+
+def swap_in(out: Path, written: list) -> None:
+    """Replace the outputs with the .tmp files just written; outputs of formats not written this run are removed."""
+    for stale in {p for pat in OUTPUTS for p in out.glob(pat)}:
+        if stale.name not in written:
+            stale.unlink()
+    for name in written:
+        os.replace(out / (name + ".tmp"), out / name)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Normalize scanner outputs into nodes/edges JSONL or Arrow")
+    ap.add_argument("--in", dest="inp", default=os.getenv("INPUT_ROOT", "data/input"))
+    ap.add_argument("--out", default=os.getenv("NORMALIZED_ROOT", "data/normalized"))
+    ap.add_argument("--state", default=None, help="State database (default: <out>/.normalize.sqlite)")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("NORMALIZE_WORKERS", str(os.cpu_count() or 1))))
+    ap.add_argument("--shards", type=int, default=int(os.getenv("NORMALIZE_SHARDS", "1")), help="JSONL output files per kind")
+    ap.add_argument("--format", choices=("jsonl", "arrow", "both"), default=os.getenv("NORMALIZE_FORMAT", "jsonl"),
+                    help="jsonl, arrow (nodes.arrow/edges.arrow with int32 node ids; needs pyarrow), or both")
+    ap.add_argument("--incremental", action="store_true", default=os.getenv("NORMALIZE_INCREMENTAL", "0") == "1",
+                    help="Only parse input files added since the last run (a changed or removed file forces a full rebuild)")
+    args = ap.parse_args()
+
+    root, out = Path(args.inp), Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    state = args.state or str(out / ".normalize.sqlite")
+    db = open_state(state, fresh=not args.incremental)
+    todo, total, stale = pending_files(root, db)
+    if args.incremental and stale:
+        # the state does not record which file a row came from, so a changed or removed file means a rebuild
+        print(f"[incremental] {len(stale)} merged input files changed or removed (e.g. {stale[0]}); rebuilding", flush=True)
+        db.close()
+        db = open_state(state, fresh=True)
+        todo, total, _ = pending_files(root, db)
+    elif args.incremental:
+        print(f"[incremental] {len(todo)} new input files, {total - len(todo)} already merged", flush=True)
+    tmpdir = state + ".parts"
+    os.makedirs(tmpdir, exist_ok=True)
+    t0 = time.monotonic()
+    meta = {rel: (size, mtime) for _, rel, size, mtime in todo}
+    jobs = [(p, rel, tmpdir) for p, rel, _, _ in todo]
+    done = failed = edges_in = 0
+    with Pool(max(1, args.workers)) as pool:
+        # imap keeps path order, so merges (and first-wins attributes) don't depend on worker timing
+        for rel, part, n_edges, err in pool.imap(parse_file, jobs):
+            if err:
+                failed += 1
+                print(f"[WARN] skip {rel}: {err}", file=sys.stderr)
+                continue
+            merge(db, rel, part, *meta[rel], n_edges)
+            done += 1
+            edges_in += n_edges
+            if done % 100 == 0:
+                print(f"[normalize] merged {done}/{len(jobs)} files ({edges_in} edge records)", flush=True)
+    os.rmdir(tmpdir)
+    written = []
+    if args.format in ("jsonl", "both"):
+        names, n_nodes, n_edges = write_shards(db, out, max(1, args.shards))
+        written += names
+    if args.format in ("arrow", "both"):
+        names, n_nodes, n_edges = write_arrow(db, out)
+        written += names
+    swap_in(out, written)
+    db.close()
+    print(f"Wrote {n_nodes} nodes and {n_edges} edges to {out} as {', '.join(written)} "
+          f"({done} files parsed, {failed} skipped, {edges_in} edge records, {time.monotonic() - t0:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -29,5 +29,27 @@ CREATE QUERY getSinks(SET<STRING> srcIds) SYNTAX v2 {
   PRINT @@sinks AS sinks;
 }
 INSTALL QUERY getSinks
+CREATE QUERY getEdgePage(INT part, INT parts) SYNTAX v2 {
+  ListAccum<STRING> @@edges;
+  SELECT t FROM Node:s -(FLOWS_TO:e)-> Node:t
+    WHERE getvid(s) % parts == part
+    ACCUM @@edges += s.id + "|" + t.id;
+  PRINT @@edges AS edges;
+}
+INSTALL QUERY getEdgePage
+CREATE QUERY benchReach(VERTEX<Node> src, INT maxDepth) SYNTAX v2 {
+  OrAccum @visited;
+  SumAccum<INT> @@reachable, @@sinks;
+  Frontier = {src};
+  Frontier = SELECT s FROM Frontier:s ACCUM s.@visited += TRUE;
+  WHILE Frontier.size() > 0 LIMIT maxDepth DO
+    Frontier = SELECT t FROM Frontier:s -(FLOWS_TO:e)-> Node:t
+      WHERE t.@visited == FALSE
+      POST-ACCUM t.@visited += TRUE, @@reachable += 1,
+                 IF t.outdegree("FLOWS_TO") == 0 THEN @@sinks += 1 END;
+  END;
+  PRINT @@reachable AS reachable, @@sinks AS sinks;
+}
+INSTALL QUERY benchReach
 GSQL'
 echo "[tg_bootstrap] Done."
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+import pytest
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "compare"))  # the image copies compare/*.py flat into /app
+import lineage_bench as B
+
+# a -> b -> c -> d, a -> e; d and e are sinks
+EDGES = [("a", "b"), ("b", "c"), ("c", "d"), ("a", "e")]
+
+def test_memory_backend_answers_every_kind():
+    m = B.MemoryBackend(EDGES, max_depth=2, k=1)
+    assert m.query("reachability", "a") == 3  # b, e, c
+    assert m.query("khop", "a") == 2
+    assert m.query("impact", "a") == 4
+    assert m.query("sinks", "a") == 2
+    assert m.sources(10) == ["a", "b", "c"]
+
+def test_parse_mix_and_make_ops():
+    mix = B.parse_mix("reachability=3, sinks")
+    assert mix == {"reachability": 3.0, "sinks": 1.0}
+    with pytest.raises(ValueError):
+        B.parse_mix("shortest=1")
+    with pytest.raises(ValueError):
+        B.parse_mix("sinks=0")
+    ops = B.make_ops(["a", "b"], mix, 50, seed=1)
+    assert ops == B.make_ops(["a", "b"], mix, 50, seed=1)  # seeded: every backend replays the same sequence
+    assert {k for k, _ in ops} == {"reachability", "sinks"} and {s for _, s in ops} <= {"a", "b"}
+
+def test_run_benchmark_rows_per_backend_level_phase_and_kind():
+    backends = [B.MemoryBackend(EDGES, name="m1"), B.MemoryBackend(EDGES, name="m2", cold_ms=1)]
+    ops = B.make_ops(["a", "b", "c"], B.parse_mix(B.DEFAULT_MIX), 40, seed=0)
+    rows = B.run_benchmark(backends, ops, [1, 4])
+    kinds = sorted({k for k, _ in ops}) + ["all"]
+    assert len(rows) == 2 * 2 * 2 * len(kinds)
+    assert {(r.backend, r.phase, r.concurrency) for r in rows} == {(b, p, c) for b in ("m1", "m2") for p in ("cold", "warm") for c in (1, 4)}
+    for r in rows:
+        assert r.errors == 0 and r.qps > 0 and r.p50_ms <= r.p95_ms <= r.p99_ms
+        if r.kind == "all":
+            assert r.ops == len(ops)
+
+def test_summarize_counts_errors_and_nearest_rank_percentiles():
+    samples = [("sinks", float(ms), True) for ms in range(1, 101)] + [("sinks", 999.0, False)]
+    all_row = B.summarize("m", "warm", 1, samples, wall=2.0)[-1]
+    assert (all_row.kind, all_row.ops, all_row.errors) == ("all", 101, 1)
+    assert (all_row.p50_ms, all_row.p95_ms, all_row.p99_ms, all_row.qps) == (50.0, 95.0, 99.0, 50.0)
@@ -0,0 +1,37 @@
+import json, os, subprocess, sys
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "normalize.py"
+
+def run(inp: Path, out: Path, *extra):
+    subprocess.run([sys.executable, str(SCRIPT), "--in", str(inp), "--out", str(out), "--workers", "1", *extra],
+                   check=True, capture_output=True)
+    nodes = {r["id"]: r for r in map(json.loads, (out / "nodes.jsonl").read_text().splitlines())}
+    return {(nodes[e["src"]]["name"], nodes[e["dst"]]["name"]) for e in map(json.loads, (out / "edges.jsonl").read_text().splitlines())}
+
+def write(path: Path, lines, mtime_ns):
+    path.write_text("".join(json.dumps(r) + "\n" for r in lines))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_incremental_rebuilds_when_a_merged_file_changes_or_goes(tmp_path):
+    inp, out = tmp_path / "in", tmp_path / "out"
+    inp.mkdir()
+    write(inp / "f.jsonl", [{"src": "a", "dst": "b"}, {"src": "b", "dst": "c"}], 10 ** 18)
+    write(inp / "g.jsonl", [{"src": "x", "dst": "y"}], 10 ** 18)
+    assert run(inp, out) == {("a", "b"), ("b", "c"), ("x", "y")}
+    write(inp / "h.jsonl", [{"src": "m", "dst": "n"}], 10 ** 18)
+    assert run(inp, out, "--incremental") == {("a", "b"), ("b", "c"), ("x", "y"), ("m", "n")}
+    write(inp / "f.jsonl", [{"src": "q", "dst": "r"}], 2 * 10 ** 18)
+    assert run(inp, out, "--incremental") == run(inp, tmp_path / "full") == {("q", "r"), ("x", "y"), ("m", "n")}
+    (inp / "g.jsonl").unlink()
+    assert run(inp, out, "--incremental") == {("q", "r"), ("m", "n")}
+
+def test_unbindable_values_are_kept_as_text(tmp_path):
+    inp, out = tmp_path / "in", tmp_path / "out"
+    inp.mkdir()
+    (inp / "f.jsonl").write_text(json.dumps({"src": "a", "dst": "b", "ts": 2 ** 70, "repo": ["r1", "r2"], "src_type": {"k": 1}}) + "\n")
+    assert run(inp, out) == {("a", "b")}
+    edge = json.loads((out / "edges.jsonl").read_text())
+    assert edge["ts"] == str(2 ** 70)
+    nodes = {r["name"]: r for r in map(json.loads, (out / "nodes.jsonl").read_text().splitlines())}
+    assert nodes["a"]["repo"] == '["r1", "r2"]' and nodes["a"]["type"] == '{"k": 1}'
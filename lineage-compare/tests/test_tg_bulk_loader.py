@@ -0,0 +1,78 @@
+import importlib.util, json, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import pytest
+
+# loaders/*/loader.py share a module name; load the TigerGraph one under its own
+_spec = importlib.util.spec_from_file_location("tg_loader", Path(__file__).resolve().parents[1] / "loaders" / "tigergraph" / "loader.py")
+loader = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(loader)
+
+class StubRESTPP(BaseHTTPRequestHandler):
+    """POST /graph/{graph}: every 3rd call answers 503; otherwise accepts and counts the payload."""
+    calls = 0
+    lock = threading.Lock()
+    vertices: dict = {}
+    edges: set = set()
+    reject = False
+
+    def log_message(self, *a):
+        pass
+
+    def _reply(self, code, body=None):
+        out = json.dumps(body).encode() if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert self.path == "/graph/G" and self.headers["Authorization"] == "Bearer tok"
+        cls = type(self)
+        with cls.lock:
+            cls.calls += 1
+            n = cls.calls
+        if cls.reject:
+            return self._reply(200, {"error": True, "message": "bad attribute"})
+        if n % 3 == 0:
+            return self._reply(503)
+        av = ae = 0
+        with cls.lock:
+            for vid, attrs in body.get("vertices", {}).get("Node", {}).items():
+                cls.vertices[vid] = attrs
+                av += 1
+            for src, out in body.get("edges", {}).get("Node", {}).items():
+                for dst in out["FLOWS_TO"]["Node"]:
+                    cls.edges.add((src, dst))
+                    ae += 1
+        self._reply(200, {"error": False, "results": [{"accepted_vertices": av, "accepted_edges": ae}]})
+
+@pytest.fixture
+def stub():
+    handler = type("Handler", (StubRESTPP,), {"vertices": {}, "edges": set(), "calls": 0})
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}", handler
+    srv.shutdown()
+    srv.server_close()
+
+def test_bulk_upsert_retries_503_and_counts_accepted(stub):
+    url, h = stub
+    nodes = [{"id": f"n{i}", "name": f"x{i}", "type": "table", "repo": None} for i in range(50)]
+    edges = [{"src": f"n{i}", "dst": f"n{i + 1}", "op": "copy"} for i in range(49)]
+    up = loader.BulkUpserter(url, "G", "tok", concurrency=4, retries=3, backoff=0.01)
+    v = up.run(loader.batches(nodes, 7), loader.vertex_payload, "vertices")
+    e = up.run(loader.batches(edges, 7), loader.edge_payload, "edges")
+    assert (v["rows"], v["vertices"], e["rows"], e["edges"]) == (50, 50, 49, 49)
+    assert up.retried > 0  # every 3rd request was a 503
+    assert set(h.vertices) == {n["id"] for n in nodes} and "repo" not in h.vertices["n0"]
+    assert h.edges == {(x["src"], x["dst"]) for x in edges}
+
+def test_rejected_payload_fails_without_retrying(stub):
+    url, h = stub
+    h.reject = True
+    up = loader.BulkUpserter(url, "G", "tok", concurrency=2, retries=5, backoff=0.01)
+    with pytest.raises(loader.UpsertError, match="bad attribute"):
+        up.run(loader.batches([{"id": "a"}], 1), loader.vertex_payload, "vertices")
+    assert h.calls == 1 and up.retried == 0
@@ -1,14 +1,66 @@
-import os
-from fastapi import FastAPI, Query
+import os, re, time, asyncio
+from typing import List, Optional
+import orjson
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from neo4j import GraphDatabase
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field
+from neo4j import AsyncGraphDatabase
 from dotenv import load_dotenv
+import lineage_queries as Q
+from lineage_graph import GraphSnapshot, load_snapshot, refresh_snapshot
+from lineage_reach import ReachIndex
+from lineage_summary import summarize
+from lineage_layout import layered_positions
+from lineage_expand import ExpansionCache, decode_cursor, encode_cursor, page as expand_page
+from lineage_metrics import (LatencyMiddleware, SlowLog, Trace, note_engine, note_query, observe, pool_stats,
+                             summarize_profile, total_db_hits, traced_body, update_pool_metrics)
+from lineage_wire import StreamCompressor, compress, encode_compact, negotiate
+from lineage_cache import CacheEntry, GraphVersion, LineageCache, StreamFlight, drain, etag_matches, make_etag
 
 load_dotenv()
 
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASS = os.getenv("NEO4J_PASS", "password")
+CACHE_MAX_BYTES = int(os.getenv("LINEAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 0 disables
+CACHE_TTL = float(os.getenv("LINEAGE_CACHE_TTL", "300"))
+GRAPH_VERSION_POLL = float(os.getenv("GRAPH_VERSION_POLL", "5"))
+# Bolt pool tuning: one async event loop multiplexes many requests over the pool
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "10"))
+NEO4J_CONN_LIFETIME = float(os.getenv("NEO4J_MAX_CONN_LIFETIME", "3600"))
+NEO4J_LIVENESS_CHECK = float(os.getenv("NEO4J_LIVENESS_CHECK", "30"))
+NEO4J_FETCH_SIZE = int(os.getenv("NEO4J_FETCH_SIZE", "1000"))
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", "65536"))
+COMPRESS_MIN_BYTES = int(os.getenv("LINEAGE_COMPRESS_MIN_BYTES", "1024"))
+# traversal=subgraph: compact tuples + batched hydration of `fields`
+DEFAULT_TRAVERSAL = os.getenv("LINEAGE_TRAVERSAL", "paths")
+DEFAULT_FIELDS = tuple(f for f in os.getenv("LINEAGE_DEFAULT_FIELDS", "name,op").split(",") if f)
+HYDRATE_BATCH = int(os.getenv("LINEAGE_HYDRATE_BATCH", "5000"))
+MAX_FIELDS = 32
+LINEAGE_ENGINE = os.getenv("LINEAGE_ENGINE", "neo4j")  # neo4j | memory
+SNAPSHOT_FULL_RELOAD = float(os.getenv("LINEAGE_SNAPSHOT_FULL_RELOAD", "3600"))
+BATCH_MAX_KEYS = int(os.getenv("LINEAGE_BATCH_MAX_KEYS", "1000"))
+DRILLDOWN_MAX_NODES = int(os.getenv("LINEAGE_DRILLDOWN_MAX_NODES", "500"))
+# /lineage/expand: BFS levels kept per start key, served in pages of frontier nodes
+EXPAND_PAGE = int(os.getenv("LINEAGE_EXPAND_PAGE", "1000"))
+EXPAND_MAX_HOPS = int(os.getenv("LINEAGE_EXPAND_MAX_HOPS", "16"))
+EXPAND_STATES = int(os.getenv("LINEAGE_EXPAND_STATES", "64"))
+EXPAND_PAGE_MAX = 10000
+# layout=layered: server-side positions, cached per graph version next to the responses
+LAYOUT_RANK_SEP = float(os.getenv("LINEAGE_LAYOUT_RANK_SEP", "160"))
+LAYOUT_NODE_SEP = float(os.getenv("LINEAGE_LAYOUT_NODE_SEP", "50"))
+LAYOUT_SWEEPS = int(os.getenv("LINEAGE_LAYOUT_SWEEPS", "4"))
+# Slow-query log: traversals slower than this keep their key and a PROFILE plan (0 disables)
+SLOW_QUERY_MS = float(os.getenv("LINEAGE_SLOW_QUERY_MS", "1000"))
+SLOW_PROFILE_INTERVAL = float(os.getenv("LINEAGE_SLOW_PROFILE_INTERVAL", "600"))
+SLOW_MAX_KEYS = int(os.getenv("LINEAGE_SLOW_MAX_KEYS", "500"))
+REACH_LABELS = int(os.getenv("REACH_LABELS", "2"))
+REACH_CLOSURE_MAX_NODES = int(os.getenv("REACH_CLOSURE_MAX_NODES", "20000"))
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 
 app = FastAPI(title="Lineage API (Cytoscape-friendly)")
 
@@ -20,8 +72,116 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(LatencyMiddleware, max_hops_label=EXPAND_MAX_HOPS)
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+driver = None  # AsyncDriver, created on startup inside the server's event loop
+
+@app.on_event("startup")
+async def open_driver():
+    global driver
+    driver = AsyncGraphDatabase.driver(
+        NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS),
+        max_connection_pool_size=NEO4J_POOL_SIZE,
+        connection_acquisition_timeout=NEO4J_ACQUIRE_TIMEOUT,
+        max_connection_lifetime=NEO4J_CONN_LIFETIME,
+        liveness_check_timeout=NEO4J_LIVENESS_CHECK,
+    )
+    if LINEAGE_ENGINE == "memory":
+        _snapshot_for(None)  # start the initial load in the background
+
+@app.on_event("shutdown")
+async def close_driver():
+    if driver is not None:
+        await driver.close()
+
+async def _flowrun_count():
+    # Every ingest MERGEs a FlowRun under its own job id (the worker's are unique per run, see flow_job_id),
+    # so the count doubles as a graph version
+    async with driver.session() as s:
+        rec = await (await s.run("MATCH (f:FlowRun) RETURN count(f) AS runs")).single()
+        return rec["runs"]
+
+cache = LineageCache(CACHE_MAX_BYTES, CACHE_TTL)
+graph_version = GraphVersion(_flowrun_count, GRAPH_VERSION_POLL)
+inflight: dict = {}  # (cache key, version) -> StreamFlight
+expansions = ExpansionCache(EXPAND_STATES)
+slow_log = SlowLog(SLOW_QUERY_MS, SLOW_MAX_KEYS, SLOW_PROFILE_INTERVAL)
+
+# LINEAGE_ENGINE=memory: serve traversals from an in-process CSR snapshot
+snapshot: Optional[GraphSnapshot] = None
+snapshot_task: Optional[asyncio.Task] = None
+snapshot_failed_at = float("-inf")
+START_LABEL = {"pde": "PDE", "site": "Website"}
+
+async def _refresh_snapshot():
+    global snapshot, snapshot_failed_at
+    try:
+        if snapshot is None or time.time() - snapshot.full_loaded_at > SNAPSHOT_FULL_RELOAD:
+            snapshot = await load_snapshot(driver, NEO4J_FETCH_SIZE)
+            print(f"[Lineage API] snapshot loaded: {snapshot.stats()}")
+        else:
+            n = await refresh_snapshot(snapshot, driver, NEO4J_FETCH_SIZE)
+            print(f"[Lineage API] snapshot refreshed: {n} new runs, version {snapshot.version}")
+    except Exception as e:
+        snapshot_failed_at = time.monotonic()
+        print(f"[Lineage API] snapshot refresh failed: {e}")
+
+def _snapshot_for(version):
+    """The snapshot if it is at `version`; otherwise start a refresh and return None (serve from Neo4j)."""
+    global snapshot_task
+    if LINEAGE_ENGINE != "memory":
+        return None
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    if (snapshot_task is None or snapshot_task.done()) and time.monotonic() - snapshot_failed_at >= GRAPH_VERSION_POLL:
+        snapshot_task = asyncio.create_task(_refresh_snapshot())
+    return None
+
+# Reachability index over PDE FLOWS_TO, rebuilt in a thread when the graph version moves
+reach_index: Optional[ReachIndex] = None
+reach_task: Optional[asyncio.Task] = None
+reach_failed_at = float("-inf")
+
+async def _rebuild_reach(version):
+    global reach_index, reach_failed_at
+    try:
+        snap = _snapshot_for(version)
+        if snap is not None:
+            keys, src, dst = snap.typed_subgraph("FLOWS_TO", "PDE")
+        else:
+            async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+                keys = [r["key"] async for r in await s.run(Q.REACH_NODES)]
+                pairs = [(r["src"], r["dst"]) async for r in await s.run(Q.REACH_EDGES)]
+            index = {k: i for i, k in enumerate(keys)}
+            pairs = [(index[a], index[b]) for a, b in pairs if a in index and b in index]
+            src = np.array([a for a, _ in pairs], dtype=np.int64)
+            dst = np.array([b for _, b in pairs], dtype=np.int64)
+        t0 = time.monotonic()
+        reach_index = await asyncio.to_thread(ReachIndex, keys, src, dst, version, REACH_LABELS, REACH_CLOSURE_MAX_NODES)
+        print(f"[Lineage API] reach index built in {time.monotonic() - t0:.2f}s: {reach_index.stats()}")
+    except Exception as e:
+        reach_failed_at = time.monotonic()
+        print(f"[Lineage API] reach index build failed: {e}")
+
+async def _current_reach() -> ReachIndex:
+    """The index for the current graph version; a stale one is served while its rebuild runs."""
+    global reach_task
+    version = await graph_version.current()
+    if reach_index is None or reach_index.version != version:
+        if (reach_task is None or reach_task.done()) and time.monotonic() - reach_failed_at >= GRAPH_VERSION_POLL:
+            reach_task = asyncio.create_task(_rebuild_reach(version))
+        if reach_index is None and reach_task is not None:
+            await asyncio.shield(reach_task)
+    if reach_index is None:
+        raise HTTPException(503, "reachability index unavailable")
+    return reach_index
+
+async def snapshot_rows(snap, nodes, edges, fields=None):
+    note_engine("memory")
+    for i in nodes.tolist():
+        yield ("node", snap.node_payload(i, fields))
+    for j in edges.tolist():
+        yield ("edge", snap.edge_payload(j, fields))
 
 def _node_id(n):
     return (n.get("site_key") or n.get("server_key") or n.get("soft_key")
@@ -45,55 +205,610 @@ def to_edge_payload(r, src, dst):
 def healthz():
     return {"ok": True}
 
+async def lineage_rows(kind, key, max_hops):
+    """Yield ("node", payload) rows, then ("edge", payload) rows, as Neo4j streams them."""
+    async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+        note_query(Q.paths_query(kind), key=key, max_hops=max_hops)
+        result = await s.run(Q.paths_query(kind), key=key, max_hops=max_hops)
+        async for rec in result:
+            if rec["node"] is not None:
+                yield ("node", to_node_payload(rec["node"]))
+            elif rec["src"] and rec["dst"]:
+                yield ("edge", to_edge_payload(rec["rel"], rec["src"], rec["dst"]))
+
+def parse_fields(spec):
+    """'name,op' -> ('name', 'op'); property names only, so they are safe to pass as a Cypher list."""
+    if spec is None:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip()))
+    bad = [f for f in fields if not FIELD_RE.match(f)]
+    if bad or len(fields) > MAX_FIELDS:
+        raise HTTPException(400, f"fields must be at most {MAX_FIELDS} property names; bad: {bad}")
+    return fields
+
+async def _hydrate(s, cypher, ids, fields):
+    result = await s.run(cypher, ids=ids, fields=list(fields))
+    return {rec["id"]: rec["vals"] async for rec in result}
+
+def _props(fields, vals):
+    return {f: v for f, v in zip(fields, vals or ()) if v is not None}
+
+async def _hydrated_rows(s, nodes, rels, fields):
+    """Turn compact node/rel tuples into payload rows, hydrating `fields` in batches."""
+    nodes = [n for n in nodes if n[1] is not None]
+    rels = [r for r in rels if r[1] is not None and r[3] is not None]
+    for i in range(0, len(nodes), HYDRATE_BATCH):
+        batch = nodes[i:i + HYDRATE_BATCH]
+        vals = await _hydrate(s, Q.HYDRATE_NODES, [n[0] for n in batch], fields) if fields else {}
+        for eid, nid, label in batch:
+            yield ("node", {"data": {**_props(fields, vals.get(eid)), "id": nid, "label": label, "type": label}})
+    for i in range(0, len(rels), HYDRATE_BATCH):
+        batch = rels[i:i + HYDRATE_BATCH]
+        vals = await _hydrate(s, Q.HYDRATE_RELS, [r[0] for r in batch], fields) if fields else {}
+        for eid, src, rtype, dst in batch:
+            yield ("edge", {"data": {"id": f"{src}-{rtype}-{dst}", "source": src, "target": dst,
+                                     "label": rtype, **_props(fields, vals.get(eid))}})
+
+async def subgraph_rows(kind, key, max_hops, fields):
+    """Lean traversal: NODE_GLOBAL subgraph as (elementId, key, label) tuples, then hydrate `fields` in batches."""
+    async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+        note_query(Q.subgraph_query(kind), key=key, max_hops=max_hops)
+        rec = await (await s.run(Q.subgraph_query(kind), key=key, max_hops=max_hops)).single()
+        if rec is None:
+            return
+        async for row in _hydrated_rows(s, rec["nodes"], rec["rels"], fields):
+            yield row
+
+async def batch_rows(pde_keys, site_keys, max_hops, fields):
+    """One multi-start query; node/edge rows for the merged graph, then ("meta", {"reach": ...})."""
+    reach = {k: [] for k in pde_keys + site_keys}
+    async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+        note_query(Q.BATCH_SUBGRAPH, pde_keys=pde_keys, site_keys=site_keys, max_hops=max_hops)
+        rec = await (await s.run(Q.BATCH_SUBGRAPH, pde_keys=pde_keys, site_keys=site_keys, max_hops=max_hops)).single()
+        if rec is not None:
+            for r in rec["reach"]:
+                reach[r["key"]] = [i for i in r["ids"] if i is not None]
+            async for row in _hydrated_rows(s, rec["nodes"], rec["rels"], fields):
+                yield row
+    yield ("meta", {"reach": reach})
+
+async def snapshot_batch_rows(snap, hits, fields):
+    reach = {k: [snap.keys[i] for i in nodes.tolist()] for k, (nodes, _) in hits.items()}
+    nodes = np.unique(np.concatenate([h[0] for h in hits.values()])) if hits else np.zeros(0, dtype=np.int64)
+    edges = np.unique(np.concatenate([h[1] for h in hits.values()])) if hits else np.zeros(0, dtype=np.int64)
+    async for row in snapshot_rows(snap, nodes, edges, fields):
+        yield row
+    yield ("meta", {"reach": reach})
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=str)
+
+async def stream_lineage_json(rows):
+    """Serialize lineage rows into the {"nodes": [...], "edges": [...]} body, chunk by chunk.
+
+    A ("meta", dict) row adds its keys to the object after the edges.
+    """
+    buf = bytearray(b'{"nodes":[')
+    seen = set()
+    meta = {}
+    in_edges, first = False, True
+    async for row in rows:
+        kind, payload = row
+        if kind == "meta":
+            meta.update(payload)
+            continue
+        if kind == "node":
+            nid = payload["data"]["id"]
+            if nid in seen:
+                continue
+            seen.add(nid)
+        elif not in_edges:
+            buf += b'],"edges":['
+            in_edges, first = True, True
+        if not first:
+            buf += b","
+        buf += _dumps(payload)
+        first = False
+        if len(buf) >= STREAM_CHUNK_BYTES:
+            yield bytes(buf)
+            buf.clear()
+    if not in_edges:
+        buf += b'],"edges":['
+    buf += b"]"
+    for k, v in meta.items():
+        buf += b"," + _dumps(k) + b":" + _dumps(v)
+    buf += b"}"
+    yield bytes(buf)
+
+async def stream_compact_json(rows):
+    """format=compact: buffer the rows and emit one compact-v1 body (see lineage_wire)."""
+    nodes, edges, meta, seen = [], [], {}, set()
+    async for kind, payload in rows:
+        if kind == "node":
+            if payload["data"]["id"] not in seen:
+                seen.add(payload["data"]["id"])
+                nodes.append(payload)
+        elif kind == "edge":
+            edges.append(payload)
+        else:
+            meta.update(payload)
+    yield _dumps(encode_compact(nodes, edges, meta))
+
+SERIALIZERS = {"cytoscape": stream_lineage_json, "compact": stream_compact_json}
+
+def _finish_trace(trace: Trace):
+    observe(trace)
+    entry = slow_log.record(trace, trace.fetch_seconds + trace.serialize_seconds)
+    if entry is None:
+        return
+    print(f"[Lineage API] slow {trace.endpoint} {trace.kind}={trace.key} max_hops={trace.max_hops}: "
+          f"{entry['last_ms']:.0f} ms ({entry['query_ms']:.0f} query, {entry['serialize_ms']:.0f} serialize, "
+          f"{trace.nodes} nodes, {trace.edges} edges, engine={trace.engine})")
+    if slow_log.wants_profile(entry, trace):
+        slow_log.profiling = True
+        asyncio.create_task(_profile(entry, *trace.queries[-1]))
+
+async def _profile(entry, cypher, params):
+    """Re-run a slow traversal query under PROFILE and keep its operator tree on the slow-log entry."""
+    try:
+        async with driver.session() as s:
+            summary = await (await s.run("PROFILE " + cypher, **params)).consume()
+        plan = summarize_profile(summary.profile)
+        entry.update(plan=plan, db_hits=total_db_hits(plan))
+        print(f"[Lineage API] profiled {entry['kind']}={entry['key']} max_hops={entry['max_hops']}: {entry['db_hits']} db hits")
+    except Exception as e:
+        entry["plan"] = {"error": str(e)}
+        print(f"[Lineage API] profile failed for {entry['key']}: {e}")
+    finally:
+        entry["profiled_at"] = time.time()
+        slow_log.profiling = False
+
+async def _produce(flight: StreamFlight, fk, ck, rows, version, serialize=stream_lineage_json, trace=None):
+    body = traced_body(serialize, rows, trace, _finish_trace) if trace is not None else serialize(rows)
+    try:
+        async for chunk in body:
+            await flight.publish(chunk)
+            if not flight.joinable:
+                inflight.pop(fk, None)
+        if flight.retaining:
+            body = b"".join(flight.prefix)
+            cache.put(ck, CacheEntry(body=body, etag=make_etag(version, body), version=version, created=time.monotonic()))
+        await flight.finish()
+    except asyncio.CancelledError:
+        flight.done = True
+        raise
+    except Exception as e:
+        print(f"[Lineage API] lineage stream failed for {ck}: {e}")
+        await flight.finish(e)
+    finally:
+        if inflight.get(fk) is flight:
+            inflight.pop(fk, None)
+
+def _entry_response(request: Request, ck, entry: CacheEntry, source: str) -> Response:
+    enc = negotiate(request.headers.get("accept-encoding")) if len(entry.body) >= COMPRESS_MIN_BYTES else None
+    etag = entry.etag if enc is None else f'{entry.etag[:-1]}-{enc}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Cache": source, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if enc is None:
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+    body = cache.variant(ck, entry, enc, lambda b: compress(b, enc))
+    return Response(content=body, media_type="application/json", headers={**headers, "Content-Encoding": enc})
+
+async def _stream_response(request: Request, body, headers=None) -> StreamingResponse:
+    """Stream an async iterator of body chunks, compressed if the client accepts it.
+
+    The first chunk is awaited here so connection/query errors become a 503.
+    """
+    try:
+        first = await body.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except Exception as e:
+        await body.aclose()
+        raise HTTPException(503, f"lineage query failed: {e}")
+    enc = negotiate(request.headers.get("accept-encoding"))
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+
+    async def gen():
+        z = StreamCompressor(enc) if enc else None
+        yield z.feed(first) if z else first
+        async for chunk in body:
+            yield z.feed(chunk) if z else chunk
+        if z:
+            yield z.finish()
+    if enc:
+        headers["Content-Encoding"] = enc
+    return StreamingResponse(gen(), media_type="application/json", headers=headers)
+
+def _traversal_rows(kind, key, max_hops, props, version):
+    snap = _snapshot_for(version)
+    hit = snap.traverse(key, max_hops, START_LABEL[kind]) if snap is not None else None
+    if hit is not None:
+        return snapshot_rows(snap, *hit, props)
+    if props is not None:
+        return subgraph_rows(kind, key, max_hops, props)
+    return lineage_rows(kind, key, max_hops)
+
+async def _lookup_parents(nodes, max_nodes, expand, only, version):
+    """PDE -> Feed, and Feed -> Directory/Software only if folding PDEs can't meet the budget."""
+    pdes = [n["data"]["id"] for n in nodes if n["data"].get("type") == "PDE"]
+    snap = _snapshot_for(version)
+    if snap is not None:
+        parents = snap.parents(pdes, "HAS", "Feed")
+    else:
+        async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+            result = await s.run(Q.PARENT_FEEDS, keys=pdes)
+            parents = {r["key"]: (r["parent"], r["label"], r["name"]) async for r in result}
+    after_feeds = {parents[i][0] if i in parents and parents[i][0] not in expand else i
+                   for i in (n["data"]["id"] for n in nodes)}
+    if only is None and len(after_feeds) <= max_nodes:
+        return parents
+    feeds = list({n["data"]["id"] for n in nodes if n["data"].get("type") == "Feed"} | {p[0] for p in parents.values()})
+    if snap is not None:
+        parents.update(snap.parents(feeds, "EXPOSES", "Directory"))
+    else:
+        async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+            result = await s.run(Q.PARENT_CONTAINERS, keys=feeds)
+            parents.update({r["key"]: (r["parent"], r["label"], r["name"]) async for r in result})
+    return parents
+
+async def summarized_rows(rows, max_nodes, expand, only, version):
+    """Buffer a traversal and re-emit it folded to `max_nodes` (see lineage_summary)."""
+    nodes, edges, meta = [], [], {}
+    async for kind, payload in rows:
+        if kind == "node":
+            nodes.append(payload)
+        elif kind == "edge":
+            edges.append(payload)
+        else:
+            meta.update(payload)
+    parents = {}
+    if len(nodes) > max_nodes or only is not None:
+        parents = await _lookup_parents(nodes, max_nodes, expand, only, version)
+    nodes, edges, summary = summarize(nodes, edges, parents, max_nodes, expand, only)
+    for n in nodes:
+        yield ("node", n)
+    for e in edges:
+        yield ("edge", e)
+    yield ("meta", {**meta, "summary": summary})
+
+async def layout_rows(rows, ck, version):
+    """Buffer a traversal and re-emit it with a layered `position` on every node.
+
+    Positions are computed once per graph version in a worker thread and kept in
+    the response cache under ck + ("positions",), so every format shares them.
+    """
+    nodes, edges, meta = [], [], {}
+    async for kind, payload in rows:
+        if kind == "node":
+            nodes.append(payload)
+        elif kind == "edge":
+            edges.append(payload)
+        else:
+            meta.update(payload)
+    pk = ck + ("positions",)
+    entry = cache.get(pk, version) if cache.enabled else None
+    if entry is not None:
+        cached = orjson.loads(entry.body)
+        positions, nlayers = cached["positions"], cached["layers"]
+    else:
+        t0 = time.monotonic()
+        positions, nlayers = await asyncio.to_thread(layered_positions, nodes, edges, rank_sep=LAYOUT_RANK_SEP,
+                                                     node_sep=LAYOUT_NODE_SEP, sweeps=LAYOUT_SWEEPS)
+        print(f"[Lineage API] layered layout for {ck[:3]}: {len(nodes)} nodes, {nlayers} layers "
+              f"in {time.monotonic() - t0:.2f}s")
+        if cache.enabled:
+            body = _dumps({"positions": positions, "layers": nlayers})
+            cache.put(pk, CacheEntry(body=body, etag=make_etag(version, body), version=version, created=time.monotonic()))
+    for n in nodes:
+        p = positions.get(n["data"]["id"])
+        yield ("node", {**n, "position": {"x": p[0], "y": p[1]}} if p else n)
+    for e in edges:
+        yield ("edge", e)
+    yield ("meta", {**meta, "layout": {"name": "layered", "layers": nlayers}})
+
+async def _serve_lineage(request: Request, ck, version, make_rows, fmt="cytoscape", trace=None):
+    if fmt != "cytoscape":
+        ck = ck + (fmt,)
+    entry = cache.get(ck, version) if cache.enabled else None
+    if entry is not None:
+        return _entry_response(request, ck, entry, "HIT")
+
+    # identical concurrent misses subscribe to one streaming traversal
+    fk = (ck, version)
+    flight = inflight.get(fk)
+    q = flight.subscribe() if flight is not None else None
+    source = "SHARED"
+    if q is None:
+        flight = StreamFlight(retain_limit=cache.max_entry_bytes if cache.enabled else 0)
+        q = flight.subscribe()
+        inflight[fk] = flight
+        flight.task = asyncio.create_task(_produce(flight, fk, ck, make_rows(), version, SERIALIZERS[fmt], trace))
+        source = "MISS"
+    return await _stream_response(request, drain(flight, q), {"X-Cache": source})
+
 @app.get("/lineage")
-def lineage(
+async def lineage(
+    request: Request,
     pde_key: str = Query(default=None),
     site_key: str = Query(default=None),
-    max_hops: int = Query(4, ge=1, le=8)
+    max_hops: int = Query(4, ge=1, le=8),
+    traversal: str = Query(DEFAULT_TRAVERSAL, pattern="^(paths|subgraph)$"),
+    fields: str = Query(default=None),
+    max_nodes: int = Query(default=None, ge=1, description="fold PDEs into feeds, then feeds into directories/software, to fit"),
+    expand: List[str] = Query(default=[], description="group ids (feed/directory/software keys) to keep open"),
+    fmt: str = Query("cytoscape", alias="format", pattern="^(cytoscape|compact)$"),
+    layout: str = Query(default=None, pattern="^layered$", description="add server-computed node positions"),
 ):
     if not pde_key and not site_key:
         return {"error": "Provide either pde_key or site_key"}
 
-    start_match = ("MATCH (start:PDE {pde_key:$key})" if pde_key
-                   else "MATCH (start:Website {site_key:$key})")
-    # Structural + flow relationships
-    rels = "<HAS|<EXPOSES|<USES|<RUNS|<HOSTED_ON|FLOWS_TO"
-
-    cypher = f"""
-    {start_match}
-    CALL apoc.path.expandConfig(start, {{
-      relationshipFilter: "{rels}",
-      minLevel: 1, maxLevel: $max_hops, bfs:true
-    }}) YIELD path
-    WITH collect(path) AS paths
-    WITH [p IN paths | nodes(p)] AS node_lists, [p IN paths | relationships(p)] AS rel_lists
-    WITH apoc.coll.toSet(apoc.coll.flatten(node_lists)) AS uniq_nodes,
-         apoc.coll.toSet(apoc.coll.flatten(rel_lists)) AS uniq_rels
-    UNWIND uniq_nodes AS n
-    WITH collect(n) AS nodes, uniq_rels
-    UNWIND uniq_rels AS r
-    WITH nodes, r, startNode(r) AS s, endNode(r) AS e
-    RETURN nodes AS nodes, collect(DISTINCT [r,s,e]) AS edges
+    kind, key = ("pde", pde_key) if pde_key else ("site", site_key)
+    props = parse_fields(fields) if traversal == "subgraph" else None
+    ck = (kind, key, max_hops, traversal, props) if props is not None else (kind, key, max_hops)
+    expand = tuple(sorted(set(expand)))
+    if max_nodes is not None:
+        ck = ck + ("summary", max_nodes, expand)
+    if layout is not None:
+        ck = ck + ("layout", layout)
+    version = await graph_version.current()
+
+    def rows():
+        base = _traversal_rows(kind, key, max_hops, props, version)
+        if max_nodes is not None:
+            base = summarized_rows(base, max_nodes, expand, None, version)
+        return layout_rows(base, ck, version) if layout is not None else base
+    return await _serve_lineage(request, ck, version, rows, fmt, Trace("/lineage", kind, key, max_hops, fmt))
+
+@app.get("/lineage/drilldown")
+async def lineage_drilldown(
+    request: Request,
+    group: str = Query(..., description="supernode id from a summarized /lineage response"),
+    pde_key: str = Query(default=None),
+    site_key: str = Query(default=None),
+    max_hops: int = Query(4, ge=1, le=8),
+    traversal: str = Query(DEFAULT_TRAVERSAL, pattern="^(paths|subgraph)$"),
+    fields: str = Query(default=None),
+    max_nodes: int = Query(DRILLDOWN_MAX_NODES, ge=1),
+    expand: List[str] = Query(default=[]),
+    fmt: str = Query("cytoscape", alias="format", pattern="^(cytoscape|compact)$"),
+):
+    """Members of one supernode from the same traversal, plus the (summarized) nodes they connect to."""
+    if not pde_key and not site_key:
+        raise HTTPException(400, "Provide either pde_key or site_key")
+    kind, key = ("pde", pde_key) if pde_key else ("site", site_key)
+    props = parse_fields(fields) if traversal == "subgraph" else None
+    expand = tuple(sorted(set(expand) | {group}))
+    ck = (kind, key, max_hops, traversal, props, "drilldown", group, max_nodes, expand)
+    version = await graph_version.current()
+
+    def rows():
+        return summarized_rows(_traversal_rows(kind, key, max_hops, props, version), max_nodes, expand, group, version)
+    return await _serve_lineage(request, ck, version, rows, fmt, Trace("/lineage/drilldown", kind, key, max_hops, fmt))
+
+class BatchLineageRequest(BaseModel):
+    pde_keys: List[str] = Field(default_factory=list)
+    site_keys: List[str] = Field(default_factory=list)
+    max_hops: int = Field(4, ge=1, le=8)
+    fields: Optional[List[str]] = Field(None, description="properties to hydrate; default LINEAGE_DEFAULT_FIELDS")
+    format: str = Field("cytoscape", pattern="^(cytoscape|compact)$")
+
+@app.post("/lineage/batch")
+async def lineage_batch(request: Request, req: BatchLineageRequest):
+    """Merged, de-duplicated lineage for many start keys plus {"reach": {start key: [node ids]}}."""
+    pde_keys, site_keys = list(dict.fromkeys(req.pde_keys)), list(dict.fromkeys(req.site_keys))
+    if not pde_keys and not site_keys:
+        raise HTTPException(400, "Provide pde_keys and/or site_keys")
+    if len(pde_keys) + len(site_keys) > BATCH_MAX_KEYS:
+        raise HTTPException(400, f"at most {BATCH_MAX_KEYS} start keys per batch")
+    props = parse_fields(None if req.fields is None else ",".join(req.fields))
+
+    rows = None
+    snap = _snapshot_for(await graph_version.current())
+    if snap is not None:
+        starts = [(k, "PDE") for k in pde_keys] + [(k, "Website") for k in site_keys]
+        hits = {k: snap.traverse(k, req.max_hops, label) for k, label in starts}
+        if all(h is not None for h in hits.values()):  # unknown keys may be newer than the snapshot
+            rows = snapshot_batch_rows(snap, hits, props)
+    if rows is None:
+        rows = batch_rows(pde_keys, site_keys, req.max_hops, props)
+
+    starts = pde_keys + site_keys
+    trace = Trace("/lineage/batch", "batch", starts[0] + (f" (+{len(starts) - 1})" if len(starts) > 1 else ""),
+                  req.max_hops, req.format)
+    return await _stream_response(request, traced_body(SERIALIZERS[req.format], rows, trace, _finish_trace))
+
+async def neo4j_levels(kind, key, fields):
+    """Level-synchronous BFS against Neo4j: one EXPAND_STEP round trip per level, visited set kept here.
+
+    Each level opens its own session, so an idle expansion doesn't hold a pooled connection.
     """
-    key = pde_key or site_key
-    with driver.session() as s:
-        rec = s.run(cypher, key=key, max_hops=max_hops).single()
-        nodes = rec["nodes"] if rec else []
-        edges = rec["edges"] if rec else []
+    async with driver.session() as s:
+        rec = await (await s.run(Q.expand_start_query(kind), key=key)).single()
+    if rec is None:
+        return
+    visited = {rec["id"]}
+    sent = set()  # rel ids already yielded; edges into visited nodes still belong to the level that follows them
+    frontier = [rec["id"]]
+    while frontier:
+        nodes, rels = {}, []
+        async with driver.session(fetch_size=NEO4J_FETCH_SIZE) as s:
+            note_query(Q.EXPAND_STEP, ids=frontier)
+            async for r in await s.run(Q.EXPAND_STEP, ids=frontier):
+                if r["key"] is None:
+                    continue
+                if r["bid"] not in visited:
+                    nodes.setdefault(r["bid"], (r["bid"], r["key"], r["label"]))
+                if r["rid"] not in sent:
+                    sent.add(r["rid"])
+                    rels.append((r["rid"], r["src"], r["type"], r["dst"]))
+            if not nodes and not rels:
+                return
+            level = ([], [])
+            async for kind_, payload in _hydrated_rows(s, list(nodes.values()), rels, fields):
+                level[kind_ == "edge"].append(payload)
+        visited.update(nodes)
+        frontier = list(nodes)
+        yield level
+
+async def snapshot_levels(snap, start, fields):
+    for nodes, edges in snap.levels(start):
+        note_engine("memory")  # levels are computed lazily, under whichever request asks first
+        yield [snap.node_payload(i, fields) for i in nodes.tolist()], [snap.edge_payload(j, fields) for j in edges.tolist()]
 
-    node_payloads = {}
+def _expansion(kind, key, props, version):
+    def levels():
+        snap = _snapshot_for(version)
+        start = snap.start_index(key, START_LABEL[kind]) if snap is not None else None
+        if start is not None:
+            return snapshot_levels(snap, start, props)
+        return neo4j_levels(kind, key, props)
+    ek = (kind, key, props)
+    return ek, expansions.get(ek, version, levels)
+
+async def expand_rows(kind, key, props, hop, offset, limit, version):
+    """One page of level `hop`, then ("meta", {hop, frontier size, next_cursor, ...})."""
+    ek, exp = _expansion(kind, key, props, version)
+    try:
+        level = await exp.level(hop)
+    except Exception:
+        expansions.drop(ek, exp)
+        raise
+    nodes, edges = expand_page(level, offset, limit) if level is not None else ([], [])
     for n in nodes:
-        payload = to_node_payload(n)
-        node_payloads[payload["data"]["id"]] = payload
+        yield ("node", n)
+    for e in edges:
+        yield ("edge", e)
+    total = len(level[0]) if level is not None else 0
+    nxt = offset + limit
+    yield ("meta", {"hop": hop, "frontier": total, "offset": offset,
+                    "next_cursor": encode_cursor(hop, nxt, version) if nxt < total else None,
+                    "exhausted": level is None, "version": version})
+
+@app.get("/lineage/expand")
+async def lineage_expand(
+    request: Request,
+    pde_key: str = Query(default=None),
+    site_key: str = Query(default=None),
+    hop: int = Query(default=None, ge=1, le=EXPAND_MAX_HOPS, description="BFS level to return; default 1, or the cursor's"),
+    cursor: str = Query(default=None, description="next_cursor from the previous page"),
+    limit: int = Query(EXPAND_PAGE, ge=1, le=EXPAND_PAGE_MAX, description="frontier nodes per page"),
+    fields: str = Query(default=None),
+):
+    """Nodes first reached at `hop` and the edges followed from hop - 1, a page at a time."""
+    if not pde_key and not site_key:
+        raise HTTPException(400, "Provide either pde_key or site_key")
+    kind, key = ("pde", pde_key) if pde_key else ("site", site_key)
+    props = parse_fields(fields)
+    version = await graph_version.current()
+    offset = 0
+    if cursor:
+        try:
+            c_hop, offset, c_version = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if hop is not None and hop != c_hop:
+            raise HTTPException(400, f"cursor is for hop {c_hop}")
+        if c_version != version:
+            raise HTTPException(409, "graph changed since the cursor was issued; restart the level without a cursor")
+        hop = c_hop
+    hop = hop or 1
+    ck = (kind, key, "expand", hop, offset, limit, props)
+    return await _serve_lineage(request, ck, version, lambda: expand_rows(kind, key, props, hop, offset, limit, version),
+                                trace=Trace("/lineage/expand", kind, key, hop))
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + _dumps(data) + b"\n\n"
+
+@app.get("/lineage/expand/stream")
+async def lineage_expand_stream(
+    request: Request,
+    pde_key: str = Query(default=None),
+    site_key: str = Query(default=None),
+    max_hops: int = Query(4, ge=1, le=EXPAND_MAX_HOPS),
+    limit: int = Query(EXPAND_PAGE, ge=1, le=EXPAND_PAGE_MAX, description="frontier nodes per event"),
+    fields: str = Query(default=None),
+):
+    """Server-sent events: `level` as soon as each BFS level is computed (wide levels in parts of `limit` nodes), then `done`."""
+    if not pde_key and not site_key:
+        raise HTTPException(400, "Provide either pde_key or site_key")
+    kind, key = ("pde", pde_key) if pde_key else ("site", site_key)
+    props = parse_fields(fields)
+    version = await graph_version.current()
+
+    async def events():
+        ek, exp = _expansion(kind, key, props, version)
+        hops = total = 0
+        try:
+            for hop in range(1, max_hops + 1):
+                if await request.is_disconnected():
+                    return
+                level = await exp.level(hop)
+                if level is None:
+                    break
+                hops, n = hop, len(level[0])
+                total += n
+                for off in range(0, max(n, 1), limit):  # a level of only edges still gets one event
+                    nodes, edges = expand_page(level, off, limit)
+                    yield _sse("level", {"hop": hop, "frontier": n, "offset": off, "nodes": nodes, "edges": edges})
+        except Exception as e:
+            expansions.drop(ek, exp)
+            print(f"[Lineage API] expansion failed for {ek}: {e}")
+            yield _sse("error", {"detail": f"lineage query failed: {e}"})
+            return
+        yield _sse("done", {"hops": hops, "nodes": total, "version": version})
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/reachable")
+async def reachable(src: str = Query(..., description="pde_key"), dst: str = Query(..., description="pde_key")):
+    """Is dst downstream of src over FLOWS_TO (any number of hops)?"""
+    ix = await _current_reach()
+    try:
+        ok = ix.reachable(src, dst)
+    except KeyError as e:
+        raise HTTPException(404, f"unknown pde_key {e.args[0]}")
+    return {"src": src, "dst": dst, "reachable": ok, "version": ix.version}
+
+@app.get("/impact/count")
+async def impact_count(key: str = Query(..., description="pde_key")):
+    """How many PDEs are downstream (depend on) / upstream of `key`, over any number of hops."""
+    ix = await _current_reach()
+    try:
+        # above REACH_CLOSURE_MAX_NODES an uncached count is a BFS over the component DAG: keep it off the loop
+        counts = ix.counts(key) if ix.counts_ready(key) else await asyncio.to_thread(ix.counts, key)
+    except KeyError:
+        raise HTTPException(404, f"unknown pde_key {key}")
+    return {"key": key, **counts, "version": ix.version}
+
+@app.get("/debug/reach")
+def debug_reach():
+    return reach_index.stats() if reach_index is not None else {"built": False}
+
+@app.get("/debug/snapshot")
+def debug_snapshot():
+    if snapshot is None:
+        return {"engine": LINEAGE_ENGINE, "loaded": False}
+    return {"engine": LINEAGE_ENGINE, "loaded": True, **snapshot.stats()}
+
+@app.get("/metrics")
+def metrics():
+    update_pool_metrics(driver, NEO4J_POOL_SIZE)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/debug/slow")
+def debug_slow(limit: int = Query(20, ge=1, le=500)):
+    """Worst (endpoint, start key, max_hops) by slowest time over LINEAGE_SLOW_QUERY_MS, with PROFILE plans."""
+    return {"threshold_ms": slow_log.threshold_ms, "tracked": len(slow_log.entries), "worst": slow_log.worst(limit)}
 
-    edge_payloads = []
-    for r, s, e in edges:
-        src = _node_id(s)
-        dst = _node_id(e)
-        if src and dst:
-            edge_payloads.append(to_edge_payload(r, src, dst))
+@app.get("/debug/cache")
+def debug_cache():
+    return {**cache.stats(), "graph_version_poll_seconds": graph_version.poll}
 
-    return {"nodes": list(node_payloads.values()), "edges": edge_payloads}
+@app.get("/debug/expand")
+def debug_expand():
+    return expansions.stats()
 
 import socket
 from urllib.parse import urlparse
@@ -102,8 +817,8 @@ from fastapi.responses import JSONResponse
 print(f"[Lineage API] NEO4J_URI={NEO4J_URI}  NEO4J_USER={NEO4J_USER}")
 
 @app.get("/debug/neo4j")
-def debug_neo4j():
-    info = {"uri": NEO4J_URI, "user": NEO4J_USER}
+async def debug_neo4j():
+    info = {"uri": NEO4J_URI, "user": NEO4J_USER, "pool": pool_stats(driver, NEO4J_POOL_SIZE)}
     try:
         u = urlparse(NEO4J_URI)
         host = u.hostname
@@ -116,8 +831,8 @@ def debug_neo4j():
         except Exception as e:
             info["dns_error"] = str(e)
         try:
-            with driver.session() as s:
-                val = s.run("RETURN 1 AS one").single().get("one")
+            async with driver.session() as s:
+                val = (await (await s.run("RETURN 1 AS one")).single()).get("one")
             info["driver_test"] = f"ok (RETURN {val})"
         except Exception as e:
             info["driver_error"] = str(e)
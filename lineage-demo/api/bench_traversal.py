@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Benchmark the two /lineage traversal modes against a hub-heavy synthetic graph.
+
+Seeds (or reuses) a graph whose keys all start with `bench:`:
+  Website -> Servers -> Software -> Directories -> Feeds -> PDEs, and
+  PDE -[:FLOWS_TO]-> PDE in layers, each PDE fanning out to a few PDEs in the
+  next layer plus a handful of hubs that every PDE in the layer feeds and
+  that fan out to most of the next layer. Path counts grow roughly as
+  fanout^hops, while the distinct node/edge count stays small -- the shape
+  that hurts `traversal=paths`.
+
+Then runs both queries for each hop count and reports p50/p95 wall time
+(query + full consumption), rows returned, and result size.
+
+Example:
+  python bench_traversal.py --seed --layers 6 --width 200 --hops 2,4,6 --runs 5
+  python bench_traversal.py --cleanup
+"""
+import os, time, json, random, argparse
+from neo4j import GraphDatabase
+import lineage_queries as Q
+
+PREFIX = "bench:"
+
+def percentile(xs, q):
+    xs = sorted(xs)
+    if not xs:
+        return 0.0
+    pos = (len(xs) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+def build_graph(layers: int, width: int, fanout: int, hubs: int, seed: int):
+    """Returns (node keys by kind, structural edges by type, FLOWS_TO pairs)."""
+    rnd = random.Random(seed)
+    site = f"{PREFIX}site"
+    servers = [f"{PREFIX}server:{i}" for i in range(2)]
+    softs = [f"{PREFIX}soft:{i}" for i in range(4)]
+    dirs = [f"{PREFIX}dir:{i}" for i in range(8)]
+    feeds = [f"{PREFIX}feed:{i}" for i in range(max(1, layers * width // 50))]
+    pdes = [[f"{PREFIX}pde:{l}:{i}" for i in range(width)] for l in range(layers)]
+    flows = []
+    for l in range(layers - 1):
+        cur, nxt = pdes[l], pdes[l + 1]
+        hub_set = cur[:hubs]
+        for i, p in enumerate(cur):
+            for d in rnd.sample(nxt, min(fanout, len(nxt))):
+                flows.append((p, d))
+            for h in nxt[:hubs]:            # everything feeds the next layer's hubs
+                flows.append((p, h))
+        for h in hub_set:                   # hubs fan out to most of the next layer
+            for d in nxt[: max(1, int(len(nxt) * 0.8))]:
+                flows.append((h, d))
+    flows = sorted(set(flows))
+    structure = {
+        "HOSTED_ON": [(site, s) for s in servers],
+        "RUNS": [(servers[i % len(servers)], s) for i, s in enumerate(softs)],
+        "USES": [(softs[i % len(softs)], d) for i, d in enumerate(dirs)],
+        "EXPOSES": [(dirs[i % len(dirs)], f) for i, f in enumerate(feeds)],
+        "HAS": [(feeds[i % len(feeds)], p) for i, p in enumerate(x for layer in pdes for x in layer)],
+    }
+    return {"site": site, "servers": servers, "softs": softs, "dirs": dirs, "feeds": feeds,
+            "pdes": [p for layer in pdes for p in layer]}, structure, flows
+
+def _batches(xs, n=5000):
+    for i in range(0, len(xs), n):
+        yield xs[i:i + n]
+
+def seed_graph(driver, args):
+    nodes, structure, flows = build_graph(args.layers, args.width, args.fanout, args.hubs, args.random_seed)
+    specs = [("Website", "site_key", [nodes["site"]]), ("Server", "server_key", nodes["servers"]),
+             ("Software", "soft_key", nodes["softs"]), ("Directory", "dir_key", nodes["dirs"]),
+             ("Feed", "feed_key", nodes["feeds"]), ("PDE", "pde_key", nodes["pdes"])]
+    keys = dict((label, key) for label, key, _ in specs)
+    rel_ends = {"HOSTED_ON": ("Website", "Server"), "RUNS": ("Server", "Software"), "USES": ("Software", "Directory"),
+                "EXPOSES": ("Directory", "Feed"), "HAS": ("Feed", "PDE")}
+    with driver.session() as s:
+        for label, key, vals in specs:
+            for b in _batches(vals):
+                s.run(f"UNWIND $keys AS k MERGE (n:{label}:Asset {{{key}: k}}) SET n.name = k", keys=b).consume()
+        for rtype, pairs in structure.items():
+            a, b_ = rel_ends[rtype]
+            for b in _batches(pairs):
+                s.run(f"UNWIND $pairs AS p MATCH (a:{a} {{{keys[a]}: p[0]}}), (b:{b_} {{{keys[b_]}: p[1]}}) "
+                      f"MERGE (a)-[:{rtype}]->(b)", pairs=[list(x) for x in b]).consume()
+        for b in _batches(flows):
+            s.run("UNWIND $pairs AS p MATCH (a:PDE {pde_key: p[0]}), (b:PDE {pde_key: p[1]}) "
+                  "MERGE (a)-[r:FLOWS_TO {job_id: 'bench'}]->(b) SET r.op = 'copy', r.ts = datetime()",
+                  pairs=[list(x) for x in b]).consume()
+    print(f"[bench] seeded {sum(len(v) for _, _, v in specs)} nodes, {len(flows)} FLOWS_TO "
+          f"({args.layers} layers x {args.width}, fanout={args.fanout}, hubs={args.hubs})")
+
+def cleanup(driver):
+    with driver.session() as s:
+        s.run("MATCH (n:Asset) WHERE any(k IN ['site_key','server_key','soft_key','dir_key','feed_key','pde_key'] "
+              "WHERE n[k] STARTS WITH $p) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 5000 ROWS",
+              p=PREFIX).consume()
+    print("[bench] removed bench:* nodes")
+
+def run_paths(s, kind, key, hops, fields):
+    nodes = edges = 0
+    size = 0
+    for rec in s.run(Q.paths_query(kind), key=key, max_hops=hops):
+        if rec["node"] is not None:
+            nodes += 1
+            size += len(json.dumps(dict(rec["node"]), default=str))
+        else:
+            edges += 1
+            size += len(json.dumps(dict(rec["rel"]), default=str))
+    return nodes, edges, size
+
+def run_subgraph(s, kind, key, hops, fields):
+    rec = s.run(Q.subgraph_query(kind), key=key, max_hops=hops).single()
+    nodes, rels = (rec["nodes"], rec["rels"]) if rec else ([], [])
+    size = len(json.dumps(nodes)) + len(json.dumps(rels))
+    if fields:
+        for cypher, ids in ((Q.HYDRATE_NODES, [n[0] for n in nodes]), (Q.HYDRATE_RELS, [r[0] for r in rels])):
+            for b in _batches(ids):
+                size += sum(len(json.dumps(r["vals"], default=str)) for r in s.run(cypher, ids=b, fields=fields))
+    return len(nodes), len(rels), size
+
+def bench(driver, args):
+    fields = [f for f in args.fields.split(",") if f]
+    starts = [("pde", f"{PREFIX}pde:0:0"), ("site", f"{PREFIX}site")] if args.start == "both" else \
+             [("pde", f"{PREFIX}pde:0:0")] if args.start == "pde" else [("site", f"{PREFIX}site")]
+    modes = [("paths", run_paths), ("subgraph", run_subgraph)]
+    results = []
+    print(f"{'start':<5} {'hops':>4} {'mode':<9} {'p50_ms':>10} {'p95_ms':>10} {'nodes':>7} {'edges':>7} {'bytes':>11}")
+    for kind, key in starts:
+        for hops in [int(h) for h in args.hops.split(",")]:
+            for mode, fn in modes:
+                times, out, err = [], None, None
+                with driver.session() as s:
+                    for i in range(args.warmup + args.runs):
+                        t0 = time.perf_counter()
+                        try:
+                            out = fn(s, kind, key, hops, fields)
+                        except Exception as e:  # e.g. out of memory / transaction timeout on paths
+                            err = str(e).splitlines()[0]
+                            break
+                        if i >= args.warmup:
+                            times.append(time.perf_counter() - t0)
+                row = {"start": kind, "hops": hops, "mode": mode, "p50_ms": round(percentile(times, 50) * 1000, 1),
+                       "p95_ms": round(percentile(times, 95) * 1000, 1), "runs": len(times), "error": err}
+                if out:
+                    row.update(nodes=out[0], edges=out[1], bytes=out[2])
+                results.append(row)
+                if err:
+                    print(f"{kind:<5} {hops:>4} {mode:<9} failed: {err}")
+                else:
+                    print(f"{kind:<5} {hops:>4} {mode:<9} {row['p50_ms']:>10.1f} {row['p95_ms']:>10.1f} "
+                          f"{row['nodes']:>7} {row['edges']:>7} {row['bytes']:>11}")
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare traversal=paths vs traversal=subgraph on a synthetic hub-heavy graph")
+    ap.add_argument("--uri", default=os.getenv("NEO4J_URI", "bolt://localhost:7687"))
+    ap.add_argument("--user", default=os.getenv("NEO4J_USER", "neo4j"))
+    ap.add_argument("--password", default=os.getenv("NEO4J_PASS", "password"))
+    ap.add_argument("--seed", action="store_true", help="Create the bench:* graph before benchmarking")
+    ap.add_argument("--cleanup", action="store_true", help="Delete the bench:* graph and exit")
+    ap.add_argument("--layers", type=int, default=6)
+    ap.add_argument("--width", type=int, default=200, help="PDEs per layer")
+    ap.add_argument("--fanout", type=int, default=3, help="Random FLOWS_TO per PDE into the next layer")
+    ap.add_argument("--hubs", type=int, default=3, help="Hub PDEs per layer")
+    ap.add_argument("--random-seed", type=int, default=7)
+    ap.add_argument("--hops", default="2,4,6")
+    ap.add_argument("--start", choices=["pde", "site", "both"], default="pde")
+    ap.add_argument("--fields", default="name,op", help="Properties hydrated by the subgraph mode")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--json", default=None, help="Also write results as JSON to this path")
+    args = ap.parse_args()
+
+    driver = GraphDatabase.driver(args.uri, auth=(args.user, args.password))
+    try:
+        if args.cleanup:
+            cleanup(driver)
+            return
+        if args.seed:
+            seed_graph(driver, args)
+        results = bench(driver, args)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        driver.close()
+
+if __name__ == "__main__":
+    main()
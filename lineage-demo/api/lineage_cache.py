@@ -0,0 +1,213 @@
+"""
+Response cache for the lineage API.
+
+Entries are serialized response bodies keyed on (start kind, start key,
+max_hops). The graph only changes when an ingest finishes, so every entry is
+tagged with the graph version it was computed at; when the version moves the
+whole cache is dropped. On top of that, entries expire after a TTL and the
+cache evicts least-recently-used entries to stay under a byte budget.
+"""
+import asyncio, hashlib, threading, time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    version: int
+    created: float
+    variants: Dict[str, bytes] = field(default_factory=dict)  # content-encoded copies of body
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+def make_etag(version: int, body: bytes) -> str:
+    return f'"v{version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+class LineageCache:
+    def __init__(self, max_bytes: int, ttl_seconds: float, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self.version: Optional[int] = None
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _drop(self, key: Hashable) -> None:
+        e = self._entries.pop(key, None)
+        if e is not None:
+            self._bytes -= e.size
+
+    def _sync_version(self, version: int) -> None:
+        if version != self.version:
+            self._entries.clear()
+            self._bytes = 0
+            self.version = version
+
+    def get(self, key: Hashable, version: int) -> Optional[CacheEntry]:
+        with self._lock:
+            self._sync_version(version)
+            e = self._entries.get(key)
+            if e is None or (self.ttl > 0 and time.monotonic() - e.created > self.ttl):
+                if e is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return e
+
+    def put(self, key: Hashable, entry: CacheEntry) -> bool:
+        if not self.enabled or len(entry.body) > self.max_entry_bytes:
+            return False
+        with self._lock:
+            self._sync_version(entry.version)
+            if entry.version != self.version:
+                return False
+            self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+            return True
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            old_key = next(iter(self._entries))
+            self._drop(old_key)
+            self.evictions += 1
+
+    def variant(self, key: Hashable, entry: CacheEntry, name: str, make: Callable[[bytes], bytes]) -> bytes:
+        """entry.body transformed by `make` (e.g. gzip), memoized on the entry while it is cached."""
+        v = entry.variants.get(name)
+        if v is not None:
+            return v
+        v = make(entry.body)
+        with self._lock:
+            if self._entries.get(key) is entry and name not in entry.variants:
+                entry.variants[name] = v
+                self._bytes += len(v)
+                self._evict()
+        return v
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "ttl_seconds": self.ttl, "version": self.version, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+_END = object()
+
+class StreamFlight:
+    """One producer streaming a response body to any number of subscribers.
+
+    Identical concurrent misses subscribe to the same flight instead of
+    re-running the traversal. The body prefix is retained so late joiners can
+    replay it, but only up to `retain_limit` bytes (the largest cacheable
+    entry); past that the flight stops accepting joiners and keeps nothing, so
+    huge responses stream through without being held in memory. Subscriber
+    queues are bounded, so the producer runs at the pace of its slowest reader.
+    """
+    def __init__(self, retain_limit: int, queue_chunks: int = 64):
+        self.retain_limit = retain_limit
+        self.queue_chunks = queue_chunks
+        self.prefix: list = []
+        self.prefix_bytes = 0
+        self.retaining = True
+        self.done = False
+        self.subscribers: list = []
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def joinable(self) -> bool:
+        return self.retaining and not self.done
+
+    def subscribe(self) -> Optional[asyncio.Queue]:
+        if not self.joinable:
+            return None
+        q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_chunks)
+        if self.prefix:
+            q.put_nowait(b"".join(self.prefix))
+        self.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        if q in self.subscribers:
+            self.subscribers.remove(q)
+        while not q.empty():  # unblock a publish() waiting on this reader's full queue
+            q.get_nowait()
+        if not self.subscribers and not self.done and self.task is not None:
+            self.task.cancel()  # nobody is listening any more
+
+    async def publish(self, chunk: bytes) -> None:
+        if self.retaining:
+            self.prefix.append(chunk)
+            self.prefix_bytes += len(chunk)
+            if self.prefix_bytes > self.retain_limit:
+                self.retaining = False
+                self.prefix = []
+        for q in list(self.subscribers):
+            await q.put(chunk)
+
+    async def finish(self, error: Optional[BaseException] = None) -> Optional[bytes]:
+        """Close all subscriber streams; returns the full body if it was retained."""
+        self.done = True
+        for q in list(self.subscribers):
+            await q.put(error if error is not None else _END)
+        return b"".join(self.prefix) if self.retaining and error is None else None
+
+async def drain(flight: StreamFlight, q: asyncio.Queue) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            item = await q.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        flight.unsubscribe(q)
+
+class GraphVersion:
+    """Graph version read from Neo4j at most once per poll interval.
+
+    `fetch` is a coroutine function returning a number that ingests bump
+    (e.g. the FlowRun count).
+    """
+    def __init__(self, fetch: Callable[[], Awaitable[int]], poll_seconds: float):
+        self._fetch = fetch
+        self.poll = poll_seconds
+        self._value = 0
+        self._checked = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def current(self) -> int:
+        if time.monotonic() - self._checked < self.poll:
+            return self._value
+        async with self._lock:
+            if time.monotonic() - self._checked >= self.poll:
+                try:
+                    self._value = int(await self._fetch())
+                except Exception as e:
+                    print(f"[Lineage API] graph version check failed: {e}")
+                self._checked = time.monotonic()
+        return self._value
@@ -0,0 +1,105 @@
+"""
+Hop-by-hop lineage expansion (/lineage/expand and its SSE variant).
+
+An Expansion wraps a level-synchronous BFS (an async iterator yielding, per
+level, the newly reached nodes and every edge followed from the previous
+level that wasn't sent before, including edges into nodes already visited)
+and keeps the levels computed so far. Levels 1..h together are the same
+graph /lineage returns for max_hops=h. Asking for hop 3 after
+hop 2 computes one more level instead of re-running the traversal, and every
+page of a wide level is a slice of the same stored list. Expansions are kept
+per (start, fields) in a small LRU and belong to one graph version; a newer
+version starts over.
+
+Level nodes are sorted by id, so pages are stable. A page holds up to
+`limit` frontier nodes and the level's edges touching them; the first page
+also carries the level's edges between already-known nodes. Edge endpoints
+on earlier levels are not repeated (the client already has them). Cursors are
+opaque tokens carrying the hop, offset and graph version; one from an older
+version is rejected instead of silently paging a different ordering.
+"""
+import asyncio
+import base64
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+import orjson
+
+Level = Tuple[List[dict], List[dict]]  # (node payloads sorted by id, edge payloads)
+
+class Expansion:
+    def __init__(self, levels: AsyncIterator[Level], version):
+        self.version = version
+        self.levels: List[Level] = []
+        self.done = False
+        self.broken = False  # the traversal failed or was cancelled mid-level
+        self._it = levels
+        self._lock = asyncio.Lock()
+
+    async def level(self, hop: int) -> Optional[Level]:
+        """Level `hop` (1-based), computing any missing levels; None once the BFS has run out."""
+        async with self._lock:
+            while len(self.levels) < hop and not self.done:
+                if self.broken:
+                    raise RuntimeError("expansion aborted")
+                try:
+                    nodes, edges = await self._it.__anext__()
+                except StopAsyncIteration:
+                    self.done = True
+                    break
+                except BaseException:
+                    self.broken = True
+                    raise
+                nodes.sort(key=lambda n: n["data"]["id"])
+                self.levels.append((nodes, edges))
+        return self.levels[hop - 1] if hop <= len(self.levels) else None
+
+class ExpansionCache:
+    """LRU of live expansions keyed by (kind, key, fields); stale or broken entries are replaced."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[tuple, Expansion]" = OrderedDict()
+
+    def get(self, key, version, make) -> Expansion:
+        exp = self._items.get(key)
+        if exp is not None and exp.version == version and not exp.broken:
+            self._items.move_to_end(key)
+            return exp
+        exp = self._items[key] = Expansion(make(), version)
+        self._items.move_to_end(key)
+        while len(self._items) > max(1, self.max_entries):
+            self._items.popitem(last=False)
+        return exp
+
+    def drop(self, key, exp: Expansion) -> None:
+        """Forget `exp` (e.g. after its traversal failed) unless it has already been replaced."""
+        if self._items.get(key) is exp:
+            del self._items[key]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._items), "max_entries": self.max_entries,
+                "levels": sum(len(e.levels) for e in self._items.values())}
+
+def page(level: Level, offset: int, limit: int) -> Level:
+    """Frontier nodes [offset, offset + limit) and the edges that touch them (plus, on the first page, edges touching none)."""
+    nodes = level[0][offset:offset + limit]
+    ids = {n["data"]["id"] for n in nodes}
+    new = {n["data"]["id"] for n in level[0]} if offset == 0 else ()
+    edges = [e for e in level[1] if e["data"]["source"] in ids or e["data"]["target"] in ids
+             or (offset == 0 and e["data"]["source"] not in new and e["data"]["target"] not in new)]
+    return nodes, edges
+
+def encode_cursor(hop: int, offset: int, version) -> str:
+    raw = orjson.dumps({"h": hop, "o": offset, "v": version})
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str) -> Tuple[int, int, object]:
+    """(hop, offset, version); ValueError if the cursor is malformed."""
+    try:
+        d = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        hop, offset = int(d["h"]), int(d["o"])
+        version = d["v"]
+    except Exception:
+        raise ValueError("malformed cursor")
+    if hop < 1 or offset < 0:
+        raise ValueError("malformed cursor")
+    return hop, offset, version
@@ -0,0 +1,273 @@
+"""
+In-memory lineage graph (LINEAGE_ENGINE=memory).
+
+The structural + FLOWS_TO graph is loaded once into NumPy CSR adjacency
+arrays over interned node keys, and /lineage BFS runs over those arrays
+instead of going to Neo4j. Relationship directions follow the same filter
+string as the Cypher traversal (`<T` incoming, `T>` outgoing, bare `T` both).
+
+Ingests only add data (MERGE ... ON CREATE), so a refresh after an ingest
+fetches just the FLOWS_TO rows tagged with the new FlowRun job ids, their
+PDEs and owning Feeds, and rebuilds the CSR arrays from the in-memory edge
+lists (a couple of argsorts, in a worker thread so requests keep being
+served). A periodic full reload picks up anything else.
+
+A snapshot carries the FlowRun count it was loaded at, which is the graph
+version the response cache already uses; callers only serve from a snapshot
+whose version matches, and go to Neo4j otherwise.
+"""
+import asyncio, time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import lineage_queries as Q
+
+def parse_rel_filter(spec: str) -> Dict[str, Tuple[bool, bool]]:
+    """'<HAS|FLOWS_TO|RUNS>' -> {type: (follow outgoing, follow incoming)}."""
+    out: Dict[str, Tuple[bool, bool]] = {}
+    for part in spec.split("|"):
+        part = part.strip()
+        if not part:
+            continue
+        if part.startswith("<"):
+            t, d = part[1:], (False, True)
+        elif part.endswith(">"):
+            t, d = part[:-1], (True, False)
+        else:
+            t, d = part, (True, True)
+        prev = out.get(t, (False, False))
+        out[t] = (prev[0] or d[0], prev[1] or d[1])
+    return out
+
+def _gather(indptr: np.ndarray, order: np.ndarray, frontier: np.ndarray) -> np.ndarray:
+    """Edge ids of every CSR row in `frontier`, concatenated."""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return order[:0]
+    offs = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+    return order[offs]
+
+def _csr(keys: np.ndarray, eids: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    order = eids[np.argsort(keys[eids], kind="stable")]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys[eids], minlength=n), out=indptr[1:])
+    return indptr, order
+
+class GraphSnapshot:
+    def __init__(self, rel_filter: str = Q.REL_FILTER):
+        self.directions = parse_rel_filter(rel_filter)
+        # nodes, interned by key
+        self.keys: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.labels: List[str] = []
+        self.props: List[dict] = []
+        # edges
+        self.types: List[str] = []
+        self.type_index: Dict[str, int] = {}
+        self.e_src: List[int] = []
+        self.e_dst: List[int] = []
+        self.e_type: List[int] = []
+        self.e_props: List[dict] = []
+        self.e_ids: Dict[str, int] = {}
+        self.jobs: set = set()
+        self.version: Optional[int] = None
+        self.full_loaded_at = self.refreshed_at = 0.0
+        self.load_seconds = 0.0
+        self._n = 0
+        self._src = self._dst = np.zeros(0, dtype=np.int64)
+        self._out = self._in = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def add_node(self, key: str, label: str, props: dict) -> int:
+        i = self.index.get(key)
+        if i is None:
+            i = len(self.keys)
+            self.index[key] = i
+            self.keys.append(key)
+            self.labels.append(label)
+            self.props.append(props)
+        else:
+            self.labels[i], self.props[i] = label, props
+        return i
+
+    def add_edge(self, eid: str, src: str, rtype: str, dst: str, props: dict) -> bool:
+        s, d = self.index.get(src), self.index.get(dst)
+        if eid in self.e_ids or s is None or d is None:
+            return False
+        t = self.type_index.get(rtype)
+        if t is None:
+            t = self.type_index[rtype] = len(self.types)
+            self.types.append(rtype)
+        self.e_ids[eid] = len(self.e_src)
+        self.e_src.append(s)
+        self.e_dst.append(d)
+        self.e_type.append(t)
+        self.e_props.append(props)
+        return True
+
+    def build(self) -> None:
+        self.install(self.build_arrays())
+
+    def build_arrays(self) -> tuple:
+        """Compute the CSR arrays without touching the live ones; safe to run in a thread."""
+        n = len(self.keys)
+        src = np.asarray(self.e_src, dtype=np.int64)
+        dst = np.asarray(self.e_dst, dtype=np.int64)
+        tcode = np.asarray(self.e_type, dtype=np.int64)
+        dirs = [self.directions.get(t, (False, False)) for t in self.types]
+        out_ok = np.array([d[0] for d in dirs], dtype=bool)
+        in_ok = np.array([d[1] for d in dirs], dtype=bool)
+        out_e = np.flatnonzero(out_ok[tcode]) if len(tcode) else np.zeros(0, dtype=np.int64)
+        in_e = np.flatnonzero(in_ok[tcode]) if len(tcode) else np.zeros(0, dtype=np.int64)
+        return src, dst, _csr(src, out_e, n), _csr(dst, in_e, n), n
+
+    def install(self, arrays: tuple) -> None:
+        """Swap in arrays from build_arrays(); readers keep using the old ones until then."""
+        self._src, self._dst, self._out, self._in, self._n = arrays
+
+    def start_index(self, key: str, label: Optional[str] = None) -> Optional[int]:
+        i = self.index.get(key)
+        if i is None or i >= self._n or (label and self.labels[i] != label):
+            return None
+        return i
+
+    def traverse(self, key: str, max_hops: int, label: Optional[str] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """BFS up to max_hops; (node ids, edge ids), or None if the start isn't in the snapshot.
+
+        Same result as the paths traversal: every node within max_hops and
+        every followed relationship leaving a node within max_hops - 1.
+        """
+        start = self.start_index(key, label)
+        if start is None:
+            return None
+        visited = np.zeros(self._n, dtype=bool)
+        visited[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        nodes, edges = [frontier], []
+        for _ in range(max_hops):
+            eo = _gather(*self._out, frontier)
+            ei = _gather(*self._in, frontier)
+            edges += [eo, ei]
+            nbr = np.unique(np.concatenate([self._dst[eo], self._src[ei]]))
+            frontier = nbr[~visited[nbr]]
+            if not frontier.size:
+                break
+            visited[frontier] = True
+            nodes.append(frontier)
+        edge_ids = np.unique(np.concatenate(edges))
+        if not edge_ids.size:  # minLevel 1: a start with nothing to follow yields nothing
+            return np.zeros(0, dtype=np.int64), edge_ids
+        return np.concatenate(nodes), edge_ids
+
+    def levels(self, start: int):
+        """BFS one level at a time: yields (new node ids, edge ids).
+
+        A level's edges are every followed edge of the previous level not sent
+        before, including ones into already-visited nodes (diamonds, same-level
+        and back edges), so the levels of hops 1..h add up to traverse(h). A
+        last level may have edges but no new nodes.
+        """
+        out, inc, src, dst = self._out, self._in, self._src, self._dst  # a refresh swaps these; keep one version
+        visited = np.zeros(self._n, dtype=bool)
+        visited[start] = True
+        sent = np.zeros(len(src), dtype=bool)
+        frontier = np.array([start], dtype=np.int64)
+        while True:
+            eo = _gather(*out, frontier)
+            ei = _gather(*inc, frontier)
+            far = np.concatenate([dst[eo], src[ei]])
+            eids = np.unique(np.concatenate([eo, ei]))
+            eids = eids[~sent[eids]]
+            frontier = np.unique(far[~visited[far]])
+            if not frontier.size and not eids.size:
+                return
+            visited[frontier] = True
+            sent[eids] = True
+            yield frontier, eids
+            if not frontier.size:
+                return
+
+    def typed_subgraph(self, rtype: str, label: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Keys of `label` nodes and the `rtype` edges between them, renumbered 0..k-1."""
+        n, m = self._n, len(self._src)
+        is_label = np.array([l == label for l in self.labels[:n]], dtype=bool)
+        nodes = np.flatnonzero(is_label)
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[nodes] = np.arange(len(nodes))
+        t = self.type_index.get(rtype, -1)
+        sel = (np.asarray(self.e_type[:m], dtype=np.int64) == t) & is_label[self._src] & is_label[self._dst]
+        return [self.keys[i] for i in nodes.tolist()], remap[self._src[sel]], remap[self._dst[sel]]
+
+    def parents(self, keys, rtype: str, label: str) -> Dict[str, Tuple[str, str, Optional[str]]]:
+        """{key: (parent key, label, name)} for the first `label` node with an `rtype` edge into each key.
+
+        Only sees relationships the filter follows incoming (e.g. HAS, EXPOSES).
+        """
+        t = self.type_index.get(rtype)
+        indptr, order = self._in
+        out = {}
+        for k in keys:
+            i = self.index.get(k)
+            if t is None or i is None or i >= self._n:
+                continue
+            for e in order[indptr[i]:indptr[i + 1]].tolist():
+                p = self.e_src[e]
+                if self.e_type[e] == t and self.labels[p] == label:
+                    props = self.props[p]
+                    out[k] = (self.keys[p], label, props.get("name") or props.get("path"))
+                    break
+        return out
+
+    def node_payload(self, i: int, fields=None) -> dict:
+        label, props = self.labels[i], self.props[i]
+        if fields is not None:
+            props = {f: props[f] for f in fields if props.get(f) is not None}
+        return {"data": {"id": self.keys[i], "label": label, "type": label, **props}}
+
+    def edge_payload(self, j: int, fields=None) -> dict:
+        src, dst, rtype = self.keys[self.e_src[j]], self.keys[self.e_dst[j]], self.types[self.e_type[j]]
+        props = self.e_props[j]
+        if fields is not None:
+            props = {f: props[f] for f in fields if props.get(f) is not None}
+        return {"data": {"id": f"{src}-{rtype}-{dst}", "source": src, "target": dst, "label": rtype, **props}}
+
+    def stats(self) -> dict:
+        return {"version": self.version, "nodes": len(self.keys), "edges": len(self.e_src),
+                "csr_bytes": int(sum(a.nbytes for a in (self._src, self._dst, *self._out, *self._in))),
+                "load_seconds": round(self.load_seconds, 3),
+                "full_loaded_at": self.full_loaded_at, "refreshed_at": self.refreshed_at}
+
+async def load_snapshot(driver, fetch_size: int = 1000) -> GraphSnapshot:
+    t0 = time.monotonic()
+    snap = GraphSnapshot()
+    async with driver.session(fetch_size=fetch_size) as s:
+        jobs = [r["job_id"] async for r in await s.run(Q.SNAPSHOT_RUNS)]
+        async for r in await s.run(Q.SNAPSHOT_NODES):
+            snap.add_node(r["key"], r["label"], r["props"])
+        async for r in await s.run(Q.SNAPSHOT_RELS):
+            snap.add_edge(r["eid"], r["src"], r["type"], r["dst"], r["props"])
+    snap.install(await asyncio.to_thread(snap.build_arrays))  # argsorts of a big graph: keep the loop serving
+    snap.jobs, snap.version = set(jobs), len(jobs)
+    snap.full_loaded_at = snap.refreshed_at = time.time()
+    snap.load_seconds = time.monotonic() - t0
+    return snap
+
+async def refresh_snapshot(snap: GraphSnapshot, driver, fetch_size: int = 1000) -> int:
+    """Apply ingests finished since the snapshot was loaded; returns the number of new runs."""
+    async with driver.session(fetch_size=fetch_size) as s:
+        jobs = [r["job_id"] async for r in await s.run(Q.SNAPSHOT_RUNS)]
+        new = [j for j in jobs if j not in snap.jobs]
+        if new:
+            async for r in await s.run(Q.SNAPSHOT_DELTA_NODES, jobs=new):
+                snap.add_node(r["key"], r["label"], r["props"])
+                if r["feed_key"] is not None:
+                    snap.add_node(r["feed_key"], r["feed_label"], r["feed_props"])
+                    snap.add_edge(r["has_eid"], r["feed_key"], "HAS", r["key"], r["has_props"] or {})
+            async for r in await s.run(Q.SNAPSHOT_DELTA_RELS, jobs=new):
+                snap.add_edge(r["eid"], r["src"], r["type"], r["dst"], r["props"])
+    if new:
+        snap.install(await asyncio.to_thread(snap.build_arrays))
+    snap.jobs.update(new)
+    snap.version = len(jobs)
+    snap.refreshed_at = time.time()
+    return len(new)
@@ -0,0 +1,204 @@
+"""
+Prometheus metrics and the slow-query log for the lineage API.
+
+Every traversal a response is built from runs under a Trace (a contextvar
+set by the task that produces the body). Row generators note which engine
+served them and the Cypher they ran; the producer times how long it waited on
+rows (Neo4j queries + hydration, or the snapshot BFS) versus how long the
+serializer spent on top, and counts the nodes/edges that went out.
+
+Traces over the slow threshold land in SlowLog, keyed by (endpoint, start
+kind, start key, max_hops), which keeps the worst time per key. The first
+slow Neo4j trace for a key (and again after `profile_interval`) gets its
+traversal query re-run under PROFILE in the background, one at a time, and
+the operator tree is kept with the entry.
+"""
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from prometheus_client import Gauge, Histogram
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+REQUEST_SECONDS = Histogram("lineage_request_seconds", "Request latency until the last body byte is sent",
+                            ["endpoint", "max_hops"], buckets=LATENCY_BUCKETS)
+QUERY_SECONDS = Histogram("lineage_query_seconds", "Time waiting on result rows (Neo4j queries and hydration, or snapshot BFS)",
+                          ["endpoint", "engine"], buckets=LATENCY_BUCKETS)
+SERIALIZE_SECONDS = Histogram("lineage_serialize_seconds", "Time serializing result rows into the response body",
+                              ["endpoint", "format"], buckets=LATENCY_BUCKETS)
+RESULT_NODES = Histogram("lineage_result_nodes", "Nodes per traversal result", ["endpoint"], buckets=COUNT_BUCKETS)
+RESULT_EDGES = Histogram("lineage_result_edges", "Edges per traversal result", ["endpoint"], buckets=COUNT_BUCKETS)
+BOLT_POOL = Gauge("lineage_bolt_pool_connections", "Bolt pool connections by state", ["state"])  # in_use | idle | max
+
+@dataclass
+class Trace:
+    endpoint: str
+    kind: str
+    key: str
+    max_hops: Optional[int]
+    fmt: str = "cytoscape"
+    engine: str = "none"  # neo4j | memory | none (served from kept state)
+    queries: List[Tuple[str, dict]] = field(default_factory=list)
+    fetch_seconds: float = 0.0
+    serialize_seconds: float = 0.0
+    nodes: int = 0
+    edges: int = 0
+
+TRACE: ContextVar[Optional[Trace]] = ContextVar("lineage_trace", default=None)
+
+def note_query(cypher: str, **params) -> None:
+    """Record a traversal query on the current trace (kept for PROFILE)."""
+    t = TRACE.get()
+    if t is not None:
+        t.engine = "neo4j"
+        t.queries.append((cypher, params))
+
+def note_engine(engine: str) -> None:
+    t = TRACE.get()
+    if t is not None:
+        t.engine = engine
+
+async def timed_rows(rows, trace: Trace):
+    """Pass rows through, adding the time spent waiting on them to trace.fetch_seconds."""
+    while True:
+        t0 = time.perf_counter()
+        try:
+            row = await rows.__anext__()
+        except StopAsyncIteration:
+            trace.fetch_seconds += time.perf_counter() - t0
+            return
+        trace.fetch_seconds += time.perf_counter() - t0
+        if row[0] == "node":
+            trace.nodes += 1
+        elif row[0] == "edge":
+            trace.edges += 1
+        yield row
+
+async def traced_body(serialize, rows, trace: Trace, done=None):
+    """serialize(rows) under `trace`, then done(trace).
+
+    Serialization time is the serializer's own time minus the wait on rows;
+    time the consumer takes between chunks isn't counted.
+    """
+    TRACE.set(trace)
+    body = serialize(timed_rows(rows, trace))
+    total = 0.0
+    while True:
+        t0 = time.perf_counter()
+        try:
+            chunk = await body.__anext__()
+        except StopAsyncIteration:
+            total += time.perf_counter() - t0
+            break
+        total += time.perf_counter() - t0
+        yield chunk
+    trace.serialize_seconds = max(0.0, total - trace.fetch_seconds)
+    if done is not None:
+        done(trace)
+
+def observe(trace: Trace) -> None:
+    QUERY_SECONDS.labels(trace.endpoint, trace.engine).observe(trace.fetch_seconds)
+    SERIALIZE_SECONDS.labels(trace.endpoint, trace.fmt).observe(trace.serialize_seconds)
+    RESULT_NODES.labels(trace.endpoint).observe(trace.nodes)
+    RESULT_EDGES.labels(trace.endpoint).observe(trace.edges)
+
+def pool_stats(driver, max_size: int) -> dict:
+    """In-use/idle Bolt connections. Reads the driver's private pool, so absent fields read as 0."""
+    in_use = idle = 0
+    try:
+        for conns in list(driver._pool.connections.values()):
+            for c in list(conns):
+                if getattr(c, "in_use", False):
+                    in_use += 1
+                else:
+                    idle += 1
+    except Exception:
+        pass
+    return {"in_use": in_use, "idle": idle, "max": max_size}
+
+def update_pool_metrics(driver, max_size: int) -> None:
+    for state, n in pool_stats(driver, max_size).items():
+        BOLT_POOL.labels(state).set(n)
+
+class LatencyMiddleware:
+    """ASGI middleware observing REQUEST_SECONDS per route template and max_hops (or hop)."""
+    def __init__(self, app, max_hops_label: int = 16):
+        self.app = app
+        self.max_hops_label = max_hops_label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "other"
+            if endpoint != "/metrics":
+                REQUEST_SECONDS.labels(endpoint, self._hops(scope)).observe(time.perf_counter() - t0)
+
+    def _hops(self, scope) -> str:
+        qs = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        v = (qs.get("max_hops") or qs.get("hop") or [""])[0]
+        return v if v.isdigit() and 1 <= int(v) <= self.max_hops_label else ""
+
+def summarize_profile(p: Optional[dict]) -> Optional[dict]:
+    """Operator tree of a PROFILE summary, reduced to operator/rows/dbHits/time per node."""
+    if not p:
+        return None
+    out = {"operator": (p.get("operatorType") or "").split("@")[0], "rows": p.get("rows"), "db_hits": p.get("dbHits")}
+    if p.get("time") is not None:
+        out["time_ms"] = round(p["time"] / 1e6, 2)  # reported in nanoseconds
+    kids = [summarize_profile(c) for c in p.get("children") or ()]
+    if kids:
+        out["children"] = kids
+    return out
+
+def total_db_hits(plan: Optional[dict]) -> int:
+    if not plan:
+        return 0
+    return (plan.get("db_hits") or 0) + sum(total_db_hits(c) for c in plan.get("children", ()))
+
+class SlowLog:
+    def __init__(self, threshold_ms: float, max_keys: int = 500, profile_interval: float = 600):
+        self.threshold_ms = threshold_ms
+        self.max_keys = max_keys
+        self.profile_interval = profile_interval
+        self.entries: Dict[tuple, dict] = {}
+        self.profiling = False
+
+    def record(self, trace: Trace, seconds: float) -> Optional[dict]:
+        """Add a trace that took `seconds`; returns its entry if it was slow, else None."""
+        ms = seconds * 1000
+        if self.threshold_ms <= 0 or ms < self.threshold_ms:
+            return None
+        k = (trace.endpoint, trace.kind, trace.key, trace.max_hops)
+        e = self.entries.get(k)
+        if e is None:
+            if len(self.entries) >= self.max_keys:
+                # forget the mildest key to make room
+                del self.entries[min(self.entries, key=lambda x: self.entries[x]["worst_ms"])]
+            e = self.entries[k] = {"endpoint": trace.endpoint, "kind": trace.kind, "key": trace.key,
+                                   "max_hops": trace.max_hops, "count": 0, "worst_ms": 0.0, "total_ms": 0.0,
+                                   "plan": None, "profiled_at": None}
+        e["count"] += 1
+        e["total_ms"] += ms
+        e["last_ms"] = round(ms, 1)
+        e["last_at"] = time.time()
+        e.update(engine=trace.engine, nodes=trace.nodes, edges=trace.edges,
+                 query_ms=round(trace.fetch_seconds * 1000, 1), serialize_ms=round(trace.serialize_seconds * 1000, 1))
+        e["worst_ms"] = round(max(e["worst_ms"], ms), 1)
+        return e
+
+    def wants_profile(self, entry: dict, trace: Trace) -> bool:
+        if self.profiling or trace.engine != "neo4j" or not trace.queries:
+            return False
+        return entry["profiled_at"] is None or time.time() - entry["profiled_at"] > self.profile_interval
+
+    def worst(self, limit: int = 20) -> List[dict]:
+        rows = sorted(self.entries.values(), key=lambda e: e["worst_ms"], reverse=True)[:limit]
+        return [{**e, "total_ms": round(e["total_ms"], 1), "avg_ms": round(e["total_ms"] / e["count"], 1)} for e in rows]
@@ -0,0 +1,178 @@
+"""
+Cypher for lineage traversals, shared by the API and the bench scripts.
+
+Two traversal modes:
+
+- `paths`: the original query. apoc.path.expandConfig enumerates every path
+  up to max_hops, then flattens and de-duplicates nodes/relationships and
+  returns full objects. Cost grows with the number of paths, which explodes
+  around hubs and diamonds.
+- `subgraph`: apoc.path.subgraphAll expands with NODE_GLOBAL uniqueness, so
+  each node is visited once, and only (elementId, key, label/type) tuples
+  come back. Properties are hydrated afterwards for just the requested
+  fields, in batched elementId lookups.
+"""
+
+# Structural + flow relationships
+REL_FILTER = "<HAS|<EXPOSES|<USES|<RUNS|<HOSTED_ON|FLOWS_TO"
+
+START_MATCH = {
+    "pde": "MATCH (start:PDE {pde_key:$key})",
+    "site": "MATCH (start:Website {site_key:$key})",
+}
+
+def node_id_expr(v: str) -> str:
+    # Same precedence as the API's _node_id, evaluated server-side
+    return (f"coalesce({v}.site_key, {v}.server_key, {v}.soft_key, {v}.dir_key, "
+            f"{v}.feed_key, {v}.pde_key, {v}.dc_id, {v}.rack_id)")
+
+def label_expr(v: str) -> str:
+    # Prefer the specific label if :Asset also present
+    return f"head([l IN labels({v}) WHERE l <> 'Asset'] + labels({v}) + ['Node'])"
+
+def paths_query(kind: str) -> str:
+    """Full-object traversal; streams node rows, then edge rows (UNION ALL branches run in order)."""
+    return f"""
+    {START_MATCH[kind]}
+    CALL apoc.path.expandConfig(start, {{
+      relationshipFilter: "{REL_FILTER}",
+      minLevel: 1, maxLevel: $max_hops, bfs:true
+    }}) YIELD path
+    WITH collect(path) AS paths
+    WITH [p IN paths | nodes(p)] AS node_lists, [p IN paths | relationships(p)] AS rel_lists
+    WITH apoc.coll.toSet(apoc.coll.flatten(node_lists)) AS uniq_nodes,
+         apoc.coll.toSet(apoc.coll.flatten(rel_lists)) AS uniq_rels
+    CALL {{
+      WITH uniq_nodes
+      UNWIND uniq_nodes AS n
+      RETURN n AS node, null AS rel, null AS src, null AS dst
+      UNION ALL
+      WITH uniq_rels
+      UNWIND uniq_rels AS r
+      WITH r, startNode(r) AS s, endNode(r) AS e
+      RETURN null AS node, r AS rel, {node_id_expr("s")} AS src, {node_id_expr("e")} AS dst
+    }}
+    RETURN node, rel, src, dst
+    """
+
+def subgraph_query(kind: str) -> str:
+    """NODE_GLOBAL subgraph expansion returning compact tuples.
+
+    nodes: [elementId, key, label]; rels: [elementId, src key, type, dst key]
+    """
+    return f"""
+    {START_MATCH[kind]}
+    CALL apoc.path.subgraphAll(start, {{
+      relationshipFilter: "{REL_FILTER}",
+      maxLevel: $max_hops
+    }}) YIELD nodes, relationships
+    RETURN [n IN nodes | [elementId(n), {node_id_expr("n")}, {label_expr("n")}]] AS nodes,
+           [r IN relationships | [elementId(r), {node_id_expr("startNode(r)")}, type(r), {node_id_expr("endNode(r)")}]] AS rels
+    """
+
+# Batched property hydration for the subgraph mode; elementId lookups are seeks, not scans
+HYDRATE_NODES = "UNWIND $ids AS id MATCH (n) WHERE elementId(n) = id RETURN id, [f IN $fields | n[f]] AS vals"
+HYDRATE_RELS = "UNWIND $ids AS id MATCH ()-[r]->() WHERE elementId(r) = id RETURN id, [f IN $fields | r[f]] AS vals"
+
+# In-memory snapshot (LINEAGE_ENGINE=memory): full load, then per-ingest deltas
+REL_TYPES = "|".join(p.strip("<>") for p in REL_FILTER.split("|"))
+
+SNAPSHOT_RUNS = "MATCH (fr:FlowRun) RETURN fr.job_id AS job_id"
+
+SNAPSHOT_NODES = f"""
+MATCH (n) WITH n, {node_id_expr("n")} AS key WHERE key IS NOT NULL
+RETURN key, {label_expr("n")} AS label, properties(n) AS props
+"""
+
+SNAPSHOT_RELS = f"""
+MATCH (a)-[r:{REL_TYPES}]->(b)
+RETURN elementId(r) AS eid, {node_id_expr("a")} AS src, type(r) AS type, {node_id_expr("b")} AS dst, properties(r) AS props
+"""
+
+# Ingests MERGE PDEs/Feeds/HAS and add FLOWS_TO tagged with the run's job_id (see scanner ingest_neo4j)
+SNAPSHOT_DELTA_NODES = f"""
+UNWIND $jobs AS j
+MATCH (a:PDE)-[:FLOWS_TO {{job_id:j}}]->(b:PDE)
+UNWIND [a, b] AS p
+WITH DISTINCT p
+OPTIONAL MATCH (f:Feed)-[h:HAS]->(p)
+RETURN p.pde_key AS key, {label_expr("p")} AS label, properties(p) AS props,
+       f.feed_key AS feed_key, CASE WHEN f IS NULL THEN null ELSE {label_expr("f")} END AS feed_label,
+       CASE WHEN f IS NULL THEN null ELSE properties(f) END AS feed_props,
+       elementId(h) AS has_eid, CASE WHEN h IS NULL THEN null ELSE properties(h) END AS has_props
+"""
+
+SNAPSHOT_DELTA_RELS = f"""
+UNWIND $jobs AS j
+MATCH (a)-[r:FLOWS_TO {{job_id:j}}]->(b)
+RETURN elementId(r) AS eid, {node_id_expr("a")} AS src, type(r) AS type, {node_id_expr("b")} AS dst, properties(r) AS props
+"""
+
+# Many start keys in one round trip: per-start reach lists plus one de-duplicated subgraph
+BATCH_SUBGRAPH = f"""
+CALL {{
+  UNWIND $pde_keys AS k MATCH (start:PDE {{pde_key:k}}) RETURN k, start
+  UNION ALL
+  UNWIND $site_keys AS k MATCH (start:Website {{site_key:k}}) RETURN k, start
+}}
+CALL apoc.path.subgraphAll(start, {{
+  relationshipFilter: "{REL_FILTER}",
+  maxLevel: $max_hops
+}}) YIELD nodes, relationships
+WITH collect({{key: k, ids: [n IN nodes | {node_id_expr("n")}]}}) AS reach,
+     apoc.coll.toSet(apoc.coll.flatten(collect(nodes))) AS uniq_nodes,
+     apoc.coll.toSet(apoc.coll.flatten(collect(relationships))) AS uniq_rels
+RETURN reach,
+       [n IN uniq_nodes | [elementId(n), {node_id_expr("n")}, {label_expr("n")}]] AS nodes,
+       [r IN uniq_rels | [elementId(r), {node_id_expr("startNode(r)")}, type(r), {node_id_expr("endNode(r)")}]] AS rels
+"""
+
+# Reachability index input: the PDE FLOWS_TO graph
+REACH_NODES = "MATCH (p:PDE) RETURN p.pde_key AS key"
+REACH_EDGES = "MATCH (a:PDE)-[:FLOWS_TO]->(b:PDE) RETURN DISTINCT a.pde_key AS src, b.pde_key AS dst"
+
+# Containers for summarization (max_nodes=): PDE -> Feed, Feed -> Directory or Software
+PARENT_FEEDS = """
+UNWIND $keys AS k
+MATCH (f:Feed)-[:HAS]->(:PDE {pde_key:k})
+WITH k, head(collect(f)) AS f
+RETURN k AS key, f.feed_key AS parent, 'Feed' AS label, f.name AS name
+"""
+
+PARENT_CONTAINERS = """
+UNWIND $keys AS k
+MATCH (f:Feed {feed_key:k})
+OPTIONAL MATCH (d:Directory)-[:EXPOSES]->(f)
+OPTIONAL MATCH (s:Software)-[:READS|WRITES]->(f)
+WITH k, head(collect(DISTINCT d)) AS d, head(collect(DISTINCT s)) AS s
+WHERE d IS NOT NULL OR s IS NOT NULL
+RETURN k AS key,
+       CASE WHEN d IS NULL THEN s.soft_key ELSE d.dir_key END AS parent,
+       CASE WHEN d IS NULL THEN 'Software' ELSE 'Directory' END AS label,
+       CASE WHEN d IS NULL THEN s.name ELSE d.path END AS name
+"""
+
+# Hop-by-hop expansion (/lineage/expand): one level-synchronous BFS step per query
+def step_predicate(r: str, a: str) -> str:
+    """Cypher condition that following `r` away from `a` obeys REL_FILTER."""
+    clauses = []
+    for part in REL_FILTER.split("|"):
+        if part.startswith("<"):
+            clauses.append(f"(type({r}) = '{part[1:]}' AND endNode({r}) = {a})")
+        elif part.endswith(">"):
+            clauses.append(f"(type({r}) = '{part[:-1]}' AND startNode({r}) = {a})")
+        else:
+            clauses.append(f"type({r}) = '{part}'")
+    return " OR ".join(clauses)
+
+def expand_start_query(kind: str) -> str:
+    return f"{START_MATCH[kind]} RETURN elementId(start) AS id"
+
+EXPAND_STEP = f"""
+UNWIND $ids AS id
+MATCH (a) WHERE elementId(a) = id
+MATCH (a)-[r:{REL_TYPES}]-(b)
+WHERE {step_predicate("r", "a")}
+RETURN elementId(r) AS rid, {node_id_expr("startNode(r)")} AS src, type(r) AS type, {node_id_expr("endNode(r)")} AS dst,
+       elementId(b) AS bid, {node_id_expr("b")} AS key, {label_expr("b")} AS label
+"""
@@ -0,0 +1,217 @@
+"""
+Reachability index over the PDE FLOWS_TO graph (/reachable, /impact/count).
+
+Built once per graph version, off the event loop:
+
+- cycles are condensed into strongly connected components (SciPy), giving a
+  DAG of components with a topological rank;
+- each component gets `labels` GRAIL-style interval labels [low, post] from
+  randomized DFS post-orders. If u reaches v then every label of v nests in
+  the label of u, so most negative answers cost a few comparisons;
+- below `closure_max_nodes` PDEs the full transitive closure is kept as
+  Python-int bitsets (bits numbered in topological order, stored shifted so
+  each set only spans its descendants), which makes positive answers and
+  downstream/upstream counts O(1). Above it, positive answers fall back to a
+  DFS pruned by rank and intervals, and counts are BFS results cached per
+  component until the next rebuild (callers run an uncached count in a
+  thread; see counts_ready).
+"""
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+def _adjacency(a: np.ndarray, b: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(a, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(a, minlength=n), out=indptr[1:])
+    return indptr, b[order]
+
+class ReachIndex:
+    def __init__(self, keys: Sequence[str], src: np.ndarray, dst: np.ndarray, version: Optional[int] = None,
+                 labels: int = 2, closure_max_nodes: int = 20000, count_cache_size: int = 100000, seed: int = 0):
+        self.keys = list(keys)
+        self.index: Dict[str, int] = {k: i for i, k in enumerate(self.keys)}
+        self.version = version
+        n = len(self.keys)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+
+        g = csr_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+        self.ncomp, comp = connected_components(g, directed=True, connection="strong")
+        self.comp = comp.astype(np.int64)
+        self.size = np.bincount(self.comp, minlength=self.ncomp)
+        cs, cd = self.comp[src], self.comp[dst]
+        keep = cs != cd
+        pairs = np.unique(np.stack([cs[keep], cd[keep]], axis=1), axis=0) if keep.any() else np.zeros((0, 2), dtype=np.int64)
+        self.n_edges = len(pairs)
+        self.children = _adjacency(pairs[:, 0], pairs[:, 1], self.ncomp)
+        self.parents = _adjacency(pairs[:, 1], pairs[:, 0], self.ncomp)
+
+        self.topo = self._toposort()
+        self.rank = np.empty(self.ncomp, dtype=np.int64)
+        self.rank[self.topo] = np.arange(self.ncomp)
+
+        rnd = random.Random(seed)
+        self.intervals = [self._interval_label(rnd) for _ in range(max(1, labels))]
+
+        self._closure: Optional[List[int]] = None
+        self._offset: Optional[np.ndarray] = None
+        self._down: Optional[np.ndarray] = None
+        self._up: Optional[np.ndarray] = None
+        self._count_cache: Dict[Tuple[str, int], int] = {}
+        self._count_cache_size = count_cache_size
+        if n <= closure_max_nodes:
+            self._build_closure()
+
+    # ---- construction ----
+    def _kids(self, c: int) -> np.ndarray:
+        indptr, idx = self.children
+        return idx[indptr[c]:indptr[c + 1]]
+
+    def _parents_of(self, c: int) -> np.ndarray:
+        indptr, idx = self.parents
+        return idx[indptr[c]:indptr[c + 1]]
+
+    def _toposort(self) -> np.ndarray:
+        indeg = np.diff(self.parents[0]).copy()
+        ready = list(np.flatnonzero(indeg == 0))
+        out = []
+        while ready:
+            c = ready.pop()
+            out.append(c)
+            for ch in self._kids(c).tolist():
+                indeg[ch] -= 1
+                if indeg[ch] == 0:
+                    ready.append(ch)
+        return np.asarray(out, dtype=np.int64)
+
+    def _interval_label(self, rnd: random.Random) -> Tuple[np.ndarray, np.ndarray]:
+        """Randomized DFS post-order `post` and low = min post over descendants."""
+        post = np.full(self.ncomp, -1, dtype=np.int64)
+        roots = np.flatnonzero(np.diff(self.parents[0]) == 0).tolist()
+        rnd.shuffle(roots)
+        counter = 0
+        for r in roots:
+            if post[r] >= 0:
+                continue
+            post[r] = -2  # on stack
+            kids = self._kids(r).tolist()
+            rnd.shuffle(kids)
+            stack = [(r, kids)]
+            while stack:
+                c, kids = stack[-1]
+                while kids and post[kids[-1]] != -1:
+                    kids.pop()
+                if kids:
+                    ch = kids.pop()
+                    post[ch] = -2
+                    nxt = self._kids(ch).tolist()
+                    rnd.shuffle(nxt)
+                    stack.append((ch, nxt))
+                else:
+                    post[c] = counter
+                    counter += 1
+                    stack.pop()
+        low = post.copy()
+        for c in np.argsort(post).tolist():  # children finish first
+            kids = self._kids(c)
+            if kids.size:
+                low[c] = min(low[c], int(low[kids].min()))
+        return low, post
+
+    def _build_closure(self) -> None:
+        # Downstream sets: bits numbered by topological position, stored relative to each component's offset
+        offset = np.zeros(self.ncomp, dtype=np.int64)
+        offset[self.topo] = np.concatenate([[0], np.cumsum(self.size[self.topo])[:-1]]) if self.ncomp else []
+        closure = [0] * self.ncomp
+        down = np.zeros(self.ncomp, dtype=np.int64)
+        for c in reversed(self.topo.tolist()):
+            r = (1 << int(self.size[c])) - 1
+            o = int(offset[c])
+            for ch in self._kids(c).tolist():
+                r |= closure[ch] << (int(offset[ch]) - o)
+            closure[c] = r
+            down[c] = r.bit_count()
+        # Upstream sets only feed the counts, so they are dropped once counted
+        rev = self.topo[::-1]
+        up_offset = np.zeros(self.ncomp, dtype=np.int64)
+        up_offset[rev] = np.concatenate([[0], np.cumsum(self.size[rev])[:-1]]) if self.ncomp else []
+        ups = [0] * self.ncomp
+        up = np.zeros(self.ncomp, dtype=np.int64)
+        for c in self.topo.tolist():
+            r = (1 << int(self.size[c])) - 1
+            o = int(up_offset[c])
+            for p in self._parents_of(c).tolist():
+                r |= ups[p] << (int(up_offset[p]) - o)
+            ups[c] = r
+            up[c] = r.bit_count()
+        self._closure, self._offset, self._down, self._up = closure, offset, down, up
+
+    # ---- queries ----
+    def _nests(self, u: int, v: int) -> bool:
+        return all(low[u] <= low[v] and post[v] <= post[u] for low, post in self.intervals)
+
+    def reachable(self, src: str, dst: str) -> bool:
+        """True if dst is downstream of src (or in the same cycle). KeyError on unknown keys."""
+        cu, cv = int(self.comp[self.index[src]]), int(self.comp[self.index[dst]])
+        if cu == cv:
+            return True
+        if self.rank[cu] >= self.rank[cv] or not self._nests(cu, cv):
+            return False
+        if self._closure is not None:
+            return bool((self._closure[cu] >> int(self._offset[cv] - self._offset[cu])) & 1)
+        rank_v = self.rank[cv]
+        stack, seen = [cu], {cu}
+        while stack:
+            for ch in self._kids(stack.pop()).tolist():
+                if ch == cv:
+                    return True
+                if ch in seen or self.rank[ch] >= rank_v or not self._nests(ch, cv):
+                    continue
+                seen.add(ch)
+                stack.append(ch)
+        return False
+
+    def _bfs_count(self, c: int, direction: str) -> int:
+        key = (direction, c)
+        hit = self._count_cache.get(key)
+        if hit is not None:
+            return hit
+        step = self._kids if direction == "down" else self._parents_of
+        seen = {c}
+        frontier = [c]
+        total = int(self.size[c])
+        while frontier:
+            nxt = []
+            for x in frontier:
+                for y in step(x).tolist():
+                    if y not in seen:
+                        seen.add(y)
+                        nxt.append(y)
+                        total += int(self.size[y])
+            frontier = nxt
+        if len(self._count_cache) >= self._count_cache_size:
+            self._count_cache.clear()
+        self._count_cache[key] = total
+        return total
+
+    def counts_ready(self, key: str) -> bool:
+        """True if counts(key) is a lookup (closure, or both directions cached); False if it needs a BFS."""
+        c = int(self.comp[self.index[key]])
+        return self._down is not None or (("down", c) in self._count_cache and ("up", c) in self._count_cache)
+
+    def counts(self, key: str) -> dict:
+        """Downstream/upstream PDE counts for `key`, excluding itself (cycle peers are counted both ways)."""
+        c = int(self.comp[self.index[key]])
+        if self._down is not None:
+            down, up = int(self._down[c]), int(self._up[c])
+        else:
+            down, up = self._bfs_count(c, "down"), self._bfs_count(c, "up")
+        return {"downstream": down - 1, "upstream": up - 1, "scc_size": int(self.size[c])}
+
+    def stats(self) -> dict:
+        return {"version": self.version, "nodes": len(self.keys), "components": int(self.ncomp),
+                "dag_edges": int(self.n_edges), "labels": len(self.intervals),
+                "closure": self._closure is not None, "cached_counts": len(self._count_cache)}
@@ -0,0 +1,118 @@
+"""
+Server-side summarization for oversized /lineage results (max_nodes=).
+
+When a result has more nodes than the budget, members are folded into their
+container one level at a time until it fits:
+
+1. PDEs into their Feed (HAS);
+2. Feeds, with whatever was folded into them, into the Directory that
+   EXPOSES them, or failing that a Software that READS/WRITES them.
+
+A container that is already in the result keeps its payload and gains
+`collapsed` ({"PDE": n, ...}) and `internal_edges` counts; one that isn't is
+synthesized (`synthetic: true`). Edges are re-pointed at the
+representatives and parallel ones merged with a `count`. If the top level
+still doesn't fit, nodes are cut at the budget in traversal order and
+`truncated` is set.
+
+Groups listed in `expand` stay open and are never folded themselves, which
+is what drill-down uses.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (member type, level name) in folding order
+LEVELS = (("PDE", "feed"), ("Feed", "container"))
+
+Parent = Tuple[str, str, Optional[str]]  # (parent id, parent label, parent name)
+
+def summarize(nodes: List[dict], edges: List[dict], parents: Dict[str, Parent], max_nodes: int,
+              expand: Iterable[str] = (), only: Optional[str] = None) -> Tuple[List[dict], List[dict], dict]:
+    """Fold `nodes`/`edges` (Cytoscape payloads, traversal order) to at most `max_nodes`.
+
+    `parents` maps PDE ids to their Feed and Feed ids to their Directory or
+    Software. With `only`, return just the members of that group (and the
+    nodes they connect to) from the summarized graph.
+    """
+    expand = set(expand)
+    by_id = {n["data"]["id"]: n for n in nodes}
+    order = list(by_id)
+    rep = {i: i for i in order}
+    synthetic: Dict[str, dict] = {}
+    summary = {"max_nodes": max_nodes, "original_nodes": len(order), "original_edges": len(edges),
+               "level": "none", "truncated": False}
+    if expand:
+        summary["expanded"] = sorted(expand)
+
+    def node_type(x):
+        return by_id[x]["data"].get("type") if x in by_id else synthetic[x]["data"]["type"]
+
+    for member_type, level in LEVELS:
+        if len(set(rep.values())) <= max_nodes:
+            break
+        fold = {}
+        for r in list(set(rep.values())):
+            p = parents.get(r)
+            if p is None or r in expand or p[0] in expand or node_type(r) != member_type:
+                continue
+            fold[r] = p[0]
+            if p[0] not in by_id and p[0] not in synthetic:
+                synthetic[p[0]] = {"data": {"id": p[0], "label": p[1], "type": p[1], "name": p[2], "synthetic": True}}
+                rep[p[0]] = p[0]  # so it can fold at the next level and be counted there
+        if fold:
+            rep = {i: fold.get(r, r) for i, r in rep.items()}
+            summary["level"] = level
+
+    folded: Dict[str, Counter] = {}
+    for i, r in rep.items():
+        if i != r:
+            folded.setdefault(r, Counter())[node_type(i)] += 1
+
+    # Edges between representatives; drop the ones that fell inside a group
+    internal = Counter()
+    first: Dict[tuple, dict] = {}
+    parallel = Counter()
+    for e in edges:
+        d = e["data"]
+        s, t = rep.get(d["source"]), rep.get(d["target"])
+        if s is None or t is None:
+            continue
+        if s == t and (s != d["source"] or t != d["target"]):
+            internal[s] += 1
+            continue
+        k = (s, d.get("label"), t)
+        parallel[k] += 1
+        first.setdefault(k, e)
+    agg = []
+    for (s, label, t), e in first.items():
+        n = parallel[(s, label, t)]
+        if n == 1 and (s, t) == (e["data"]["source"], e["data"]["target"]):
+            agg.append(e)
+        else:
+            agg.append({"data": {"id": f"{s}-{label}-{t}", "source": s, "target": t, "label": label, "count": n}})
+
+    # Only nodes from the result anchor the output; synthetic ones show up via their members
+    reps = list(dict.fromkeys(rep[i] for i in order))
+    if only is not None:
+        members = list(dict.fromkeys(rep[i] for i in order if parents.get(i, (None,))[0] == only))
+        if len(members) > max_nodes:
+            members, summary["truncated"] = members[:max_nodes], True
+        keep = set(members)
+        out_edges = [e for e in agg if e["data"]["source"] in keep or e["data"]["target"] in keep]
+        reps = members + [r for r in dict.fromkeys(x for e in out_edges for x in (e["data"]["source"], e["data"]["target"]))
+                          if r not in keep]
+        summary["group"] = only
+        summary["members"] = len(members)
+    elif len(reps) > max_nodes:
+        reps, summary["truncated"] = reps[:max_nodes], True
+    keep = set(reps)
+
+    out_nodes = []
+    for r in reps:
+        base = by_id[r] if r in by_id else synthetic[r]
+        if r in folded or internal.get(r):
+            base = {"data": {**base["data"], "collapsed": dict(folded.get(r, {})), "internal_edges": internal.get(r, 0)}}
+        out_nodes.append(base)
+    out_edges = [e for e in agg if e["data"]["source"] in keep and e["data"]["target"] in keep]
+    summary["nodes"], summary["edges"] = len(out_nodes), len(out_edges)
+    return out_nodes, out_edges, summary
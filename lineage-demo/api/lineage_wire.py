@@ -0,0 +1,117 @@
+"""
+Wire formats and content encodings for lineage responses.
+
+`format=compact` ("compact-v1") replaces the Cytoscape element list with
+columns over a shared string table:
+
+    {"format": "compact-v1",
+     "strings": ["orders_db.orders.id", "PDE", "name", ...],
+     "nodes": {"id": [0, ...], "type": [1, ...], "props": [<column>, ...], "x": [...], "y": [...]},
+     "edges": {"src": [0, ...], "dst": [3, ...], "label": [7, ...], "props": [<column>, ...]},
+     ...any extra keys (summary, reach)}
+
+A column is {"name": <string index>, "kind": "s" | "v", "values": [...]},
+one value per node/edge, null where the property is missing. "s" columns
+hold string-table indices, "v" columns raw JSON values. Edge endpoints are
+indices into the node arrays, and edge ids are not sent: they are always
+`${source}-${label}-${target}` and are rebuilt by the decoder
+(web/assets/common.js decodeCompact). "x"/"y" are only present when the nodes
+carry positions (layout=layered), null for a node without one.
+
+Responses are compressed with brotli or gzip when the client accepts it.
+"""
+import zlib
+from typing import Dict, List, Optional
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPACT_VERSION = "compact-v1"
+
+class StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def add(self, s: str) -> int:
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+def _columns(datas: List[dict], skip, table: StringTable) -> List[dict]:
+    names = list(dict.fromkeys(k for d in datas for k in d if k not in skip))
+    cols = []
+    for name in names:
+        vals = [d.get(name) for d in datas]
+        if all(v is None or isinstance(v, str) for v in vals):
+            cols.append({"name": table.add(name), "kind": "s", "values": [None if v is None else table.add(v) for v in vals]})
+        else:
+            cols.append({"name": table.add(name), "kind": "v", "values": vals})
+    return cols
+
+def encode_compact(nodes: List[dict], edges: List[dict], meta: Optional[dict] = None) -> dict:
+    """Cytoscape node/edge payloads -> compact-v1 dict. Edges with an endpoint not in `nodes` are dropped."""
+    t = StringTable()
+    nd = [n["data"] for n in nodes]
+    index = {d["id"]: i for i, d in enumerate(nd)}
+    skip = {"id", "type"} | ({"label"} if all(d.get("label") == d.get("type") for d in nd) else set())
+    out_nodes = {
+        "id": [t.add(str(d["id"])) for d in nd],
+        "type": [t.add(d.get("type") or "") for d in nd],
+        "props": _columns(nd, skip, t),
+    }
+    if any("position" in n for n in nodes):
+        out_nodes["x"] = [n["position"]["x"] if "position" in n else None for n in nodes]
+        out_nodes["y"] = [n["position"]["y"] if "position" in n else None for n in nodes]
+    ed = [e["data"] for e in edges if e["data"].get("source") in index and e["data"].get("target") in index]
+    out_edges = {
+        "src": [index[d["source"]] for d in ed],
+        "dst": [index[d["target"]] for d in ed],
+        "label": [t.add(d.get("label") or "") for d in ed],
+        "props": _columns(ed, {"id", "source", "target", "label"}, t),
+    }
+    return {"format": COMPACT_VERSION, "strings": t.strings, "nodes": out_nodes, "edges": out_edges, **(meta or {})}
+
+# ---------------- content encoding ----------------
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None for identity."""
+    prefs = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            prefs[name.strip().lower()] = q
+    star = prefs.get("*", 0.0)
+    for enc in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if prefs.get(enc, star) > 0:
+            return enc
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return c.compress(body) + c.flush()
+
+class StreamCompressor:
+    """Incremental br/gzip; each chunk is flushed so clients can start parsing early."""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._c = brotli.Compressor(quality=5) if encoding == "br" else zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(chunk) + self._c.flush()
+        return self._c.compress(chunk) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.finish() if self.encoding == "br" else self._c.flush()
@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # the API modules live flat in /app
+from lineage_graph import GraphSnapshot
+from lineage_expand import page
+
+def _diamond():
+    # a -> b, a -> c, b -> d, c -> d (diamond), b -> c (same level), d -> e, e -> b (back edge)
+    g = GraphSnapshot()
+    for k in "abcde":
+        g.add_node(k, "PDE", {"pde_key": k})
+    for i, (s, d) in enumerate(["ab", "ac", "bd", "cd", "bc", "de", "eb"]):
+        g.add_edge(f"r{i}", s, "FLOWS_TO", d, {})
+    g.build()
+    return g
+
+def test_levels_add_up_to_one_shot_traversal():
+    g = _diamond()
+    levels = list(g.levels(g.start_index("a")))
+    assert [sorted(g.keys[i] for i in n.tolist()) for n, _ in levels] == [["b", "c"], ["d", "e"], []]
+    sent = [j for _, e in levels for j in e.tolist()]
+    assert len(sent) == len(set(sent))  # every edge exactly once
+    for hops in range(1, 6):
+        nodes, edges = g.traverse("a", hops)
+        got = levels[:hops]
+        assert {0} | {i for n, _ in got for i in n.tolist()} == set(nodes.tolist())
+        assert {j for _, e in got for j in e.tolist()} == set(edges.tolist())
+
+def test_pages_carry_edges_between_known_nodes_once():
+    def edge(s, d):
+        return {"data": {"id": f"{s}-{d}", "source": s, "target": d}}
+    level = ([{"data": {"id": "x"}}, {"data": {"id": "y"}}], [edge("x", "y"), edge("o1", "x"), edge("o1", "o2"), edge("o2", "y")])
+    first, second = page(level, 0, 1), page(level, 1, 1)
+    assert [e["data"]["id"] for e in first[1]] == ["x-y", "o1-x", "o1-o2"]
+    assert [e["data"]["id"] for e in second[1]] == ["x-y", "o2-y"]
+    only_edges = ([], [edge("o1", "o2")])
+    assert page(only_edges, 0, 10) == ([], [edge("o1", "o2")])
@@ -9,3 +9,4 @@ CREATE CONSTRAINT flow_job_id IF NOT EXISTS FOR (n:FlowRun) REQUIRE n.job_id IS
 CREATE INDEX pde_name IF NOT EXISTS FOR (n:PDE) ON (n.name);
 CREATE INDEX feed_name IF NOT EXISTS FOR (n:Feed) ON (n.name);
 CREATE INDEX soft_name IF NOT EXISTS FOR (n:Software) ON (n.name, n.version);
+CREATE INDEX flows_job_id IF NOT EXISTS FOR ()-[r:FLOWS_TO]-() ON (r.job_id);
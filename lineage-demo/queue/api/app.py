@@ -10,6 +10,7 @@ from logging_util import setup_json_logging
 DB_PATH = os.getenv("DB_PATH", "/data/queue.db")
 BACKUP_DIR = os.getenv("BACKUP_DIR", "/backups")
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
 LOG = setup_json_logging("queue.api")
 
 app = FastAPI(title="Lineage Event Bus & Queue")
@@ -19,8 +20,8 @@ app.add_middleware(
     allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
 )
 
-INIT_SQL = '''
-PRAGMA journal_mode=WAL;
+INIT_SQL = f'''
+PRAGMA journal_mode={JOURNAL_MODE};
 CREATE TABLE IF NOT EXISTS events (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   created_at TEXT NOT NULL,
@@ -34,8 +35,8 @@ CREATE TABLE IF NOT EXISTS jobs (
   scheduled_at TEXT NOT NULL,
   started_at TEXT,
   finished_at TEXT,
-  status TEXT NOT NULL,            -- queued|running|done|error|canceled
-  type TEXT NOT NULL,              -- ingest
+  status TEXT NOT NULL,            -- queued|running|waiting|done|error|canceled
+  type TEXT NOT NULL,              -- ingest|ingest_sharded|scan_shard|scan_reduce
   priority INTEGER NOT NULL DEFAULT 0,
   attempts INTEGER NOT NULL DEFAULT 0,
   max_attempts INTEGER NOT NULL DEFAULT 3,
@@ -45,11 +46,40 @@ CREATE TABLE IF NOT EXISTS jobs (
   git_branch TEXT,
   conn_name TEXT,
   owner TEXT,
-  flow_job_id TEXT
+  flow_job_id TEXT,
+  lease_owner TEXT,                -- worker holding the job while running
+  lease_expires_at TEXT,           -- renewed by heartbeats; reaped when past
+  heartbeat_at TEXT,
+  reclaims INTEGER NOT NULL DEFAULT 0,
+  parent_id INTEGER,               -- sharded scans: the ingest_sharded job a shard/reduce belongs to
+  payload TEXT                     -- JSON job arguments (shard files, sharding options)
+);
+-- scan_shard output (compressed JSON) until the reduce has ingested it
+CREATE TABLE IF NOT EXISTS job_results (
+  job_id INTEGER PRIMARY KEY,
+  parent_id INTEGER NOT NULL,
+  created_at TEXT NOT NULL,
+  data BLOB NOT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, scheduled_at);
+-- fair-share scheduling: per-key head of line and longest-waiting job
+CREATE INDEX IF NOT EXISTS idx_jobs_fair ON jobs(status, conn_name, owner, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_fair_wait ON jobs(status, conn_name, owner, scheduled_at, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_parent ON jobs(parent_id, type, status);
+CREATE INDEX IF NOT EXISTS idx_job_results_parent ON job_results(parent_id);
 '''
 
+# Columns added after the first release; CREATE TABLE IF NOT EXISTS won't add them to existing DBs
+JOB_COLUMN_MIGRATIONS = [
+    ("lease_owner", "TEXT"),
+    ("lease_expires_at", "TEXT"),
+    ("heartbeat_at", "TEXT"),
+    ("reclaims", "INTEGER NOT NULL DEFAULT 0"),
+    ("parent_id", "INTEGER"),
+    ("payload", "TEXT"),
+]
+
 # Metrics
 EVENTS_PUBLISHED = Counter("queue_events_published_total", "Events published")
 JOBS_ENQUEUED = Counter("queue_jobs_enqueued_total", "Jobs enqueued", ["type"])
@@ -59,12 +89,20 @@ JOBS_CREATED_LAT = Histogram("queue_job_enqueue_latency_seconds", "Enqueue proce
 async def init_db():
     LOG.info({"event":"init_db", "db_path": DB_PATH})
     async with aiosqlite.connect(DB_PATH) as db:
+        # migrate before INIT_SQL: its indexes reference the new columns
+        cols = {r[1] for r in await (await db.execute("PRAGMA table_info(jobs)")).fetchall()}
+        if cols:
+            for name, ddl in JOB_COLUMN_MIGRATIONS:
+                if name not in cols:
+                    await db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {ddl}")
+                    LOG.info({"event":"migrate","table":"jobs","column":name})
+            await db.commit()
         await db.executescript(INIT_SQL)
         await db.commit()
 
 async def update_status_metrics():
     async with aiosqlite.connect(DB_PATH) as db:
-        for st in ["queued","running","done","error","canceled"]:
+        for st in ["queued","running","waiting","done","error","canceled"]:
             cur = await db.execute("SELECT COUNT(1) FROM jobs WHERE status=?", (st,))
             n = (await cur.fetchone())[0]
             JOBS_STATUS.labels(status=st).set(n)
@@ -93,7 +131,7 @@ async def publish(evt: PublishEvent):
     t0 = datetime.datetime.utcnow()
     now = t0.strftime("%Y-%m-%dT%H:%M:%SZ")
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("PRAGMA journal_mode=WAL;")
+        await db.execute(f"PRAGMA journal_mode={JOURNAL_MODE};")
         await db.execute("INSERT INTO events(created_at, source, key, payload) VALUES (?,?,?,?)",
                          (now, "api", evt.key, json.dumps(evt.payload)))
         await db.commit()
@@ -112,25 +150,32 @@ class IngestJob(BaseModel):
     priority: int = 0
     schedule_at: Optional[str] = None  # ISO; default now
     max_attempts: int = 3
+    shard_files: int = 0               # >0: map-reduce scan, at most this many files per shard job
+    shard_by: str = "dir"              # dir (keep directories together) | files (plain file-count cut)
 
 @app.post("/jobs/ingest")
 async def create_job(j: IngestJob):
     if not j.repo_path and not j.git_url:
         raise HTTPException(400, "Provide repo_path or git_url")
+    if j.shard_by not in ("dir", "files"):
+        raise HTTPException(400, "shard_by must be 'dir' or 'files'")
     now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
     sched = j.schedule_at or now
+    jtype, payload = "ingest", None
+    if j.shard_files > 0:
+        jtype, payload = "ingest_sharded", json.dumps({"max_files": j.shard_files, "by": j.shard_by})
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("PRAGMA journal_mode=WAL;")
+        await db.execute(f"PRAGMA journal_mode={JOURNAL_MODE};")
         cur = await db.execute(
-            "INSERT INTO jobs(created_at, scheduled_at, status, type, priority, repo_path, git_url, git_branch, conn_name, owner, max_attempts) "
-            "VALUES (?,?,?,?,?,?,?,?,?,?,?)",
-            (now, sched, "queued", "ingest", j.priority, j.repo_path, j.git_url, j.git_branch, j.conn_name, j.owner or "", j.max_attempts)
+            "INSERT INTO jobs(created_at, scheduled_at, status, type, priority, repo_path, git_url, git_branch, conn_name, owner, max_attempts, payload) "
+            "VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+            (now, sched, "queued", jtype, j.priority, j.repo_path, j.git_url, j.git_branch, j.conn_name, j.owner or "", j.max_attempts, payload)
         )
         jid = cur.lastrowid
         await db.commit()
-    JOBS_ENQUEUED.labels("ingest").inc()
+    JOBS_ENQUEUED.labels(jtype).inc()
     await _notify_sse({"type":"job","id":jid,"status":"queued","created_at":now})
-    LOG.info({"event":"enqueue","job_id":jid,"type":"ingest","conn":j.conn_name,"repo_path":j.repo_path,"git_url":j.git_url})
+    LOG.info({"event":"enqueue","job_id":jid,"type":jtype,"conn":j.conn_name,"repo_path":j.repo_path,"git_url":j.git_url})
     return {"ok": True, "id": jid}
 
 @app.get("/jobs")
@@ -158,7 +203,10 @@ async def get_job(jid: int):
 @app.post("/jobs/{jid}/cancel")
 async def cancel_job(jid: int):
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE jobs SET status='canceled' WHERE id=? AND status IN ('queued','running')", (jid,))
+        # a sharded scan is canceled as a whole, whether via the parent or one of its children
+        row = await (await db.execute("SELECT coalesce(parent_id, id) FROM jobs WHERE id=?", (jid,))).fetchone()
+        root = row[0] if row else jid
+        await db.execute("UPDATE jobs SET status='canceled' WHERE (id=? OR parent_id=?) AND status IN ('queued','running','waiting')", (root, root))
         await db.commit()
     await _notify_sse({"type":"job","id":jid,"status":"canceled"})
     LOG.info({"event":"cancel","job_id":jid})
@@ -211,7 +259,7 @@ async def github_hook(request: Request):
     branch = (payload.get("ref","").split("/")[-1] if payload.get("ref") else None)
     now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("PRAGMA journal_mode=WAL;")
+        await db.execute(f"PRAGMA journal_mode={JOURNAL_MODE};")
         await db.execute("INSERT INTO events(created_at, source, key, payload) VALUES (?,?,?,?)",
                          (now, "github", event, json.dumps(payload)))
         await db.execute(
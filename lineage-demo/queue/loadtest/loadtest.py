@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Queue load test: drives /publish and /jobs/ingest at fixed rates against a
+throwaway SQLite DB while M simulated workers claim jobs through the real
+worker loop (real fetch_and_lock_job, stub run_job). Everything runs in one
+process; the API is called in-process over ASGI, so no ports are needed.
+
+Reports enqueue latency percentiles, claim throughput, time spent waiting on
+the SQLite write lock (SQLITE_BUSY) and end-to-end job pickup latency.
+
+Example:
+  python queue/loadtest/loadtest.py --duration 30 --enqueue-rate 50 --workers 8 --poll-interval 0.2
+"""
+from __future__ import annotations
+import os, sys, time, json, random, asyncio, argparse, tempfile, sqlite3
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUEUE_DIR = os.path.dirname(HERE)
+SCANNER_DIR = os.path.join(os.path.dirname(QUEUE_DIR), "scanner")
+
+# ---------------- Stats ----------------
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile, q in [0, 100]. Returns 0.0 for no samples."""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    if len(xs) == 1:
+        return xs[0]
+    pos = (len(xs) - 1) * (q / 100.0)
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds from samples in seconds."""
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+    }
+
+class Stats:
+    def __init__(self):
+        self.publish_lat: List[float] = []
+        self.enqueue_lat: List[float] = []
+        self.http_errors = 0
+        self.enqueued_at: Dict[int, float] = {}
+        self.claimed_at: Dict[int, float] = {}
+        self.claims = 0
+        self.empty_polls = 0
+        self.claim_lat: List[float] = []
+        self.busy_wait = 0.0
+        self.busy_errors = 0
+
+    def pickup_latencies(self) -> List[float]:
+        return [max(0.0, t - self.enqueued_at[j]) for j, t in self.claimed_at.items() if j in self.enqueued_at]
+
+# ---------------- Instrumented DB handle ----------------
+class TimedConnection:
+    """Wraps an aiosqlite connection and times lock acquisition (BEGIN ...).
+
+    With a busy timeout, SQLite blocks inside BEGIN IMMEDIATE until the write
+    lock is free, so the statement's wall time is the SQLITE_BUSY wait.
+    """
+    def __init__(self, db, stats: Stats):
+        object.__setattr__(self, "_db", db)
+        object.__setattr__(self, "_stats", stats)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._db, name, value)
+
+    async def execute(self, sql, *args, **kwargs):
+        if not sql.lstrip().upper().startswith("BEGIN"):
+            return await self._db.execute(sql, *args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return await self._db.execute(sql, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                self._stats.busy_errors += 1
+            raise
+        finally:
+            self._stats.busy_wait += time.perf_counter() - t0
+
+# ---------------- Load generators ----------------
+async def open_loop(rate: float, duration: float, fire) -> List[asyncio.Task]:
+    """Fire requests on a fixed schedule (open loop) so slow responses don't
+    throttle the offered load; latency is measured from the intended send time."""
+    tasks: List[asyncio.Task] = []
+    if rate <= 0:
+        return tasks
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    n = 0
+    while True:
+        due = start + n * interval
+        if due - start >= duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(due, n)))
+        n += 1
+    return tasks
+
+async def run(args) -> dict:
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="queue-loadtest-"), "queue.db")
+    # Module-level settings are read at import time, so configure env first.
+    os.environ["DB_PATH"] = db_path
+    os.environ["SQLITE_JOURNAL_MODE"] = args.journal_mode
+    os.environ["SCHEDULER"] = args.scheduler
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    for p in (QUEUE_DIR, os.path.join(QUEUE_DIR, "api"), os.path.join(QUEUE_DIR, "worker"), SCANNER_DIR):
+        if p not in sys.path:
+            sys.path.insert(0, p)
+    import httpx
+    import app as queue_app
+    import worker
+
+    await queue_app.init_db()
+    stats = Stats()
+
+    real_fetch = worker.fetch_and_lock_job
+    async def timed_fetch(db, *args, **kwargs):
+        t0 = time.perf_counter()
+        row = await real_fetch(TimedConnection(db, stats), *args, **kwargs)
+        stats.claim_lat.append(time.perf_counter() - t0)
+        if row is None:
+            stats.empty_polls += 1
+        else:
+            stats.claims += 1
+            stats.claimed_at[row["id"]] = time.perf_counter()
+        return row
+
+    async def stub_run_job(row):
+        if args.job_ms > 0:
+            await asyncio.sleep(args.job_ms / 1000.0)
+
+    worker.fetch_and_lock_job = timed_fetch
+    worker.run_job = stub_run_job
+    worker.POLL_INTERVAL = args.poll_interval
+
+    conns = [f"conn_{i}" for i in range(max(1, args.conns))]
+    transport = httpx.ASGITransport(app=queue_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://queue") as client:
+        async def publish(due, n):
+            try:
+                r = await client.post("/publish", json={"key": "loadtest:event", "payload": {"n": n}})
+                r.raise_for_status()
+            except Exception:
+                stats.http_errors += 1
+                return
+            stats.publish_lat.append(time.perf_counter() - due)
+
+        async def enqueue(due, n):
+            body = {"repo_path": f"/repos/r{n}", "conn_name": random.choice(conns), "owner": "loadtest"}
+            try:
+                r = await client.post("/jobs/ingest", json=body)
+                r.raise_for_status()
+            except Exception:
+                stats.http_errors += 1
+                return
+            done = time.perf_counter()
+            stats.enqueue_lat.append(done - due)
+            stats.enqueued_at[r.json()["id"]] = due
+
+        workers = [asyncio.create_task(worker.worker_loop(i)) for i in range(args.workers)]
+        workers.append(asyncio.create_task(worker.reaper_loop()))
+        t0 = time.perf_counter()
+        gens = await asyncio.gather(
+            open_loop(args.publish_rate, args.duration, publish),
+            open_loop(args.enqueue_rate, args.duration, enqueue),
+        )
+        for tasks in gens:
+            if tasks:
+                await asyncio.gather(*tasks)
+        produced_in = time.perf_counter() - t0
+
+        # Drain: let workers pick up what was enqueued
+        deadline = time.perf_counter() + args.drain_timeout
+        while time.perf_counter() < deadline and any(j not in stats.claimed_at for j in stats.enqueued_at):
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - t0
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    unclaimed = sum(1 for j in stats.enqueued_at if j not in stats.claimed_at)
+    return {
+        "config": {
+            "duration_s": args.duration, "publish_rate": args.publish_rate, "enqueue_rate": args.enqueue_rate,
+            "workers": args.workers, "poll_interval_s": args.poll_interval, "job_ms": args.job_ms,
+            "journal_mode": args.journal_mode, "scheduler": args.scheduler, "conns": args.conns, "db": db_path,
+        },
+        "publish_latency": summarize(stats.publish_lat),
+        "enqueue_latency": summarize(stats.enqueue_lat),
+        "http_errors": stats.http_errors,
+        "claims": stats.claims,
+        "claim_throughput_per_s": round(stats.claims / elapsed, 2) if elapsed else 0.0,
+        "claim_call_latency": summarize(stats.claim_lat),
+        "empty_polls": stats.empty_polls,
+        "busy_wait_s": round(stats.busy_wait, 4),
+        "busy_wait_per_claim_ms": round(stats.busy_wait / max(1, stats.claims + stats.empty_polls) * 1000, 3),
+        "busy_errors": stats.busy_errors,
+        "pickup_latency": summarize(stats.pickup_latencies()),
+        "unclaimed_after_drain": unclaimed,
+        "produce_window_s": round(produced_in, 3),
+        "elapsed_s": round(elapsed, 3),
+    }
+
+def print_report(res: dict) -> None:
+    cfg = res["config"]
+    print(f"[loadtest] workers={cfg['workers']} poll={cfg['poll_interval_s']}s journal={cfg['journal_mode']} scheduler={cfg['scheduler']} "
+          f"publish={cfg['publish_rate']}/s enqueue={cfg['enqueue_rate']}/s job={cfg['job_ms']}ms for {cfg['duration_s']}s")
+    for name in ("publish_latency", "enqueue_latency", "claim_call_latency", "pickup_latency"):
+        s = res[name]
+        print(f"  {name:<20} n={s['count']:<7} p50={s['p50_ms']:>9.2f}ms p95={s['p95_ms']:>9.2f}ms "
+              f"p99={s['p99_ms']:>9.2f}ms max={s['max_ms']:>9.2f}ms")
+    print(f"  claims={res['claims']} ({res['claim_throughput_per_s']}/s) empty_polls={res['empty_polls']} "
+          f"unclaimed={res['unclaimed_after_drain']} http_errors={res['http_errors']}")
+    print(f"  sqlite busy wait={res['busy_wait_s']}s ({res['busy_wait_per_claim_ms']}ms/claim) busy_errors={res['busy_errors']}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local load test for the SQLite job queue")
+    ap.add_argument("--duration", type=float, default=10.0, help="Seconds of offered load")
+    ap.add_argument("--publish-rate", type=float, default=20.0, help="POST /publish per second")
+    ap.add_argument("--enqueue-rate", type=float, default=20.0, help="POST /jobs/ingest per second")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")), help="Simulated worker loops (WORKER_CONCURRENCY)")
+    ap.add_argument("--poll-interval", type=float, default=float(os.getenv("POLL_INTERVAL", "3")), help="Worker idle poll interval (POLL_INTERVAL)")
+    ap.add_argument("--job-ms", type=float, default=50.0, help="Stub run_job duration in ms")
+    ap.add_argument("--journal-mode", default=os.getenv("SQLITE_JOURNAL_MODE", "WAL"), help="SQLite journal mode (WAL, DELETE, TRUNCATE, ...)")
+    ap.add_argument("--scheduler", default=os.getenv("SCHEDULER", "priority"), help="Worker job selection: priority|fair")
+    ap.add_argument("--conns", type=int, default=1, help="Spread jobs over this many conn_name values")
+    ap.add_argument("--drain-timeout", type=float, default=30.0, help="Seconds to wait for workers to pick up remaining jobs")
+    ap.add_argument("--db", default=None, help="SQLite path (default: fresh temp file)")
+    ap.add_argument("--json", default=None, help="Also write the result as JSON to this path")
+    args = ap.parse_args()
+
+    res = asyncio.run(run(args))
+    print_report(res)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
+
+if __name__ == "__main__":
+    main()
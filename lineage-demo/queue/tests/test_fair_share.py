@@ -0,0 +1,63 @@
+import asyncio, aiosqlite
+from queue.api.app import INIT_SQL
+from queue.worker.scheduler import FairShareConfig, parse_key_map, pick_fair_share, pick_priority, queued_keys
+
+NOW = "2025-01-01T12:00:00Z"
+
+async def _db_with_jobs(path, jobs):
+    db = await aiosqlite.connect(path)
+    await db.executescript(INIT_SQL)
+    for j in jobs:
+        await db.execute(
+            "INSERT INTO jobs(created_at, scheduled_at, status, type, priority, conn_name, owner) VALUES (?,?,?,?,?,?,?)",
+            (j.get("at", NOW), j.get("at", NOW), j.get("status", "queued"), "ingest", j.get("priority", 0), j["conn"], j.get("owner", "")))
+    await db.commit()
+    return db
+
+def test_parse_key_map():
+    assert parse_key_map("conn:bulk=0.5, owner:search=4") == {("conn","bulk"): 0.5, ("owner","search"): 4.0}
+    assert parse_key_map("") == {}
+
+def test_fair_share_interleaves_and_caps(tmp_path):
+    async def go():
+        jobs = [{"conn": "bulk"} for _ in range(5)] + [{"conn": "bulk", "status": "running"}] + [{"conn": "interactive"}]
+        db = await _db_with_jobs(str(tmp_path / "q.db"), jobs)
+        # FIFO would pick job 1 (bulk); fair share prefers the idle key
+        assert await pick_priority(db, NOW) == 1
+        assert await pick_fair_share(db, NOW, FairShareConfig()) == 7
+        # a cap on the bulk connection blocks it entirely while one bulk job runs
+        await db.execute("DELETE FROM jobs WHERE id=7"); await db.commit()
+        cfg = FairShareConfig(caps={("conn", "bulk"): 1})
+        assert await pick_fair_share(db, NOW, cfg) is None
+        await db.close()
+    asyncio.run(go())
+
+def test_aging_lets_old_low_priority_job_win(tmp_path):
+    async def go():
+        old = "2025-01-01T10:00:00Z"  # waited 2h
+        db = await _db_with_jobs(str(tmp_path / "q.db"), [{"conn": "a", "at": old, "priority": 0}, {"conn": "a", "priority": 5}])
+        assert await pick_fair_share(db, NOW, FairShareConfig(aging_seconds=0)) == 2
+        assert await pick_fair_share(db, NOW, FairShareConfig(aging_seconds=600)) == 1  # 0 + 7200/600 = 12 > 5
+        await db.close()
+    asyncio.run(go())
+
+def test_queued_keys_skip_scan_matches_group_by(tmp_path):
+    async def go():
+        jobs = [{"conn": c, "owner": o, "status": st} for c in (None, "", "a", "b") for o in (None, "", "x")
+                for st in ("queued", "queued", "done")] + [{"conn": "z", "owner": "q", "status": "running"}]
+        db = await _db_with_jobs(str(tmp_path / "q.db"), jobs)
+        want = await (await db.execute("SELECT conn_name, owner FROM jobs WHERE status='queued' GROUP BY conn_name, owner")).fetchall()
+        assert sorted(map(tuple, await queued_keys(db)), key=repr) == sorted(map(tuple, want), key=repr)
+        assert len(want) == 12
+        await db.close()
+    asyncio.run(go())
+
+def test_aging_picks_longest_waiting_not_lowest_id(tmp_path):
+    async def go():
+        # job 1 was retried into backoff-then-ready recently; job 2 has been ready for 2h
+        db = await _db_with_jobs(str(tmp_path / "q.db"), [{"conn": "a", "at": "2025-01-01T11:59:00Z"},
+                                                          {"conn": "a", "at": "2025-01-01T10:00:00Z"},
+                                                          {"conn": "a", "priority": 5}])
+        assert await pick_fair_share(db, NOW, FairShareConfig(aging_seconds=600)) == 2
+        await db.close()
+    asyncio.run(go())
@@ -0,0 +1,81 @@
+import asyncio, aiosqlite
+from queue.api.app import INIT_SQL
+from queue.worker import worker
+
+def test_expired_lease_is_requeued_then_errors(tmp_path):
+    async def go():
+        db = await aiosqlite.connect(str(tmp_path / "q.db"))
+        await db.executescript(INIT_SQL)
+        past, future = "2000-01-01T00:00:00Z", "2999-01-01T00:00:00Z"
+        rows = [
+            (past, 0, 3, "dead-pod/0"),   # expired -> requeued
+            (future, 0, 3, "live-pod/0"),  # healthy lease -> untouched
+            (past, 2, 3, "dead-pod/1"),   # last attempt -> error
+        ]
+        for exp, attempts, max_attempts, owner in rows:
+            await db.execute(
+                "INSERT INTO jobs(created_at, scheduled_at, started_at, status, type, attempts, max_attempts, conn_name, owner, lease_owner, lease_expires_at) "
+                "VALUES (?,?,?,?,?,?,?,?,?,?,?)", (past, past, past, "running", "ingest", attempts, max_attempts, "c", "", owner, exp))
+        await db.commit()
+        assert await worker.reap_expired_leases(db) == 2
+        got = {r[0]: r[1:] for r in await (await db.execute("SELECT id, status, attempts, reclaims, lease_owner FROM jobs")).fetchall()}
+        assert got[1] == ("queued", 1, 1, None)
+        assert got[2] == ("running", 0, 0, "live-pod/0")
+        assert got[3][0] == "error"
+        await db.close()
+    asyncio.run(go())
+
+def test_completion_is_fenced_on_lease(tmp_path):
+    async def go():
+        db = await aiosqlite.connect(str(tmp_path / "q.db"))
+        await db.executescript(INIT_SQL)
+        await db.execute("INSERT INTO jobs(created_at, scheduled_at, status, type, lease_owner) VALUES ('x','x','running','ingest','new-owner')")
+        await db.commit()
+        n = await worker.finish_job(db, "UPDATE jobs SET status='done'", (), 1, "old-owner")
+        assert n == 0
+        assert (await (await db.execute("SELECT status FROM jobs")).fetchone())[0] == "running"
+        await db.close()
+    asyncio.run(go())
+
+def test_job_longer_than_lease_keeps_it(tmp_path, monkeypatch):
+    # A blocking scan must not starve heartbeat(); another pod's reaper runs in a separate thread
+    import threading, time
+    db_path = str(tmp_path / "q.db")
+    monkeypatch.setattr(worker, "DB_PATH", db_path)
+    monkeypatch.setattr(worker, "LEASE_SECONDS", 1.0)
+    monkeypatch.setattr(worker, "HEARTBEAT_INTERVAL", 0.2)
+    monkeypatch.setattr(worker, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(worker, "scan_path", lambda *a, **k: time.sleep(3) or {})
+    monkeypatch.setattr(worker, "ingest_results", lambda *a: None)
+    reaped = []
+    stop = threading.Event()
+
+    def other_pod():
+        async def reap():
+            async with aiosqlite.connect(db_path) as rdb:
+                while not stop.is_set():
+                    reaped.append(await worker.reap_expired_leases(rdb))
+                    await asyncio.sleep(0.2)
+        asyncio.run(reap())
+
+    async def go():
+        async with aiosqlite.connect(db_path) as db:
+            await db.executescript(INIT_SQL)
+            await db.execute("INSERT INTO jobs(created_at, scheduled_at, status, type, repo_path, conn_name, owner) "
+                             "VALUES ('2000-01-01T00:00:00Z','2000-01-01T00:00:00Z','queued','ingest','/repo','c','')")
+            await db.commit()
+        reaper = threading.Thread(target=other_pod); reaper.start()
+        loop = asyncio.create_task(worker.worker_loop(0))
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.1)
+                async with aiosqlite.connect(db_path) as db:
+                    row = await (await db.execute("SELECT status, attempts, reclaims FROM jobs WHERE id=1")).fetchone()
+                if row[0] not in ("queued", "running"):
+                    break
+        finally:
+            loop.cancel(); await asyncio.gather(loop, return_exceptions=True)
+            stop.set(); reaper.join()
+        assert tuple(row) == ("done", 0, 0)
+        assert not any(reaped)
+    asyncio.run(go())
@@ -0,0 +1,14 @@
+from queue.loadtest.loadtest import percentile, summarize
+
+def test_percentile_interpolates():
+    xs = [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert percentile(xs, 0) == 0.1
+    assert percentile(xs, 100) == 0.5
+    assert abs(percentile(xs, 50) - 0.3) < 1e-9
+    assert percentile([], 95) == 0.0
+
+def test_summarize_reports_ms():
+    s = summarize([0.001, 0.002, 0.003])
+    assert s["count"] == 3
+    assert s["p50_ms"] == 2.0
+    assert s["max_ms"] == 3.0
@@ -0,0 +1,105 @@
+import asyncio, aiosqlite
+from queue.api.app import INIT_SQL
+from queue.worker import sharded, worker
+
+NOW = "2025-01-01T12:00:00Z"
+
+async def _db_with_parent(path):
+    db = await aiosqlite.connect(path)
+    await db.executescript(INIT_SQL)
+    await db.execute(
+        "INSERT INTO jobs(created_at, scheduled_at, status, type, priority, max_attempts, repo_path, conn_name, owner, lease_owner) "
+        "VALUES (?,?,?,?,?,?,?,?,?,?)", (NOW, NOW, "running", "ingest_sharded", 2, 4, "/repo", "c", "team", "pod/0"))
+    await db.commit()
+    db.row_factory = aiosqlite.Row
+    row = await (await db.execute("SELECT * FROM jobs WHERE id=1")).fetchone()
+    db.row_factory = None
+    return db, row
+
+async def _children(db):
+    return {r[0]: r[1:] for r in await (await db.execute("SELECT id, type, status FROM jobs WHERE parent_id=1")).fetchall()}
+
+def test_plan_creates_shards_and_is_idempotent(tmp_path):
+    async def go():
+        db, row = await _db_with_parent(str(tmp_path / "q.db"))
+        assert await sharded.plan(db, row, [["a/x.sql"], ["b/y.sql", "b/z.py"]], None, "scan-1", NOW, "pod/0", NOW) == 2
+        kids = await _children(db)
+        assert sorted(kids.values()) == [("scan_reduce", "waiting"), ("scan_shard", "queued"), ("scan_shard", "queued")]
+        inherited = await (await db.execute("SELECT DISTINCT priority, max_attempts, conn_name, owner, flow_job_id FROM jobs WHERE parent_id=1")).fetchall()
+        assert inherited == [(2, 4, "c", "team", "scan-1")]
+        assert (await (await db.execute("SELECT status, lease_owner FROM jobs WHERE id=1")).fetchone()) == ("waiting", None)
+        # replanned after a crash: same children, original flow_job_id
+        await db.execute("UPDATE jobs SET status='running', lease_owner='pod/1' WHERE id=1"); await db.commit()
+        assert await sharded.plan(db, row, [["other.sql"]], None, "scan-2", NOW, "pod/1", NOW) == 2
+        assert len(await _children(db)) == 3
+        assert (await (await db.execute("SELECT flow_job_id FROM jobs WHERE id=1")).fetchone())[0] == "scan-1"
+        await db.close()
+    asyncio.run(go())
+
+def test_settle_queues_reduce_then_finishes_parent(tmp_path):
+    async def go():
+        db, row = await _db_with_parent(str(tmp_path / "q.db"))
+        await sharded.plan(db, row, [["a.sql"], ["b.sql"]], None, "scan-1", NOW, "pod/0", NOW)
+        await db.execute("UPDATE jobs SET status='done' WHERE id=2"); await db.commit()
+        assert await sharded.settle(db, 1, NOW) is None  # shard 3 still queued
+        await db.execute("UPDATE jobs SET status='done' WHERE id=3"); await db.commit()
+        await sharded.store_result(db, 2, 1, b"r2", NOW)
+        await sharded.store_result(db, 3, 1, b"r3", NOW)
+        assert await sharded.settle(db, 1, NOW) == "reduce_queued"
+        assert (await _children(db))[4] == ("scan_reduce", "queued")
+        assert await sharded.load_results(db, 1) == [b"r2", b"r3"]
+        await db.execute("UPDATE jobs SET status='done' WHERE id=4"); await db.commit()
+        assert await sharded.settle(db, 1, NOW) == "done"
+        assert (await (await db.execute("SELECT status FROM jobs WHERE id=1")).fetchone())[0] == "done"
+        assert (await (await db.execute("SELECT COUNT(1) FROM job_results")).fetchone())[0] == 0
+        await db.close()
+    asyncio.run(go())
+
+def test_failed_shard_fails_parent_and_cancels_the_rest(tmp_path):
+    async def go():
+        db, row = await _db_with_parent(str(tmp_path / "q.db"))
+        await sharded.plan(db, row, [["a.sql"], ["b.sql"], ["c.sql"]], None, "scan-1", NOW, "pod/0", NOW)
+        await db.execute("UPDATE jobs SET status='done' WHERE id=2")
+        await db.execute("UPDATE jobs SET status='error' WHERE id=3"); await db.commit()
+        assert await sharded.settle(db, 1, NOW) == "error"
+        kids = await _children(db)
+        assert kids[2][1] == "done" and kids[4][1] == "canceled" and kids[5] == ("scan_reduce", "canceled")
+        parent = await (await db.execute("SELECT status, error FROM jobs WHERE id=1")).fetchone()
+        assert parent[0] == "error" and "3" in parent[1]
+        await db.close()
+    asyncio.run(go())
+
+def test_stalled_parents_lists_only_families_nobody_will_settle(tmp_path):
+    async def go():
+        db, row = await _db_with_parent(str(tmp_path / "q.db"))
+        await sharded.plan(db, row, [["a.sql"], ["b.sql"]], None, "scan-1", NOW, "pod/0", NOW)
+        await db.execute("UPDATE jobs SET status='done' WHERE id=2"); await db.commit()
+        assert await sharded.stalled_parents(db) == []  # shard 3 still queued: its finish will settle
+        # the last shard finished, then its worker died before settle_parent
+        await db.execute("UPDATE jobs SET status='done' WHERE id=3"); await db.commit()
+        assert await sharded.stalled_parents(db) == [1]
+        assert await sharded.settle(db, 1, NOW) == "reduce_queued"
+        assert await sharded.stalled_parents(db) == []
+        await db.execute("UPDATE jobs SET status='done' WHERE id=4"); await db.commit()
+        assert await sharded.stalled_parents(db) == [1]
+        assert await sharded.settle(db, 1, NOW) == "done"
+        assert await sharded.stalled_parents(db) == []
+        await db.close()
+    asyncio.run(go())
+
+def test_parked_parent_is_not_counted_done_until_settled(tmp_path, monkeypatch):
+    async def go():
+        db, row = await _db_with_parent(str(tmp_path / "q.db"))
+        async def park(r):
+            return "waiting"
+        monkeypatch.setitem(worker.JOB_RUNNERS, "ingest_sharded", park)
+        done = worker.JOBS_DONE._value.get()
+        assert await worker.run_job(row) == "waiting"
+        assert worker.JOBS_DONE._value.get() == done
+        await sharded.plan(db, row, [["a.sql"]], None, "scan-1", NOW, "pod/0", NOW)
+        await db.execute("UPDATE jobs SET status='done' WHERE parent_id=1"); await db.commit()
+        assert await worker.settle_stalled(db) == 1  # settles straight to done: every child already is
+        assert (await (await db.execute("SELECT status FROM jobs WHERE id=1")).fetchone())[0] == "done"
+        assert worker.JOBS_DONE._value.get() == done + 1
+        await db.close()
+    asyncio.run(go())
@@ -0,0 +1,154 @@
+"""
+Job selection for the worker.
+
+`SCHEDULER=priority` (default) keeps the original order: highest priority,
+then lowest id. `SCHEDULER=fair` shares workers across (conn_name, owner)
+keys instead:
+
+- each key gets a weight (FAIR_SHARE_WEIGHTS, product of its conn and owner
+  weights) and the key with the lowest running/weight share goes next;
+- per-conn / per-owner concurrency caps (FAIR_SHARE_CAPS,
+  FAIR_SHARE_DEFAULT_CAP) are enforced against all `running` rows, so they
+  hold across worker pods;
+- within a key, priority ages by one point per PRIORITY_AGING_SECONDS of
+  waiting, so low-priority jobs eventually run.
+
+Every query is served by idx_jobs_fair / idx_jobs_fair_wait: queued keys
+are enumerated with a skip-scan (one index seek per key), so the work per
+decision is O(active keys), not O(queued jobs).
+"""
+import os, datetime
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+ISO_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+def parse_key_map(spec: str) -> Dict[Tuple[str, str], float]:
+    """Parse 'conn:bulk_pg=0.25,owner:search=4' into {('conn','bulk_pg'): 0.25, ...}."""
+    out: Dict[Tuple[str, str], float] = {}
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            key, val = part.rsplit("=", 1)
+            kind, name = key.split(":", 1)
+        except ValueError:
+            raise ValueError(f"bad fair-share entry {part!r}; expected conn:<name>=<n> or owner:<name>=<n>")
+        kind = kind.strip().lower()
+        if kind not in ("conn", "owner"):
+            raise ValueError(f"bad fair-share key kind {kind!r}; expected 'conn' or 'owner'")
+        out[(kind, name.strip())] = float(val)
+    return out
+
+@dataclass
+class FairShareConfig:
+    weights: Dict[Tuple[str, str], float] = field(default_factory=dict)
+    caps: Dict[Tuple[str, str], float] = field(default_factory=dict)
+    default_cap: int = 0              # 0 = uncapped
+    aging_seconds: float = 300.0      # seconds of waiting per +1 priority; 0 disables aging
+
+    @classmethod
+    def from_env(cls) -> "FairShareConfig":
+        return cls(
+            weights=parse_key_map(os.getenv("FAIR_SHARE_WEIGHTS", "")),
+            caps=parse_key_map(os.getenv("FAIR_SHARE_CAPS", "")),
+            default_cap=int(os.getenv("FAIR_SHARE_DEFAULT_CAP", "0")),
+            aging_seconds=float(os.getenv("PRIORITY_AGING_SECONDS", "300")),
+        )
+
+    def weight(self, conn: str, owner: str) -> float:
+        w = self.weights.get(("conn", conn), 1.0) * self.weights.get(("owner", owner), 1.0)
+        return max(w, 1e-6)
+
+    def cap(self, kind: str, name: str) -> int:
+        return int(self.caps.get((kind, name), self.default_cap))
+
+def _age_seconds(now: datetime.datetime, ts: str) -> float:
+    try:
+        return max(0.0, (now - datetime.datetime.strptime(ts, ISO_FMT)).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
+
+def effective_priority(priority: int, scheduled_at: str, now: datetime.datetime, aging_seconds: float) -> float:
+    if aging_seconds <= 0:
+        return float(priority or 0)
+    return (priority or 0) + _age_seconds(now, scheduled_at) / aging_seconds
+
+async def pick_priority(db, now: str) -> Optional[int]:
+    cur = await db.execute("SELECT id FROM jobs WHERE status='queued' AND scheduled_at <= ? ORDER BY priority DESC, id ASC LIMIT 1", (now,))
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+# Skip-scan over idx_jobs_fair: each step seeks the first queued row past the
+# previous (conn_name, owner). Split into separate seeks because NULL keys
+# don't compare with '>' and an OR would defeat the index range.
+QUEUED_KEYS_SQL = """
+WITH RECURSIVE k(id) AS (
+  SELECT (SELECT id FROM jobs INDEXED BY idx_jobs_fair WHERE status='queued' ORDER BY conn_name, owner LIMIT 1)
+  UNION ALL
+  SELECT COALESCE(
+    CASE WHEN p.owner IS NULL
+      THEN (SELECT id FROM jobs INDEXED BY idx_jobs_fair WHERE status='queued' AND conn_name IS p.conn_name
+            AND owner IS NOT NULL ORDER BY owner LIMIT 1)
+      ELSE (SELECT id FROM jobs INDEXED BY idx_jobs_fair WHERE status='queued' AND conn_name IS p.conn_name
+            AND owner > p.owner ORDER BY owner LIMIT 1) END,
+    CASE WHEN p.conn_name IS NULL
+      THEN (SELECT id FROM jobs INDEXED BY idx_jobs_fair WHERE status='queued' AND conn_name IS NOT NULL
+            ORDER BY conn_name, owner LIMIT 1)
+      ELSE (SELECT id FROM jobs INDEXED BY idx_jobs_fair WHERE status='queued' AND conn_name > p.conn_name
+            ORDER BY conn_name, owner LIMIT 1) END)
+  FROM k JOIN jobs p ON p.id = k.id
+)
+SELECT p.conn_name, p.owner FROM k JOIN jobs p ON p.id = k.id
+"""
+
+async def queued_keys(db):
+    """Distinct (conn_name, owner) of queued jobs, one index seek per key."""
+    cur = await db.execute(QUEUED_KEYS_SQL)
+    return await cur.fetchall()
+
+async def pick_fair_share(db, now: str, cfg: FairShareConfig) -> Optional[int]:
+    """Return the id of the next job under weighted fair share, or None.
+
+    Must run inside the caller's claim transaction so running counts and the
+    chosen row are consistent.
+    """
+    now_dt = datetime.datetime.strptime(now, ISO_FMT)
+    running_key: Dict[Tuple[str, str], int] = {}
+    running_conn: Dict[str, int] = {}
+    running_owner: Dict[str, int] = {}
+    cur = await db.execute("SELECT conn_name, owner, COUNT(1) FROM jobs WHERE status='running' GROUP BY conn_name, owner")
+    for conn, owner, n in await cur.fetchall():
+        conn, owner = conn or "", owner or ""
+        running_key[(conn, owner)] = n
+        running_conn[conn] = running_conn.get(conn, 0) + n
+        running_owner[owner] = running_owner.get(owner, 0) + n
+
+    keys = await queued_keys(db)
+
+    best = None  # (share, -effective_priority, id)
+    for conn, owner in keys:
+        c, o = conn or "", owner or ""
+        cap_c, cap_o = cfg.cap("conn", c), cfg.cap("owner", o)
+        if cap_c and running_conn.get(c, 0) >= cap_c:
+            continue
+        if cap_o and running_owner.get(o, 0) >= cap_o:
+            continue
+        # Head of line by priority, plus the job that has waited longest so aging can overtake it.
+        heads = []
+        for index, order in (("idx_jobs_fair", "priority DESC, id ASC"), ("idx_jobs_fair_wait", "scheduled_at ASC, id ASC")):
+            cur = await db.execute(
+                f"SELECT id, priority, scheduled_at FROM jobs INDEXED BY {index} WHERE status='queued' AND conn_name IS ? "
+                f"AND owner IS ? AND scheduled_at <= ? ORDER BY {order} LIMIT 1", (conn, owner, now))
+            row = await cur.fetchone()
+            if row:
+                heads.append((-effective_priority(row[1], row[2], now_dt, cfg.aging_seconds), row[0]))
+        if not heads:
+            continue
+        neg_eff, jid = min(heads)
+        share = (running_key.get((c, o), 0) + 1) / cfg.weight(c, o)
+        cand = (share, neg_eff, jid)
+        if best is None or cand < best:
+            best = cand
+    return best[2] if best else None
@@ -0,0 +1,121 @@
+"""
+Map-reduce repo scans on the jobs table.
+
+An `ingest_sharded` job (the parent) only plans: it lists the files a scan
+would read, splits them into shards (by directory or by file count, at most
+`max_files` each) and, in one transaction, inserts
+
+- one `scan_shard` child per shard (payload: its files and the commit to
+  check out), queued like any other job, and
+- one `scan_reduce` child in status `waiting`,
+
+then moves itself to `waiting`. Children carry `parent_id` and inherit the
+parent's repo, conn_name/owner (so fair-share keys and caps apply),
+priority and max_attempts.
+
+Shards run in parallel on any worker and store their results in
+`job_results`. A failed shard is retried on its own with the usual backoff.
+`settle(parent)` runs after every child finishes and moves the family
+along:
+
+- all shards done -> the reduce is queued; it merges the shard results and
+  ingests them under the parent's flow_job_id;
+- reduce done -> parent done, stored results deleted;
+- a shard or the reduce out of attempts (or canceled) -> the remaining
+  queued/waiting children are canceled, stored results deleted, and the
+  parent ends in `error`.
+
+Planning is idempotent: a replanned parent (reaped mid-plan) reuses the
+children it already has. A child's status update and the settle after it
+are separate transactions, so the reaper also re-settles `waiting` parents
+with no queued or running child (`stalled_parents`): a worker that died in
+between would otherwise leave the parent and the reduce waiting forever.
+"""
+import json
+from typing import List, Optional, Tuple
+
+async def plan(db, row, shards: List[List[str]], commit: Optional[str], flow_job_id: str, start: str,
+               lease_owner: str, now: str) -> int:
+    """Insert the children of parent `row` and park it in `waiting`; returns the number of shards."""
+    jid = row["id"]
+    await db.execute("BEGIN IMMEDIATE;")
+    try:
+        cur = await db.execute("SELECT lease_owner, status FROM jobs WHERE id=?", (jid,))
+        if tuple(await cur.fetchone()) != (lease_owner, "running"):
+            raise RuntimeError(f"lease on job {jid} lost while planning")
+        cur = await db.execute("SELECT COUNT(1), SUM(type='scan_shard'), MAX(flow_job_id) FROM jobs WHERE parent_id=?", (jid,))
+        n_children, n_shards, prev_flow = await cur.fetchone()
+        if n_children:
+            flow_job_id = prev_flow  # replanned after a crash: keep the children already there
+        else:
+            cols = ("created_at, scheduled_at, status, type, priority, max_attempts, repo_path, git_url, git_branch, "
+                    "conn_name, owner, flow_job_id, parent_id, payload")
+            insert = f"INSERT INTO jobs({cols}) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+            base = (row["priority"], row["max_attempts"], row["repo_path"], row["git_url"], row["git_branch"],
+                    row["conn_name"], row["owner"], flow_job_id, jid)
+            for i, files in enumerate(shards):
+                await db.execute(insert, (now, now, "queued", "scan_shard") + base +
+                                 (json.dumps({"shard": i, "files": files, "commit": commit}),))
+            await db.execute(insert, (now, now, "waiting" if shards else "queued", "scan_reduce") + base +
+                             (json.dumps({"shards": len(shards), "start": start}),))
+            n_shards = len(shards)
+        await db.execute("UPDATE jobs SET status='waiting', flow_job_id=?, lease_owner=NULL, lease_expires_at=NULL WHERE id=?",
+                         (flow_job_id, jid))
+        await db.execute("COMMIT;")
+        return n_shards or 0
+    except Exception:
+        await db.execute("ROLLBACK;")
+        raise
+
+async def store_result(db, jid: int, parent_id: int, blob: bytes, now: str) -> None:
+    # keyed by shard job: a retried or reclaimed shard overwrites its earlier result
+    await db.execute("INSERT OR REPLACE INTO job_results(job_id, parent_id, created_at, data) VALUES (?,?,?,?)",
+                     (jid, parent_id, now, blob))
+    await db.commit()
+
+async def load_results(db, parent_id: int) -> List[bytes]:
+    """Shard results in shard order; raises if a done shard has none."""
+    cur = await db.execute("SELECT j.id, r.data FROM jobs j LEFT JOIN job_results r ON r.job_id=j.id "
+                           "WHERE j.parent_id=? AND j.type='scan_shard' ORDER BY j.id", (parent_id,))
+    rows = await cur.fetchall()
+    missing = [jid for jid, data in rows if data is None]
+    if missing:
+        raise RuntimeError(f"no stored result for shard job(s) {missing}")
+    return [data for _, data in rows]
+
+async def stalled_parents(db) -> List[int]:
+    """Waiting parents none of whose children is queued or running: only a settle can move them on."""
+    cur = await db.execute("SELECT p.id FROM jobs p WHERE p.status='waiting' AND p.type='ingest_sharded' AND NOT EXISTS "
+                           "(SELECT 1 FROM jobs c WHERE c.parent_id=p.id AND c.status IN ('queued','running')) ORDER BY p.id")
+    return [r[0] for r in await cur.fetchall()]
+
+async def settle(db, parent_id: int, now: str) -> Optional[str]:
+    """Advance a sharded scan after one of its children finished; returns what changed, if anything."""
+    await db.execute("BEGIN IMMEDIATE;")
+    try:
+        cur = await db.execute("SELECT id, type, status FROM jobs WHERE parent_id=?", (parent_id,))
+        children: List[Tuple[int, str, str]] = await cur.fetchall()
+        shards = [(i, st) for i, t, st in children if t == "scan_shard"]
+        reduce = [(i, st) for i, t, st in children if t == "scan_reduce"]
+        failed = [i for i, t, st in children if st in ("error", "canceled")]
+        outcome = None
+        if failed:
+            await db.execute("UPDATE jobs SET status='canceled', finished_at=? WHERE parent_id=? AND status IN ('queued','waiting')",
+                             (now, parent_id))
+            cur = await db.execute("UPDATE jobs SET status='error', finished_at=?, error=? WHERE id=? AND status='waiting'",
+                                   (now, f"child job(s) failed: {failed}", parent_id))
+            await db.execute("DELETE FROM job_results WHERE parent_id=?", (parent_id,))
+            outcome = "error" if cur.rowcount else None
+        elif reduce and reduce[0][1] == "done":
+            cur = await db.execute("UPDATE jobs SET status='done', finished_at=?, error=NULL WHERE id=? AND status='waiting'",
+                                   (now, parent_id))
+            await db.execute("DELETE FROM job_results WHERE parent_id=?", (parent_id,))
+            outcome = "done" if cur.rowcount else None
+        elif reduce and reduce[0][1] == "waiting" and all(st == "done" for _, st in shards):
+            await db.execute("UPDATE jobs SET status='queued', scheduled_at=? WHERE id=? AND status='waiting'", (now, reduce[0][0]))
+            outcome = "reduce_queued"
+        await db.execute("COMMIT;")
+        return outcome
+    except Exception:
+        await db.execute("ROLLBACK;")
+        raise
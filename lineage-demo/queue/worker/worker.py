@@ -1,11 +1,13 @@
-import os, time, datetime, shutil, aiosqlite, asyncio, socket, logging, random
+import os, time, datetime, shutil, aiosqlite, asyncio, socket, logging, random, json, uuid
 from pathlib import Path
 from prometheus_client import Counter, Histogram, Gauge, start_http_server
 from logging_util import setup_json_logging
+from scheduler import FairShareConfig, pick_fair_share, pick_priority
+import sharded
 
 
 # Import scanner modules (installed in image)
-from lineage_scanner.scan import scan_path
+from lineage_scanner.scan import scan_path, list_scan_files, plan_shards, scan_files, merge_results, dump_parts, load_parts
 from lineage_scanner.config import load_connections
 from lineage_scanner.ingest_neo4j import ingest
 from neo4j import GraphDatabase
@@ -15,12 +17,20 @@ POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "3"))
 CHECKOUT_DIR = os.getenv("CHECKOUT_DIR", "/tmp/checkout")
 WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
 METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SCHEDULER = os.getenv("SCHEDULER", "priority")  # priority|fair
+FAIR_SHARE = FairShareConfig.from_env()
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "120"))
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", str(LEASE_SECONDS / 4)))
+REAP_INTERVAL = float(os.getenv("REAP_INTERVAL", "30"))
+SHARD_MAX_FILES = int(os.getenv("SHARD_MAX_FILES", "500"))  # default budget for ingest_sharded jobs
 
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://neo4j:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASS = os.getenv("NEO4J_PASS") or os.getenv("NEO4J_PASSWORD", "")
 
 HOSTNAME = socket.gethostname()
+WORKER_ID = f"{HOSTNAME}:{os.getpid()}"
 LOG = setup_json_logging("queue.worker")
 
 # Metrics
@@ -30,12 +40,20 @@ JOBS_FAILED = Counter("worker_jobs_failed_total", "Jobs failed")
 JOBS_REQUEUED = Counter("worker_jobs_requeued_total", "Jobs requeued for retry")
 JOB_DURATION = Histogram("worker_job_duration_seconds", "Job runtime seconds")
 QUEUE_DEPTH = Gauge("worker_queue_depth", "Queued jobs ready to run")
+LEASES_EXPIRED = Counter("worker_leases_expired_total", "Running jobs found with an expired lease")
+JOBS_RECLAIMED = Counter("worker_jobs_reclaimed_total", "Expired-lease jobs requeued for another worker")
+LEASES_LOST = Counter("worker_leases_lost_total", "Heartbeats or completions that found the lease gone")
+SHARDS_PLANNED = Counter("worker_scan_shards_planned_total", "scan_shard jobs created by ingest_sharded planning")
 
 def now_iso():
     return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def flow_job_id():
-    return f"scan-{now_iso()}"
+def iso_in(seconds: float):
+    return (datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def flow_job_id(jid):
+    # Unique per run, not just per second: the API counts FlowRuns as its graph version
+    return f"scan-{now_iso()}-{jid}-{uuid.uuid4().hex[:8]}"
 
 def clean_dir(p):
     try: shutil.rmtree(p, ignore_errors=True)
@@ -47,19 +65,22 @@ def backoff_seconds(attempts: int, base: float=15.0, cap: float=3600.0):
     jitter = exp * (0.2 * (random.random()-0.5) * 2)  # +/-20%
     return min(cap, max(base, exp + jitter))
 
-async def fetch_and_lock_job(db):
-    # Atomically claim one job using an IMMEDIATE transaction
-    await db.execute("PRAGMA journal_mode=WAL;")
+async def fetch_and_lock_job(db, lease_owner: str = WORKER_ID):
+    # Atomically claim one job using an IMMEDIATE transaction; the claim carries a lease
+    # that heartbeats must renew, otherwise reap_expired_leases hands the job to someone else
+    await db.execute(f"PRAGMA journal_mode={JOURNAL_MODE};")
     await db.execute("BEGIN IMMEDIATE;")
     try:
         now = now_iso()
-        cur = await db.execute("SELECT id FROM jobs WHERE status='queued' AND scheduled_at <= ? ORDER BY priority DESC, id ASC LIMIT 1", (now,))
-        row = await cur.fetchone()
-        if not row:
+        if SCHEDULER == "fair":
+            jid = await pick_fair_share(db, now, FAIR_SHARE)
+        else:
+            jid = await pick_priority(db, now)
+        if jid is None:
             await db.execute("COMMIT;")
             return None
-        jid = row[0]
-        await db.execute("UPDATE jobs SET status='running', started_at=? WHERE id=? AND status='queued'", (now, jid))
+        await db.execute("UPDATE jobs SET status='running', started_at=?, lease_owner=?, lease_expires_at=?, heartbeat_at=? "
+                         "WHERE id=? AND status='queued'", (now, lease_owner, iso_in(LEASE_SECONDS), now, jid))
         await db.execute("COMMIT;")
         db.row_factory = aiosqlite.Row
         cur2 = await db.execute("SELECT * FROM jobs WHERE id=?", (jid,))
@@ -68,64 +89,212 @@ async def fetch_and_lock_job(db):
         await db.execute("ROLLBACK;")
         raise
 
+async def heartbeat(db, jid: int, lease_owner: str):
+    # Renew the lease until cancelled; stop if the job was reaped or canceled under us
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        cur = await db.execute("UPDATE jobs SET lease_expires_at=?, heartbeat_at=? WHERE id=? AND lease_owner=? AND status='running'",
+                               (iso_in(LEASE_SECONDS), now_iso(), jid, lease_owner))
+        await db.commit()
+        if cur.rowcount == 0:
+            LEASES_LOST.inc()
+            LOG.warning({"event":"lease_lost","job_id":jid,"lease_owner":lease_owner})
+            return
+
+async def reap_expired_leases(db):
+    # Requeue running jobs whose lease ran out (crashed pod, rolling deploy). Counts as an attempt,
+    # so a job that keeps killing its worker still ends in status=error. Rows claimed before leases
+    # existed have no lease_expires_at and are reaped once started_at is older than one lease.
+    now = now_iso()
+    stale = iso_in(-LEASE_SECONDS)
+    await db.execute("BEGIN IMMEDIATE;")
+    try:
+        cur = await db.execute(
+            "SELECT id, attempts, max_attempts, lease_owner, parent_id FROM jobs WHERE status='running' "
+            "AND (lease_expires_at < ? OR (lease_expires_at IS NULL AND started_at < ?))", (now, stale))
+        rows = await cur.fetchall()
+        failed_parents = set()
+        for jid, attempts, max_attempts, owner, parent_id in rows:
+            LEASES_EXPIRED.inc()
+            attempts = (attempts or 0) + 1
+            err = f"lease expired (held by {owner or 'unknown'})"
+            if attempts < (max_attempts or 3):
+                next_time = iso_in(backoff_seconds(attempts))
+                await db.execute("UPDATE jobs SET status='queued', attempts=?, scheduled_at=?, error=?, reclaims=reclaims+1, "
+                                 "lease_owner=NULL, lease_expires_at=NULL WHERE id=?", (attempts, next_time, err, jid))
+                JOBS_RECLAIMED.inc()
+                LOG.warning({"event":"lease_reclaim","job_id":jid,"lease_owner":owner,"attempts":attempts,"next_run":next_time})
+            else:
+                await db.execute("UPDATE jobs SET status='error', finished_at=?, attempts=?, error=?, "
+                                 "lease_owner=NULL, lease_expires_at=NULL WHERE id=?", (now, attempts, err, jid))
+                JOBS_FAILED.inc()
+                LOG.warning({"event":"lease_expired_final","job_id":jid,"lease_owner":owner,"attempts":attempts})
+                if parent_id:
+                    failed_parents.add(parent_id)
+        await db.execute("COMMIT;")
+    except Exception:
+        await db.execute("ROLLBACK;")
+        raise
+    for parent_id in failed_parents:
+        await settle_parent(db, parent_id)
+    return len(rows)
+
+async def settle_stalled(db):
+    # A worker that died between a child's status update and settle_parent leaves its parent waiting
+    parents = await sharded.stalled_parents(db)
+    for parent_id in parents:
+        await settle_parent(db, parent_id)
+    return len(parents)
+
+async def reaper_loop():
+    async with aiosqlite.connect(DB_PATH) as db:
+        while True:
+            await asyncio.sleep(REAP_INTERVAL * (0.5 + random.random()))  # jitter so replicas don't collide
+            try:
+                await reap_expired_leases(db)
+                await settle_stalled(db)
+            except Exception as e:
+                LOG.error({"event":"reaper_error","error":str(e)})
+
 async def queue_depth(db):
     cur = await db.execute("SELECT COUNT(1) FROM jobs WHERE status='queued' AND scheduled_at <= ?", (now_iso(),))
     n = (await cur.fetchone())[0]
     QUEUE_DEPTH.set(n)
 
-async def run_job(row):
+def checkout(row, jid, commit=None):
+    """Directory to scan: repo_path, or a fresh clone of git_url (at `commit` if given). Returns (dir, commit, cloned)."""
+    if not row["git_url"]:
+        return row["repo_path"], None, False
+    from git import Repo
+    code_dir = os.path.join(CHECKOUT_DIR, f"job-{jid}")
+    clean_dir(code_dir)
+    LOG.info({"event":"git_clone","job_id":jid,"url":row["git_url"],"branch":row["git_branch"],"commit":commit})
+    repo = Repo.clone_from(row["git_url"], code_dir, branch=row["git_branch"] if row["git_branch"] else None)
+    if commit:
+        repo.git.checkout(commit)  # every shard scans the commit the plan listed
+    return code_dir, repo.head.commit.hexsha, True
+
+def ingest_results(jid, results, job_id, start):
+    LOG.info({"event":"ingest_start","job_id":jid,"neo4j_uri":NEO4J_URI,"flow_job_id":job_id})
+    drv = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+    with drv as driver:
+        ingest(driver, results['feeds'], results['pdes'], results['flows'], job_id, start)
+
+# Clone, scan and ingest are blocking (git, file IO, the sync Neo4j driver) and run in threads,
+# so the event loop stays free for heartbeat() and a long job keeps its lease.
+
+async def run_ingest(row):
     jid = row["id"]
-    t0 = time.time()
-    JOBS_STARTED.inc()
-    repo_path = row["repo_path"]
-    git_url = row["git_url"]
-    branch = row["git_branch"]
     conn_name = row["conn_name"] or "demo_pg"
-    owner = row["owner"] or ""
     start = now_iso()
+    code_dir, _, cloned = await asyncio.to_thread(checkout, row, jid)
+    LOG.info({"event":"scan_start","job_id":jid,"path":code_dir,"conn":conn_name})
+    results = await asyncio.to_thread(scan_path, code_dir, conn_name, system="postgres", owner=row["owner"] or "")
+    await asyncio.to_thread(ingest_results, jid, results, flow_job_id(jid), start)
+    if cloned:
+        await asyncio.to_thread(clean_dir, code_dir)
 
-    # Prepare code dir
-    code_dir = None
-    if git_url:
-        from git import Repo
-        code_dir = os.path.join(CHECKOUT_DIR, f"job-{jid}")
-        clean_dir(code_dir)
-        LOG.info({"event":"git_clone","job_id":jid,"url":git_url,"branch":branch})
-        Repo.clone_from(git_url, code_dir, branch=branch if branch else None)
-    else:
-        code_dir = repo_path
+async def run_plan(row):
+    # ingest_sharded: split the file list into scan_shard children plus a waiting scan_reduce
+    jid = row["id"]
+    opts = json.loads(row["payload"] or "{}")
+    code_dir, commit, cloned = await asyncio.to_thread(checkout, row, jid)
+    try:
+        files = await asyncio.to_thread(list_scan_files, code_dir)
+    finally:
+        if cloned:
+            await asyncio.to_thread(clean_dir, code_dir)
+    shards = plan_shards(files, int(opts.get("max_files") or SHARD_MAX_FILES), opts.get("by", "dir"))
+    async with aiosqlite.connect(DB_PATH) as db:
+        now = now_iso()
+        n = await sharded.plan(db, row, shards, commit, flow_job_id(jid), now, row["lease_owner"], now)
+    SHARDS_PLANNED.inc(n)
+    LOG.info({"event":"scan_planned","job_id":jid,"files":len(files),"shards":n,"commit":commit})
+    return "waiting"
 
-    LOG.info({"event":"scan_start","job_id":jid,"path":code_dir,"conn":conn_name})
-    results = scan_path(code_dir, conn_name, system="postgres", owner=owner)
+async def run_shard(row):
+    jid = row["id"]
+    spec = json.loads(row["payload"])
+    code_dir, _, cloned = await asyncio.to_thread(checkout, row, jid, spec.get("commit"))
+    try:
+        LOG.info({"event":"shard_scan_start","job_id":jid,"parent_id":row["parent_id"],"shard":spec["shard"],"files":len(spec["files"])})
+        parts = await asyncio.to_thread(scan_files, code_dir, spec["files"], row["conn_name"] or "demo_pg", "postgres", row["owner"] or "")
+    finally:
+        if cloned:
+            await asyncio.to_thread(clean_dir, code_dir)
+    blob = await asyncio.to_thread(dump_parts, parts)
+    async with aiosqlite.connect(DB_PATH) as db:
+        await sharded.store_result(db, jid, row["parent_id"], blob, now_iso())
 
-    LOG.info({"event":"ingest_start","job_id":jid,"neo4j_uri":NEO4J_URI})
-    drv = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
-    with drv as driver:
-        ingest(driver, results['feeds'], results['pdes'], results['flows'], flow_job_id(), start)
+async def run_reduce(row):
+    jid = row["id"]
+    spec = json.loads(row["payload"])
+    async with aiosqlite.connect(DB_PATH) as db:
+        blobs = await sharded.load_results(db, row["parent_id"])
+    results = await asyncio.to_thread(lambda: merge_results([load_parts(b) for b in blobs]))
+    await asyncio.to_thread(ingest_results, jid, results, row["flow_job_id"], spec.get("start") or now_iso())
 
-    if git_url:
-        clean_dir(code_dir)
+JOB_RUNNERS = {"ingest": run_ingest, "ingest_sharded": run_plan, "scan_shard": run_shard, "scan_reduce": run_reduce}
 
+async def run_job(row):
+    # Returns None when the job is done, or "waiting" when it parked itself (ingest_sharded)
+    jid = row["id"]
+    t0 = time.time()
+    JOBS_STARTED.inc()
+    runner = JOB_RUNNERS.get(row["type"])
+    if runner is None:
+        raise ValueError(f"unknown job type {row['type']!r}")
+    outcome = await runner(row)
     dur = time.time() - t0
-    JOBS_DONE.inc()
+    if outcome != "waiting":  # a parked parent counts as done when settle_parent finishes it
+        JOBS_DONE.inc()
     JOB_DURATION.observe(dur)
-    LOG.info({"event":"job_done","job_id":jid,"duration_sec":round(dur,3)})
+    LOG.info({"event":"job_" + (outcome or "done"),"job_id":jid,"type":row["type"],"duration_sec":round(dur,3)})
+    return outcome
+
+async def settle_parent(db, parent_id: int):
+    try:
+        outcome = await sharded.settle(db, parent_id, now_iso())
+        if outcome == "done":
+            JOBS_DONE.inc()  # the parent itself, parked since planning
+        if outcome:
+            LOG.info({"event":"sharded_scan_" + outcome,"job_id":parent_id})
+    except Exception as e:
+        LOG.error({"event":"settle_error","job_id":parent_id,"error":str(e)})
+
+async def finish_job(db, sql: str, args: tuple, jid: int, lease_owner: str):
+    # Completion is fenced on the lease: if the job was reaped and handed to another worker, leave it alone
+    cur = await db.execute(sql + " WHERE id=? AND lease_owner=?", args + (jid, lease_owner))
+    await db.commit()
+    if cur.rowcount == 0:
+        LEASES_LOST.inc()
+        LOG.warning({"event":"lease_lost_on_finish","job_id":jid,"lease_owner":lease_owner})
+    return cur.rowcount
 
 async def worker_loop(idx: int):
-    LOG.info({"event":"worker_start","index":idx,"host":HOSTNAME,"db":DB_PATH})
+    lease_owner = f"{WORKER_ID}/{idx}"
+    LOG.info({"event":"worker_start","index":idx,"host":HOSTNAME,"db":DB_PATH,"lease_owner":lease_owner})
     async with aiosqlite.connect(DB_PATH) as db:
         while True:
             try:
                 await queue_depth(db)
-                row = await fetch_and_lock_job(db)
+                row = await fetch_and_lock_job(db, lease_owner)
                 if not row:
                     await asyncio.sleep(POLL_INTERVAL); continue
                 jid = row["id"]
+                hb = asyncio.create_task(heartbeat(db, jid, lease_owner))
                 try:
-                    await run_job(row)
-                    end = now_iso()
-                    await db.execute("UPDATE jobs SET status='done', finished_at=?, error=NULL WHERE id=?", (end, jid))
-                    await db.commit()
+                    try:
+                        outcome = await run_job(row)
+                    finally:
+                        hb.cancel()
+                        await asyncio.gather(hb, return_exceptions=True)
+                    if outcome != "waiting":  # a parked job already released its lease
+                        end = now_iso()
+                        await finish_job(db, "UPDATE jobs SET status='done', finished_at=?, error=NULL, lease_owner=NULL, lease_expires_at=NULL",
+                                         (end,), jid, lease_owner)
+                        if row["parent_id"]:
+                            await settle_parent(db, row["parent_id"])
                 except Exception as e:
                     LOG.error({"event":"job_error","job_id":jid,"error":str(e)})
                     # retry logic
@@ -134,17 +303,17 @@ async def worker_loop(idx: int):
                     if attempts < max_attempts:
                         delay = backoff_seconds(attempts)
                         next_time = (datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)).strftime("%Y-%m-%dT%H:%M:%SZ")
-                        await db.execute("UPDATE jobs SET status='queued', attempts=?, scheduled_at=?, error=? WHERE id=?",
-                                         (attempts, next_time, str(e), jid))
-                        await db.commit()
+                        await finish_job(db, "UPDATE jobs SET status='queued', attempts=?, scheduled_at=?, error=?, lease_owner=NULL, lease_expires_at=NULL",
+                                         (attempts, next_time, str(e)), jid, lease_owner)
                         JOBS_REQUEUED.inc()
                         LOG.info({"event":"job_requeue","job_id":jid,"attempts":attempts,"next_run":next_time})
                     else:
                         end = now_iso()
-                        await db.execute("UPDATE jobs SET status='error', finished_at=?, attempts=?, error=? WHERE id=?",
-                                         (end, attempts, str(e), jid))
-                        await db.commit()
+                        await finish_job(db, "UPDATE jobs SET status='error', finished_at=?, attempts=?, error=?, lease_owner=NULL, lease_expires_at=NULL",
+                                         (end, attempts, str(e)), jid, lease_owner)
                         JOBS_FAILED.inc()
+                        if row["parent_id"]:
+                            await settle_parent(db, row["parent_id"])
                 # loop
             except Exception as e:
                 LOG.error({"event":"worker_loop_error","error":str(e)})
@@ -153,6 +322,7 @@ async def worker_loop(idx: int):
 async def main():
     start_http_server(METRICS_PORT)
     tasks = [asyncio.create_task(worker_loop(i)) for i in range(WORKER_CONCURRENCY)]
+    tasks.append(asyncio.create_task(reaper_loop()))
     await asyncio.gather(*tasks)
 
 if __name__ == "__main__":
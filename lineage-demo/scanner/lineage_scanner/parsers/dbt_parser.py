@@ -13,11 +13,12 @@ def scan_dbt_project(root: str, conn_name: str, system: str, owner: str=""):
     for dirpath, _, files in os.walk(models_dir):
         for fn in files:
             if not fn.endswith(".sql"): continue
-            path = os.path.join(dirpath, fn)
-            raw = read_text(path)
-            rendered = env.from_string(raw).render()
-            parsed = parse_sql(rendered, conn_name, system, owner)
+            parsed = scan_dbt_model(os.path.join(dirpath, fn), conn_name, system, owner, env)
             results["feeds"].update(parsed["feeds"])
             results["pdes"].update(parsed["pdes"])
             results["flows"].extend(parsed["flows"])
     return results
+
+def scan_dbt_model(path: str, conn_name: str, system: str, owner: str="", env: Environment=None):
+    rendered = (env or Environment()).from_string(read_text(path)).render()
+    return parse_sql(rendered, conn_name, system, owner)
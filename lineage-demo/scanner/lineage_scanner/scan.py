@@ -1,7 +1,12 @@
-import os
+import os, json, posixpath, zlib
+from itertools import groupby
+from typing import Dict, List
+from jinja2 import Environment
+from .models import PDE, Feed
+from .utils import read_text
 from .parsers.sql_parser import parse_sql
-from .parsers.dbt_parser import scan_dbt_project
-from .parsers.airflow_parser import scan_airflow
+from .parsers.dbt_parser import scan_dbt_project, scan_dbt_model
+from .parsers.airflow_parser import scan_airflow, scan_airflow_file
 
 def scan_path(root: str, conn_name: str, system: str, owner: str=""):
     results = {"feeds":{}, "pdes":{}, "flows":[]}
@@ -27,3 +32,88 @@ def scan_path(root: str, conn_name: str, system: str, owner: str=""):
         results["flows"].extend(parsed["flows"])
 
     return results
+
+# ---- sharded scans ----
+# scan_path in pieces: list the files, split them into shards, scan each shard
+# anywhere with scan_files, then merge_results. Each shard keeps the three
+# passes of scan_path apart, so the merge can apply them in scan_path's order
+# (all plain SQL, then dbt models, then Airflow DAGs).
+PASSES = ("sql", "dbt", "airflow")
+
+def list_scan_files(root: str) -> List[str]:
+    """Paths (relative to root, '/'-separated, sorted) of every file scan_path reads."""
+    out = []
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            if fn.endswith((".sql", ".py")):
+                out.append(os.path.relpath(os.path.join(dirpath, fn), root).replace(os.sep, "/"))
+    return sorted(out)
+
+def plan_shards(files: List[str], max_files: int, by: str = "dir") -> List[List[str]]:
+    """Split files into shards of at most max_files.
+
+    by="files" cuts the sorted list every max_files; by="dir" keeps each
+    directory's files together, packing neighbouring directories into one
+    shard and splitting only directories larger than the budget.
+    """
+    files = sorted(files)
+    max_files = max(1, max_files)
+    if by == "files":
+        return [files[i:i + max_files] for i in range(0, len(files), max_files)]
+    if by != "dir":
+        raise ValueError(f"unknown shard mode {by!r}; expected 'dir' or 'files'")
+    shards, cur = [], []
+    for _, group in groupby(files, key=posixpath.dirname):
+        group = list(group)
+        if cur and len(cur) + len(group) > max_files:
+            shards.append(cur); cur = []
+        while len(group) > max_files:
+            shards.append(group[:max_files]); group = group[max_files:]
+        cur += group
+    if cur:
+        shards.append(cur)
+    return shards
+
+def _empty():
+    return {"feeds":{}, "pdes":{}, "flows":[]}
+
+def _add(results, parsed):
+    results["feeds"].update(parsed["feeds"])
+    results["pdes"].update(parsed["pdes"])
+    results["flows"].extend(parsed["flows"])
+
+def scan_files(root: str, files: List[str], conn_name: str, system: str, owner: str="") -> Dict[str, dict]:
+    """Scan only `files` (from list_scan_files) under root; results per pass of scan_path."""
+    parts = {p: _empty() for p in PASSES}
+    env = Environment()
+    for rel in files:
+        path = os.path.join(root, *rel.split("/"))
+        if rel.endswith(".sql"):
+            _add(parts["sql"], parse_sql(read_text(path), conn_name, system, owner))
+            if rel.startswith("models/"):
+                _add(parts["dbt"], scan_dbt_model(path, conn_name, system, owner, env))
+        elif rel.endswith(".py"):
+            for dialect, sql, task in scan_airflow_file(path):
+                _add(parts["airflow"], parse_sql(sql, conn_name, dialect, owner))
+    return parts
+
+def merge_results(shard_parts: List[Dict[str, dict]]) -> dict:
+    """Combine scan_files outputs (in shard order) into one scan_path-shaped result."""
+    results = _empty()
+    for p in PASSES:
+        for parts in shard_parts:
+            _add(results, parts[p])
+    return results
+
+def dump_parts(parts: Dict[str, dict]) -> bytes:
+    """scan_files output -> compressed JSON, for handing between workers."""
+    doc = {p: {"feeds": [f.__dict__ for f in r["feeds"].values()],
+               "pdes": [x.__dict__ for x in r["pdes"].values()],
+               "flows": [list(fl) for fl in r["flows"]]} for p, r in parts.items()}
+    return zlib.compress(json.dumps(doc).encode())
+
+def load_parts(blob: bytes) -> Dict[str, dict]:
+    doc = json.loads(zlib.decompress(blob))
+    return {p: {"feeds": {f["key"]: Feed(**f) for f in r["feeds"]},
+                "pdes": {x["key"]: PDE(**x) for x in r["pdes"]},
+                "flows": [tuple(fl) for fl in r["flows"]]} for p, r in doc.items()}
@@ -93,15 +93,50 @@ function baseStyle(){
   ];
 }
 
-// Fetch and add to cy
-async function loadGraph(cy, api, mode, key, hops){
+// Decode a format=compact (compact-v1) response into Cytoscape {nodes, edges}
+function decodeCompact(payload){
+  const S = payload.strings;
+  const val = (c, i) => {
+    const v = c.values[i];
+    return (c.kind === 's' && v !== null && v !== undefined) ? S[v] : v;
+  };
+  const N = payload.nodes, E = payload.edges;
+  const nodes = new Array(N.id.length);
+  for (let i = 0; i < nodes.length; i++){
+    const type = S[N.type[i]];
+    const data = { id: S[N.id[i]], label: type, type };
+    for (const c of N.props){
+      const v = val(c, i);
+      if (v !== null && v !== undefined) data[S[c.name]] = v;
+    }
+    nodes[i] = { data };
+    if (N.x && N.x[i] !== null && N.x[i] !== undefined) nodes[i].position = { x: N.x[i], y: N.y[i] };
+  }
+  const edges = new Array(E.src.length);
+  for (let i = 0; i < edges.length; i++){
+    const source = nodes[E.src[i]].data.id, target = nodes[E.dst[i]].data.id, label = S[E.label[i]];
+    const data = { id: `${source}-${label}-${target}`, source, target, label };
+    for (const c of E.props){
+      const v = val(c, i);
+      if (v !== null && v !== undefined) data[S[c.name]] = v;
+    }
+    edges[i] = { data };
+  }
+  return { nodes, edges };
+}
+
+// Fetch and add to cy (compact wire format; the browser negotiates br/gzip).
+// opts.layout = 'layered' asks the API for precomputed positions; run a 'preset' layout afterwards.
+async function loadGraph(cy, api, mode, key, hops, opts){
   const url = new URL(`${api}/lineage`);
   if (mode === 'pde') url.searchParams.set('pde_key', key);
   else url.searchParams.set('site_key', key);
   url.searchParams.set('max_hops', String(hops));
+  url.searchParams.set('format', 'compact');
+  if (opts && opts.layout) url.searchParams.set('layout', opts.layout);
   const res = await fetch(url.toString());
   if (!res.ok) throw new Error(`API ${res.status}`);
-  const data = await res.json();
+  const data = decodeCompact(await res.json());
   cy.elements().remove();
   cy.add(data.nodes);
   cy.add(data.edges);